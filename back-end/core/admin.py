@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Animal, Booking
+from .models import User, Animal, Booking, PricingRule
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -18,3 +18,9 @@ class BookingAdmin(admin.ModelAdmin):
     list_display = ('animal', 'sitter', 'start_date', 'end_date', 'status')
     list_filter = ('status', 'start_date', 'end_date')
     search_fields = ('animal__name', 'sitter__name')
+
+@admin.register(PricingRule)
+class PricingRuleAdmin(admin.ModelAdmin):
+    list_display = ('rule_type', 'provider', 'animal_type', 'start_date', 'end_date', 'percent')
+    list_filter = ('rule_type', 'animal_type')
+    search_fields = ('provider__name',)
@@ -0,0 +1,152 @@
+from datetime import timedelta
+
+from django.db.models import CharField, Exists, F, IntegerField, OuterRef, Value
+
+from .models import Booking, CompanyBooking, CompanyBookingSeries
+
+
+def merge_intervals(intervals):
+    """
+    Merges (start_date, end_date) intervals sorted by start date.
+    Overlapping or back-to-back intervals (next one starting the day after) are fused.
+    """
+    merged = []
+    for start_date, end_date in intervals:
+        if merged and start_date <= merged[-1][1] + timedelta(days=1):
+            if end_date > merged[-1][1]:
+                merged[-1][1] = end_date
+        else:
+            merged.append([start_date, end_date])
+    return [(start_date, end_date) for start_date, end_date in merged]
+
+
+def free_intervals(busy, date_from, date_to):
+    """
+    Returns the gaps between merged busy intervals inside [date_from, date_to].
+    """
+    free = []
+    cursor = date_from
+    for start_date, end_date in busy:
+        if start_date > cursor:
+            free.append((cursor, start_date - timedelta(days=1)))
+        cursor = max(cursor, end_date + timedelta(days=1))
+    if cursor <= date_to:
+        free.append((cursor, date_to))
+    return free
+
+
+def occurrence_dates(start_date, end_date, interval_weeks, date_from=None, date_to=None):
+    """
+    Lazily yields the occurrences of a weekly recurrence (first occurrence start_date, every
+    interval_weeks weeks, until end_date included) that fall inside [date_from, date_to].
+    The first yielded date is computed directly, earlier occurrences are never walked.
+    """
+    step = timedelta(days=7 * interval_weeks)
+    day = start_date
+    if date_from and date_from > start_date:
+        # Number of steps needed to reach date_from, rounded up
+        day = start_date + step * -(-(date_from - start_date).days // step.days)
+    last = min(end_date, date_to) if date_to else end_date
+    while day <= last:
+        yield day
+        day += step
+
+
+def sitter_calendar(sitter_id, date_from, date_to):
+    """
+    Computes the busy and free date ranges of a pet sitter between two dates (included).
+    Busy ranges come from the active bookings of the sitter, read in one range query.
+    """
+    bookings = Booking.objects.filter(
+        sitter_id=sitter_id,
+        status__in=Booking.ACTIVE_STATUSES,
+        # Date overlap criteria: (start1 <= end2) AND (end1 >= start2)
+        start_date__lte=date_to,
+        end_date__gte=date_from
+    ).order_by('start_date').values_list('start_date', 'end_date')
+
+    busy = merge_intervals(
+        (max(start_date, date_from), min(end_date, date_to)) for start_date, end_date in bookings
+    )
+    return busy, free_intervals(busy, date_from, date_to)
+
+
+def free_sitters(sitters, start_date, end_date):
+    """
+    Filters a pet sitter queryset down to the sitters without any active booking
+    overlapping [start_date, end_date], with a single NOT EXISTS subquery.
+    """
+    overlapping = Booking.objects.filter(
+        sitter=OuterRef('pk'),
+        status__in=Booking.ACTIVE_STATUSES,
+        # Same overlap rule as the booking creation: (start1 <= end2) AND (end1 >= start2)
+        start_date__lte=end_date,
+        end_date__gte=start_date
+    )
+    return sitters.filter(~Exists(overlapping))
+
+
+def active_animal_bookings(animal_ids, start_date, end_date):
+    """
+    Returns what blocks several animals between start_date and end_date, as
+    (kind, id, animal_id, start_date, end_date) rows where kind is 'bookings',
+    'company_bookings' or 'series':
+    - active bookings with pet sitters and with companies overlapping the dates,
+    - one row per occurrence of the active recurring series falling in the dates.
+    The three tables are read in a single UNION ALL query, each side served by its
+    (animal, status, start_date, end_date) index; series are expanded afterwards.
+    """
+    bookings = Booking.objects.filter(
+        animal_id__in=animal_ids,
+        status__in=Booking.ACTIVE_STATUSES,
+        # Date overlap criteria: (start1 <= end2) AND (end1 >= start2)
+        start_date__lte=end_date,
+        end_date__gte=start_date
+    ).annotate(
+        kind=Value('bookings', output_field=CharField()),
+        interval=Value(0, output_field=IntegerField())
+    )
+    company_bookings = CompanyBooking.objects.filter(
+        animal_id__in=animal_ids,
+        status__in=CompanyBooking.ACTIVE_STATUSES,
+        start_date__lte=end_date,
+        end_date__gte=start_date
+    ).annotate(
+        kind=Value('company_bookings', output_field=CharField()),
+        interval=Value(0, output_field=IntegerField())
+    )
+    series = CompanyBookingSeries.objects.filter(
+        animal_id__in=animal_ids,
+        status='active',
+        start_date__lte=end_date,
+        end_date__gte=start_date
+    ).annotate(
+        kind=Value('series', output_field=CharField()),
+        interval=F('interval_weeks')
+    )
+
+    columns = ('kind', 'id', 'animal_id', 'start_date', 'end_date', 'interval')
+    rows = bookings.values_list(*columns).union(
+        company_bookings.values_list(*columns), series.values_list(*columns), all=True
+    )
+
+    blocking = []
+    for kind, row_id, animal_id, row_start, row_end, interval in rows:
+        if kind != 'series':
+            blocking.append((kind, row_id, animal_id, row_start, row_end))
+            continue
+        for day in occurrence_dates(row_start, row_end, interval, start_date, end_date):
+            blocking.append((kind, row_id, animal_id, day, day))
+    return blocking
+
+
+def animal_conflicts(animal_id, start_date, end_date):
+    """
+    Returns what blocks an animal between start_date and end_date as
+    {'bookings': [ids], 'company_bookings': [ids], 'series': [ids]}, in one query.
+    """
+    conflicts = {'bookings': [], 'company_bookings': [], 'series': []}
+    for kind, row_id, _, _, _ in active_animal_bookings([animal_id], start_date, end_date):
+        if row_id not in conflicts[kind]:
+            conflicts[kind].append(row_id)
+    return conflicts
@@ -0,0 +1,166 @@
+"""
+Creation of a batch of bookings (pet sitters and companies) in one request.
+
+Whatever the size of the batch, validation costs a constant number of queries: the
+animals (locked), the providers and the existing overlapping bookings are each read
+once, then every item is checked in memory, including against the previous items.
+"""
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from .availability import active_animal_bookings
+from .caching import AVAILABILITY_SCOPE, invalidate
+from .conditional import model_scope, user_scope
+from .models import Animal, Booking, CompanyBooking, User
+from .notifications import enqueue, send_batch_booking_emails
+from .pricing import set_booking_totals
+
+MAX_BULK_ITEMS = 100
+
+
+def parse_item_date(value):
+    """
+    Parses a YYYY-MM-DD date of an item, raises ValueError if it is invalid.
+    """
+    try:
+        parsed = parse_date(value) if isinstance(value, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'Invalid date "{value}", expected format YYYY-MM-DD')
+    return parsed
+
+
+def parse_item(item):
+    """
+    Validates the shape of one item. Returns (animal_id, kind, provider_id, start_date, end_date).
+    Raises ValueError with the message returned to the client.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Each item must be an object')
+    if not item.get('animal'):
+        raise ValueError('Please specify an animal for the booking')
+    if bool(item.get('sitter')) == bool(item.get('company')):
+        raise ValueError('Specify either a sitter or a company')
+    if not item.get('start_date') or not item.get('end_date'):
+        raise ValueError('Start and end dates are required')
+    start_date = parse_item_date(item['start_date'])
+    end_date = parse_item_date(item['end_date'])
+    if start_date > end_date:
+        raise ValueError('The start date must be before the end date')
+    try:
+        animal_id = int(item['animal'])
+        if item.get('sitter'):
+            return animal_id, 'bookings', int(item['sitter']), start_date, end_date
+        return animal_id, 'company_bookings', int(item['company']), start_date, end_date
+    except (TypeError, ValueError):
+        raise ValueError('Animal, sitter and company must be ids')
+
+
+def create_bookings(user, items):
+    """
+    Validates and creates a batch of bookings in one transaction. Valid items are created
+    even if others fail. Returns one result per item, in the same order:
+    {'index', 'status': 'created', 'type', 'id'} or {'index', 'status': 'error', 'error'[, 'conflicts']}.
+    """
+    is_admin = user.is_staff or user.is_superuser
+    results = [None] * len(items)
+    parsed = {}
+    for index, item in enumerate(items):
+        try:
+            parsed[index] = parse_item(item)
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+
+    bookings, company_bookings = [], []
+    with transaction.atomic():
+        if parsed:
+            animal_ids = {animal_id for animal_id, _, _, _, _ in parsed.values()}
+            provider_ids = {provider_id for _, _, provider_id, _, _ in parsed.values()}
+
+            # Lock the animals (in id order, so that two batches cannot deadlock)
+            animals = {
+                animal.id: animal
+                for animal in Animal.objects.select_related('owner').select_for_update(of=('self',)).filter(
+                    id__in=animal_ids
+                ).order_by('id')
+            }
+            providers = User.objects.filter(id__in=provider_ids, is_active=True).in_bulk()
+            # Busy ranges of every animal of the batch: (kind, id, start_date, end_date) per animal
+            busy = {animal_id: [] for animal_id in animal_ids}
+            for kind, booking_id, animal_id, start_date, end_date in active_animal_bookings(
+                animal_ids,
+                min(start_date for _, _, _, start_date, _ in parsed.values()),
+                max(end_date for _, _, _, _, end_date in parsed.values())
+            ):
+                busy[animal_id].append((kind, booking_id, start_date, end_date))
+
+        pending = []
+        for index, (animal_id, kind, provider_id, start_date, end_date) in sorted(parsed.items()):
+            animal = animals.get(animal_id)
+            provider = providers.get(provider_id)
+            expected_role, provider_label = ('petsitter', 'Pet sitter') if kind == 'bookings' else ('company', 'Company')
+
+            if animal is None:
+                error = 'Animal not found'
+            elif animal.owner_id != user.id and not is_admin:
+                error = 'You can only book for your own animals'
+            elif provider is None or provider.role != expected_role:
+                error = f'{provider_label} not found'
+            else:
+                error = None
+            if error:
+                results[index] = {'index': index, 'status': 'error', 'error': error}
+                continue
+
+            conflicts = {'bookings': [], 'company_bookings': [], 'series': [], 'items': []}
+            for other_kind, other_id, other_start, other_end in busy[animal_id]:
+                # Date overlap criteria: (start1 <= end2) AND (end1 >= start2)
+                if other_start <= end_date and other_end >= start_date and other_id not in conflicts[other_kind]:
+                    conflicts[other_kind].append(other_id)
+            if any(conflicts.values()):
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'error': 'This animal already has a booking that overlaps with these dates. Please choose other dates.',
+                    'conflicts': conflicts,
+                }
+                continue
+
+            # The accepted item blocks these dates for the next items of the batch
+            busy[animal_id].append(('items', index, start_date, end_date))
+            if kind == 'bookings':
+                booking = Booking(
+                    animal=animal, owner_id=animal.owner_id, sitter=provider, start_date=start_date, end_date=end_date
+                )
+                bookings.append(booking)
+            else:
+                booking = CompanyBooking(
+                    animal=animal, owner_id=animal.owner_id, company=provider, start_date=start_date, end_date=end_date
+                )
+                company_bookings.append(booking)
+            pending.append((index, kind, booking))
+
+        # bulk_create does not call save(): price the whole batch here
+        set_booking_totals(bookings + company_bookings)
+        Booking.objects.bulk_create(bookings)
+        CompanyBooking.objects.bulk_create(company_bookings)
+
+        if pending:
+            # bulk_create sends no post_save signal: bump the cache versions here
+            scopes = {model_scope(Booking), model_scope(CompanyBooking), AVAILABILITY_SCOPE}
+            for _, _, booking in pending:
+                scopes.add(user_scope(booking.owner_id))
+                scopes.add(user_scope(booking.sitter_id if isinstance(booking, Booking) else booking.company_id))
+            transaction.on_commit(lambda: invalidate(*scopes))
+            # New bookings are pending: they neither change the sitter counters nor occupy company places
+            transaction.on_commit(lambda: enqueue(send_batch_booking_emails, bookings, company_bookings))
+
+    for index, kind, booking in pending:
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'type': 'booking' if kind == 'bookings' else 'company_booking',
+            'id': booking.id,
+        }
+    return results
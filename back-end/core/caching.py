@@ -0,0 +1,140 @@
+"""
+Response cache of the public directory endpoints (pet sitters and companies lists).
+
+Entries are keyed by scope version, role and query parameters. Instead of deleting
+keys, invalidation bumps the version of a scope, so every entry built with the old
+version is never read again and simply expires.
+
+The versions are rows of the CacheVersion table, not cache keys: with the default
+local-memory cache each worker process has its own cache, and a version bumped in one
+worker's cache would leave the others serving stale entries and matching stale ETags
+(see core/conditional.py). Reading the versions costs one primary key query; the cached
+entries themselves may stay per process since their keys embed the shared versions.
+
+Every committed write bumps a few rows of this table ('model:booking', 'user:42'...), so
+the model rows are write hot spots. The bump runs in transaction.on_commit, as its own
+single-statement transaction after the writer's one, so the row lock is never held for
+the whole write. Under SQLite, where IMMEDIATE transactions already serialize writers on
+the database, it adds one short write transaction per write; under PostgreSQL, writers of
+a model queue only for that UPDATE. If it becomes a bottleneck, the versions can move to a
+shared cache (Redis INCR) with this table as fallback.
+
+Scopes:
+- 'directory': any user created, modified or deleted
+- 'availability': any company booking created, modified or deleted
+- 'pricing': any pricing rule created, modified or deleted (compiled rule sets, see core/pricing.py)
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db.models import F
+from rest_framework.response import Response
+
+from .models import CacheVersion
+
+KEY_PREFIX = 'directory-cache'
+DIRECTORY_SCOPE = 'directory'
+AVAILABILITY_SCOPE = 'availability'
+PRICING_SCOPE = 'pricing'
+DEFAULT_TIMEOUT = 300
+
+
+def get_timeout():
+    return getattr(settings, 'DIRECTORY_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def counter_key(name):
+    return f'{KEY_PREFIX}:{name}'
+
+
+def increment(key):
+    """
+    Atomically increments an integer stored in the cache, creating it if needed.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # add() does nothing if another process created the key in between
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def get_versions(scopes):
+    """
+    Returns the current version of each scope. A missing version (first use) starts
+    from the current time, so it never matches an entry cached before the row existed.
+    """
+    versions = dict(CacheVersion.objects.filter(scope__in=scopes).values_list('scope', 'version'))
+    missing = [scope for scope in dict.fromkeys(scopes) if scope not in versions]
+    if missing:
+        # ignore_conflicts: another process may create the same rows in between
+        now = int(time.time() * 1000)
+        CacheVersion.objects.bulk_create(
+            [CacheVersion(scope=scope, version=now) for scope in missing], ignore_conflicts=True
+        )
+        versions.update(CacheVersion.objects.filter(scope__in=missing).values_list('scope', 'version'))
+    return [versions[scope] for scope in scopes]
+
+
+def invalidate(*scopes):
+    """
+    Invalidates every cached response built from these scopes, in every process.
+    """
+    scopes = set(scopes)
+    if CacheVersion.objects.filter(scope__in=scopes).update(version=F('version') + 1) < len(scopes):
+        get_versions(list(scopes))
+
+
+def response_key(request, scopes, role):
+    """
+    Builds the cache key of a request: scope versions, role, host (used in the
+    pagination links) and the sorted query parameters.
+    """
+    params = sorted((name, value) for name in request.query_params for value in request.query_params.getlist(name))
+    fingerprint = hashlib.sha256(repr((request.get_host(), request.path, params)).encode()).hexdigest()
+    versions = '.'.join(str(version) for version in get_versions(scopes))
+    return f'{KEY_PREFIX}:{role}:{versions}:{fingerprint}'
+
+
+def cached_response(request, scopes, role, build):
+    """
+    Returns the cached response of a directory request, or calls build() and caches its
+    data if it succeeded. The X-Cache header tells whether the response came from the cache.
+    """
+    key = response_key(request, scopes, role)
+    data = cache.get(key)
+    if data is not None:
+        increment(counter_key('hits'))
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    increment(counter_key('misses'))
+    response = build()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout=get_timeout())
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def cache_stats():
+    """
+    Returns the hit and miss counters shared by every process using the cache.
+    """
+    counters = cache.get_many([counter_key('hits'), counter_key('misses')])
+    hits = counters.get(counter_key('hits'), 0)
+    misses = counters.get(counter_key('misses'), 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 3) if total else None,
+        'backend': caches[DEFAULT_CACHE_ALIAS].__class__.__name__,
+    }
+
+
+def reset_stats():
+    cache.delete_many([counter_key('hits'), counter_key('misses')])
@@ -0,0 +1,70 @@
+"""
+Cancellation cascade: when a pet owner cancels pet sitter bookings (or an administrator
+refunds one), the pet sitters' bookings with companies within the same dates are cancelled.
+
+The cascade costs a constant number of queries whatever the number of linked bookings:
+one UPDATE returning the cancelled rows, the notifications being sent in the background
+after the commit.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .caching import invalidate
+from .conditional import model_scope, user_scope
+from .models import PetSitterCompanyBooking
+from .notifications import enqueue, send_cancelled_collaboration_emails
+
+# Backends supporting UPDATE ... RETURNING
+RETURNING_VENDORS = ('postgresql', 'sqlite')
+
+
+def linked_collaborations(bookings):
+    """
+    Pet sitter/company bookings of the bookings' sitters within the booking dates.
+    """
+    linked = Q()
+    for booking in bookings:
+        linked |= Q(petsitter_id=booking.sitter_id, start_date__gte=booking.start_date, end_date__lte=booking.end_date)
+    return PetSitterCompanyBooking.objects.filter(linked)
+
+
+def cancel_rows(queryset):
+    """
+    Cancels the rows of a PetSitterCompanyBooking queryset in one bulk UPDATE.
+    Returns the (id, company_id) of the rows actually cancelled.
+    """
+    queryset = queryset.exclude(status='cancelled')
+    if connection.vendor in RETURNING_VENDORS:
+        qn = connection.ops.quote_name
+        subquery, params = queryset.values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(PetSitterCompanyBooking._meta.db_table)} SET {qn('status')} = %s "
+                f"WHERE {qn('id')} IN ({subquery}) RETURNING {qn('id')}, {qn('company_id')}",
+                ['cancelled', *params]
+            )
+            return cursor.fetchall()
+    # Other backends: lock the rows, then update them by id
+    rows = list(queryset.select_for_update().values_list('id', 'company_id'))
+    PetSitterCompanyBooking.objects.filter(id__in=[row_id for row_id, _ in rows]).update(status='cancelled')
+    return rows
+
+
+def cancel_linked_collaborations(bookings):
+    """
+    Cancels the pet sitter/company bookings linked to pet sitter bookings, inside the
+    caller's transaction. Returns the ids of the cancelled rows.
+    """
+    if not bookings:
+        return []
+    with transaction.atomic():
+        rows = cancel_rows(linked_collaborations(bookings))
+        ids = [row_id for row_id, _ in rows]
+        if ids:
+            # A bulk UPDATE sends no post_save signal: bump the change counters here
+            scopes = {model_scope(PetSitterCompanyBooking)}
+            scopes.update(user_scope(booking.sitter_id) for booking in bookings)
+            scopes.update(user_scope(company_id) for _, company_id in rows)
+            transaction.on_commit(lambda: invalidate(*scopes))
+            transaction.on_commit(lambda: enqueue(send_cancelled_collaboration_emails, ids))
+    return ids
@@ -0,0 +1,155 @@
+"""
+Conditional GET: strong ETags and 304 Not Modified responses.
+
+The ETag of a response is computed before any serialization from change counters
+shared by every worker process (the CacheVersion rows of core/caching.py, read in one query):
+- one counter per user, bumped whenever a row involving this user changes
+  (their profile, animals, bookings and payments),
+- one counter per model, bumped on every change of the model.
+A user who only sees their own rows gets an ETag built from their own counter,
+staff and views listing every row use the model counter.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .caching import get_versions
+from .models import Animal, Booking, CompanyBooking, CompanyBookingSeries, PetSitterCompanyBooking, Payment, User
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def model_scope(model):
+    return f'model:{model._meta.model_name}'
+
+
+def involved_users(instance):
+    """
+    Returns the ids of the users who can see a row in their own lists.
+    """
+    if isinstance(instance, User):
+        return {instance.pk}
+    if isinstance(instance, Animal):
+        return {instance.owner_id}
+    if isinstance(instance, Booking):
+        return {instance.sitter_id, instance.owner_id}
+    if isinstance(instance, CompanyBooking):
+        return {instance.company_id, instance.owner_id}
+    if isinstance(instance, CompanyBookingSeries):
+        return {instance.company_id} | set(
+            Animal.objects.filter(pk=instance.animal_id).values_list('owner_id', flat=True)
+        )
+    if isinstance(instance, PetSitterCompanyBooking):
+        return {instance.petsitter_id, instance.company_id}
+    if isinstance(instance, Payment):
+        users = {instance.owner_id}
+        if instance.booking_id:
+            users.update(Booking.objects.filter(pk=instance.booking_id).values_list('sitter_id', flat=True))
+        if instance.company_booking_id:
+            users.update(CompanyBooking.objects.filter(pk=instance.company_booking_id).values_list('company_id', flat=True))
+        return users
+    return set()
+
+
+def change_scopes(instance):
+    """
+    Returns the scopes to bump after a row was saved or deleted.
+    """
+    return [model_scope(type(instance))] + [user_scope(user_id) for user_id in involved_users(instance) if user_id]
+
+
+def own_rows_scopes(request, model):
+    """
+    Scopes of a view listing only the rows involving the logged-in user (staff see every row).
+    """
+    user = request.user
+    if user.is_authenticated and not (user.is_staff or user.is_superuser):
+        return [user_scope(user.pk)]
+    return [model_scope(model)]
+
+
+def compute_etag(request, scopes):
+    """
+    Builds a strong ETag from the request (user, path and query parameters) and the scope versions.
+    """
+    params = sorted((name, value) for name in request.query_params for value in request.query_params.getlist(name))
+    versions = get_versions(scopes)
+    fingerprint = repr((request.user.pk, request.get_host(), request.path, params, list(zip(scopes, versions))))
+    return '"%s"' % hashlib.sha256(fingerprint.encode()).hexdigest()[:32]
+
+
+def conditional_response(request, scopes, build):
+    """
+    Returns 304 Not Modified if the If-None-Match header matches the current ETag,
+    otherwise calls build() and adds the ETag to its response.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return build()
+
+    etag = compute_etag(request, scopes)
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+
+    response['ETag'] = etag
+    # Browsers must revalidate, shared proxies must not store per-user responses
+    response['Cache-Control'] = 'private, no-cache'
+    response['Vary'] = 'Authorization, Cookie'
+    return response
+
+
+def conditional_get(get_scopes):
+    """
+    Decorator for ViewSet actions and function views. get_scopes(request) returns the scopes of the response.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request = args[1] if isinstance(args[0], APIView) else args[0]
+            return conditional_response(request, get_scopes(request), lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag / If-None-Match support to the list and retrieve actions of a ViewSet.
+    By default only the rows of the logged-in user are assumed visible.
+    """
+
+    def get_etag_scopes(self):
+        return own_rows_scopes(self.request, self.queryset.model)
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.get_etag_scopes(), lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, self.get_etag_scopes(), lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+
+def own_rows(model):
+    """
+    get_scopes for conditional_get: the view lists the rows involving the logged-in user.
+    """
+    return lambda request: own_rows_scopes(request, model)
+
+
+def all_rows(model):
+    """
+    get_scopes for conditional_get: the view lists rows of every user.
+    """
+    return lambda request: [model_scope(model)]
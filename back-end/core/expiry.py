@@ -0,0 +1,137 @@
+"""
+Expiry of stale pending bookings.
+
+A pet sitter or company booking still pending PENDING_BOOKING_TTL_HOURS after it was
+requested, or whose start date has passed, moves to the terminal status 'expired': it no
+longer blocks the animal's dates in the overlap checks nor shows up as a request to answer.
+
+Bookings are read in batches through the (status, created_at) and (status, start_date)
+indexes and each batch is expired with one conditional UPDATE (... WHERE status = 'pending'),
+so a booking accepted meanwhile is left alone, and neither counted nor notified. Running the
+job from several processes at once is therefore harmless.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .caching import AVAILABILITY_SCOPE, invalidate
+from .conditional import model_scope, user_scope
+from .models import Booking, CompanyBooking
+from .notifications import enqueue, send_status_change_emails
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_HOURS = 72
+DEFAULT_BATCH_SIZE = 500
+
+# Expirable models -> field of the pet sitter or company
+PROVIDERS = {Booking: 'sitter', CompanyBooking: 'company'}
+
+scheduler_lock = threading.Lock()
+scheduler = None
+
+
+def expiry_criteria(now, ttl_hours):
+    """
+    Conditions making a pending booking stale, each served by its own index.
+    """
+    return [
+        Q(created_at__lt=now - timedelta(hours=ttl_hours)),
+        Q(start_date__lt=timezone.localdate(now)),
+    ]
+
+
+def expire_batch(model, criterion, batch_size):
+    """
+    Expires up to batch_size pending bookings of a model matching a criterion.
+    Returns the ids of the expired bookings.
+    """
+    provider = PROVIDERS[model]
+    with transaction.atomic():
+        # Rows locked by a concurrent status change are skipped, the next run gets them
+        bookings = list(
+            model.objects.select_related('animal__owner', provider).select_for_update(
+                skip_locked=True, of=('self',)
+            ).filter(criterion, status='pending')[:batch_size]
+        )
+        if not bookings:
+            return []
+        ids = [booking.id for booking in bookings]
+        updated = model.objects.filter(id__in=ids, status='pending').update(status='expired')
+        if updated != len(ids):
+            # Some bookings left 'pending' between the read and the UPDATE (a database
+            # without row locks): only the ones really expired are marked and notified
+            expired = set(model.objects.filter(id__in=ids, status='expired').values_list('id', flat=True))
+            bookings = [booking for booking in bookings if booking.id in expired]
+            ids = [booking.id for booking in bookings]
+            if not bookings:
+                return []
+
+        # A bulk UPDATE sends no post_save signal: bump the cache versions here
+        scopes = {model_scope(model)}
+        for booking in bookings:
+            booking.status = 'expired'
+            scopes.add(user_scope(booking.owner_id))
+            scopes.add(user_scope(getattr(booking, f'{provider}_id')))
+        if model is CompanyBooking:
+            scopes.add(AVAILABILITY_SCOPE)
+        transaction.on_commit(lambda: invalidate(*scopes))
+        # Pending bookings neither count as accepted/refused nor occupy company places:
+        # only the users need to be told, with one summary per user and per batch
+        transaction.on_commit(lambda: enqueue(send_status_change_emails, bookings, 'expired'))
+    return ids
+
+
+def expire_stale_bookings(ttl_hours=None, batch_size=None, now=None):
+    """
+    Expires every stale pending booking. Returns {'bookings': count, 'company_bookings': count}.
+    """
+    ttl_hours = ttl_hours or getattr(settings, 'PENDING_BOOKING_TTL_HOURS', DEFAULT_TTL_HOURS)
+    batch_size = batch_size or getattr(settings, 'BOOKING_EXPIRY_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    now = now or timezone.now()
+
+    counts = {}
+    for model, label in ((Booking, 'bookings'), (CompanyBooking, 'company_bookings')):
+        counts[label] = 0
+        for criterion in expiry_criteria(now, ttl_hours):
+            while True:
+                expired = expire_batch(model, criterion, batch_size)
+                counts[label] += len(expired)
+                if len(expired) < batch_size:
+                    break
+    return counts
+
+
+def run_scheduler(interval):
+    """
+    Background loop expiring stale bookings every `interval` seconds.
+    """
+    while True:
+        time.sleep(interval)
+        try:
+            expire_stale_bookings()
+        except Exception:
+            logger.exception('Error expiring stale bookings')
+        finally:
+            connections.close_all()
+
+
+def start_expiry_scheduler():
+    """
+    Starts the in-process expiry loop if BOOKING_EXPIRY_INTERVAL is set (seconds, 0 = off).
+    Without it, run the expire_bookings management command periodically (cron).
+    """
+    global scheduler
+    interval = getattr(settings, 'BOOKING_EXPIRY_INTERVAL', 0)
+    if not interval:
+        return
+    with scheduler_lock:
+        if scheduler is None or not scheduler.is_alive():
+            scheduler = threading.Thread(target=run_scheduler, args=(interval,), name='booking-expiry', daemon=True)
+            scheduler.start()
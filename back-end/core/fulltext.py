@@ -0,0 +1,174 @@
+"""
+Full-text search over User.name and User.experience.
+
+- SQLite: an FTS5 virtual table (core_user_fts) whose rowid is the user id. Words are
+  stemmed in Python with a light French stemmer before being indexed or searched,
+  since FTS5 only ships an English stemmer. The table is kept in sync by User.save and
+  the post_delete signal of User.
+- PostgreSQL: a GIN index on to_tsvector('french', name || ' ' || experience), which
+  the database maintains by itself.
+- Other databases fall back to a case-insensitive substring search.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'core_user_fts'
+PG_INDEX = 'core_user_fts_gin'
+PG_VECTOR = "to_tsvector('french', coalesce(name, '') || ' ' || coalesce(experience, ''))"
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Suffixes removed by the French stemmer, longest first
+FRENCH_SUFFIXES = (
+    'issements', 'issement', 'atrices', 'atrice', 'ateurs', 'ateur', 'ations', 'ation',
+    'ements', 'ement', 'euses', 'euse', 'eurs', 'eur', 'ences', 'ence', 'ances', 'ance',
+    'iques', 'ique', 'ismes', 'isme', 'istes', 'iste', 'ables', 'able', 'ites', 'ite',
+    'isees', 'isee', 'ises', 'ise', 'ees', 'ee', 'ers', 'er', 'es', 's', 'x', 'e',
+)
+MIN_STEM_LENGTH = 3
+
+
+def stem_word(word):
+    """
+    Reduces a French word to a stem: lower case, no accents, common suffixes removed.
+    """
+    word = unicodedata.normalize('NFKD', word.lower())
+    word = ''.join(char for char in word if not unicodedata.combining(char))
+    for suffix in FRENCH_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def stem_text(text):
+    """
+    Stems every word of a text.
+    """
+    return ' '.join(stem_word(word) for word in WORD_PATTERN.findall(text or ''))
+
+
+def fts5_query(query):
+    """
+    Builds an FTS5 MATCH expression: every stemmed word must appear, as a prefix.
+    Returns None if the query contains no word.
+    """
+    terms = [stem_word(word) for word in WORD_PATTERN.findall(query)]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def create_index(schema_editor):
+    """
+    Creates the full-text index for the current database (used by the migration).
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            "USING fts5(name, experience, tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON core_user USING GIN ({PG_VECTOR})")
+
+
+def drop_index(schema_editor):
+    """
+    Drops the full-text index (reverse of create_index).
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+
+
+def index_user(user):
+    """
+    Writes (or replaces) the index entry of a user. Only needed on SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [user.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, experience) VALUES (%s, %s, %s)",
+            [user.pk, stem_text(user.name), stem_text(user.experience)]
+        )
+
+
+def unindex_user(user_id):
+    """
+    Removes the index entry of a deleted user. Only needed on SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [user_id])
+
+
+def rebuild_index(users, batch_size=1000):
+    """
+    Rebuilds the whole index from a user queryset. Returns the number of users indexed.
+    On PostgreSQL the GIN index is maintained by the database, so it is only reindexed.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f"REINDEX INDEX {PG_INDEX}")
+        return users.count()
+    if connection.vendor != 'sqlite':
+        return 0
+
+    count = 0
+    batch = []
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        for user_id, name, experience in users.values_list('id', 'name', 'experience').iterator():
+            batch.append((user_id, stem_text(name), stem_text(experience)))
+            if len(batch) >= batch_size:
+                cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, name, experience) VALUES (%s, %s, %s)", batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, name, experience) VALUES (%s, %s, %s)", batch)
+            count += len(batch)
+    return count
+
+
+def search_users(queryset, query):
+    """
+    Filters a user queryset with a full-text query and annotates it with a
+    `relevance` score (higher is better). The caller orders by -relevance.
+    """
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        match = fts5_query(query)
+        if match is None:
+            return queryset.annotate(relevance=RawSQL('0', (), output_field=FloatField()))
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+        ).annotate(
+            # FTS5 ranks with bm25, where lower (more negative) is better
+            relevance=RawSQL(
+                f"(SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = core_user.id)",
+                (match,),
+                output_field=FloatField()
+            )
+        )
+    if vendor == 'postgresql':
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT id FROM core_user WHERE {PG_VECTOR} @@ plainto_tsquery('french', %s)", (query,)
+            )
+        ).annotate(
+            relevance=RawSQL(
+                f"ts_rank({PG_VECTOR}, plainto_tsquery('french', %s))", (query,), output_field=FloatField()
+            )
+        )
+    return queryset.filter(
+        Q(name__icontains=query) | Q(experience__icontains=query)
+    ).annotate(relevance=RawSQL('0', (), output_field=FloatField()))
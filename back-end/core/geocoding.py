@@ -0,0 +1,139 @@
+import csv
+import math
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+
+# Offline gazetteers.
+# - fr_gazetteer.csv: postal code (or postal code prefix) -> coordinates. One entry per
+#   department (its prefecture), plus the arrondissements of Paris, Lyon and Marseille;
+#   full 5-digit postal codes take precedence over the department entry.
+# - fr_communes.csv: the communes of metropolitan France with at least 500 inhabitants and
+#   their coordinates, from GeoNames (CC BY 4.0, https://www.geonames.org).
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'fr_gazetteer.csv'
+COMMUNES_PATH = Path(__file__).resolve().parent / 'data' / 'fr_communes.csv'
+
+POSTAL_CODE_PATTERN = re.compile(r'\b(\d{5})\b')
+# Arrondissement number ("3", "3e", "1er") or CEDEX suffix ending a locality
+LOCALITY_SUFFIX_PATTERN = re.compile(r'(?:\s+\d+(?:er|e|eme)?)+$|\s+cedex\b.*$')
+ABBREVIATIONS = {'st': 'saint', 'ste': 'sainte'}
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LATITUDE = 111.32
+# A commune farther than this from its department's prefecture is a homonym elsewhere
+MAX_PREFECTURE_DISTANCE_KM = 150
+
+
+def normalize_name(value):
+    """
+    Lower case, accents removed and separators turned into spaces, to compare city names.
+    """
+    value = unicodedata.normalize('NFKD', value.lower())
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(re.split(r"[\s\-'.]+", value)).strip()
+
+
+def locality_key(value):
+    """
+    Lookup key of a locality: normalized name, without arrondissement number or CEDEX
+    suffix, with St/Ste spelled out.
+    """
+    name = LOCALITY_SUFFIX_PATTERN.sub('', normalize_name(value))
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in name.split())
+
+
+@lru_cache(maxsize=1)
+def load_gazetteer():
+    """
+    Loads the gazetteers once: returns (coordinates by postal code, coordinates of the
+    communes by locality key, most populated first).
+    """
+    by_code = {}
+    with open(GAZETTEER_PATH, encoding='utf-8') as gazetteer:
+        for row in csv.DictReader(gazetteer):
+            by_code[row['postal_prefix']] = (float(row['latitude']), float(row['longitude']))
+
+    communes = []
+    with open(COMMUNES_PATH, encoding='utf-8') as gazetteer:
+        for row in csv.DictReader(gazetteer):
+            communes.append((int(row['population']), locality_key(row['city']), float(row['latitude']), float(row['longitude'])))
+    by_city = {}
+    for _, key, latitude, longitude in sorted(communes, reverse=True):
+        by_city.setdefault(key, []).append((latitude, longitude))
+    return by_code, by_city
+
+
+def department_code(postal_code):
+    """
+    Returns the department code of a 5-digit postal code (2A/2B for Corsica, 3 digits overseas).
+    """
+    if postal_code.startswith('20'):
+        return '2A' if postal_code[2] in '01' else '2B'
+    if postal_code.startswith('97'):
+        return postal_code[:3]
+    return postal_code[:2]
+
+
+def find_commune(locality, department=None):
+    """
+    Returns the coordinates of the commune named locality: the one closest to the
+    department's prefecture if given (homonyms are common), else the most populated.
+    """
+    candidates = load_gazetteer()[1].get(locality_key(locality))
+    if not candidates:
+        return None
+    if department is None:
+        return candidates[0]
+    closest = min(candidates, key=lambda coordinates: distance_km(*department, *coordinates))
+    return closest if distance_km(*department, *closest) <= MAX_PREFECTURE_DISTANCE_KM else None
+
+
+def geocode(address):
+    """
+    Geocodes a free-text French address without any network access.
+    With a postal code, the locality after it ("..., 69003 Lyon") is looked up among the
+    communes of the department, falling back to the department itself. Without one, the
+    last comma-separated part of the address is taken as the locality, so that a street
+    named after a city ("rue de Paris, Lyon") is not mistaken for it.
+    Returns (latitude, longitude) or None.
+    """
+    if not address:
+        return None
+    by_code = load_gazetteer()[0]
+
+    match = POSTAL_CODE_PATTERN.search(address)
+    if match:
+        postal_code = match.group(1)
+        if postal_code in by_code:
+            return by_code[postal_code]
+        department = by_code.get(department_code(postal_code))
+        locality = address[match.end():].split(',')[0]
+        return find_commune(locality, department) or department
+    return find_commune(address.rsplit(',', 1)[-1])
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Returns (min_lat, max_lat, min_lon, max_lon) of a square around a point,
+    used as an indexed prefilter before the exact distance.
+    """
+    delta_latitude = radius_km / KM_PER_DEGREE_LATITUDE
+    cos_latitude = max(math.cos(math.radians(latitude)), 0.01)
+    delta_longitude = radius_km / (KM_PER_DEGREE_LATITUDE * cos_latitude)
+    return (
+        latitude - delta_latitude,
+        latitude + delta_latitude,
+        longitude - delta_longitude,
+        longitude + delta_longitude,
+    )
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """
+    Great-circle distance between two points (haversine formula).
+    """
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    delta_phi = phi2 - phi1
+    delta_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
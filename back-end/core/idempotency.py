@@ -0,0 +1,133 @@
+"""
+Idempotency-Key support for the payment endpoints.
+
+The first request carrying a given key stores a pending row, runs the view and saves
+its response; a retry with the same key reads that row (one lookup on the unique
+(user, key) index) and gets the stored response back, without running the payment
+logic or sending the emails again.
+
+- same key, different request body or endpoint: 422
+- same key while the first request is still running: 409
+- server errors (5xx) and exceptions are not stored: the client may retry with the same key
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """
+    Hash of what makes two requests the same operation: method, path and body.
+    """
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def replay(record):
+    """
+    Response of a completed request, as it was first returned.
+    """
+    response = Response(record.response, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def expired(record):
+    return record.created_at < timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+
+
+def purge_expired_keys():
+    """
+    Deletes the keys older than IDEMPOTENCY_KEY_TTL_HOURS. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def idempotent_response(request, build):
+    """
+    Runs build() once per Idempotency-Key of the user and replays its response afterwards.
+    Requests without the header are processed normally.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return build()
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {'error': f'The {HEADER} header must not exceed {MAX_KEY_LENGTH} characters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    fingerprint = request_fingerprint(request)
+    record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+    if record is not None and expired(record):
+        record.delete()
+        record = None
+    if record is None:
+        try:
+            record = IdempotencyKey.objects.create(
+                user=request.user, key=key, endpoint=request.path, fingerprint=fingerprint
+            )
+        except IntegrityError:
+            # A concurrent request with the same key inserted it first
+            record = IdempotencyKey.objects.get(user=request.user, key=key)
+        else:
+            return run(record, build)
+
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'error': f'This {HEADER} was already used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if record.status_code is None:
+        return Response(
+            {'error': f'A request with this {HEADER} is still being processed. Please retry later.'},
+            status=status.HTTP_409_CONFLICT
+        )
+    return replay(record)
+
+
+def run(record, build):
+    """
+    Runs the view for a newly reserved key and stores its response, or releases the key
+    if the request failed on the server side.
+    """
+    try:
+        response = build()
+    except Exception:
+        record.delete()
+        raise
+    if response.status_code >= 500 or not hasattr(response, 'data'):
+        record.delete()
+        return response
+
+    record.status_code = response.status_code
+    record.response = json.loads(json.dumps(response.data, cls=JSONEncoder))
+    record.save(update_fields=['status_code', 'response'])
+    return response
+
+
+def idempotent(view):
+    """
+    Decorator for ViewSet actions and function views (placed under @action / @api_view).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = args[1] if isinstance(args[0], APIView) else args[0]
+        return idempotent_response(request, lambda: view(*args, **kwargs))
+    return wrapper
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from core.expiry import expire_stale_bookings
+from core.notifications import wait_for_notifications
+
+class Command(BaseCommand):
+    help = 'Expires the pending bookings older than the TTL or whose start date has passed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-hours', type=int, help='Overrides PENDING_BOOKING_TTL_HOURS')
+        parser.add_argument('--batch-size', type=int, help='Overrides BOOKING_EXPIRY_BATCH_SIZE')
+
+    def handle(self, *args, **options):
+        counts = expire_stale_bookings(ttl_hours=options['ttl_hours'], batch_size=options['batch_size'])
+        # The notifications are sent in the background: let them go out before exiting
+        wait_for_notifications()
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully expired {counts['bookings']} pet sitter bookings "
+            f"and {counts['company_bookings']} company bookings"
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core.geocoding import geocode
+from core.models import User
+
+class Command(BaseCommand):
+    help = 'Recomputes the coordinates of every user from their address (after a gazetteer update)'
+
+    def handle(self, *args, **kwargs):
+        users = list(User.objects.only('id', 'address', 'latitude', 'longitude'))
+        changed = []
+        for user in users:
+            coordinates = geocode(user.address) or (None, None)
+            if coordinates != (user.latitude, user.longitude):
+                user.latitude, user.longitude = coordinates
+                changed.append(user)
+        # bulk_update does not call save(): only the coordinates are written
+        User.objects.bulk_update(changed, ['latitude', 'longitude'], batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f'Successfully geocoded {len(users)} users ({len(changed)} changed)'))
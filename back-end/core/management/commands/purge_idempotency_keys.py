@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from core.idempotency import purge_expired_keys
+
+class Command(BaseCommand):
+    help = 'Deletes the payment idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'Successfully deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from core.occupancy import rebuild_company_occupancy
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-day company occupancy table from the company bookings'
+
+    def handle(self, *args, **kwargs):
+        rows = rebuild_company_occupancy()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt company occupancy ({rows} company-days)'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from core.recommendations import rebuild_sitter_features
+
+class Command(BaseCommand):
+    help = 'Recomputes the feature vectors used to recommend pet sitters'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild_sitter_features()
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt the features of {count} pet sitters'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.fulltext import rebuild_index
+from core.models import User
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index over user names and experience'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild_index(User.objects.all())
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt the search index ({count} users)'))
@@ -0,0 +1,94 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from core.models import Animal, Booking, CompanyBooking, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Fires many simultaneous conflicting booking requests for the same animal and dates '
+        'and checks that exactly one of them is created. Temporary users are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Number of simultaneous requests')
+        parser.add_argument('--kind', choices=['booking', 'company'], default='booking',
+                            help='Pet sitter bookings or company bookings')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        kind = options['kind']
+        suffix = uuid.uuid4().hex[:8]
+
+        owner = User.objects.create_user(
+            email=f'stress-owner-{suffix}@example.com', name='Stress owner', role='petowner',
+            password=uuid.uuid4().hex, address='Paris'
+        )
+        provider = User.objects.create_user(
+            email=f'stress-provider-{suffix}@example.com', name='Stress provider',
+            role='petsitter' if kind == 'booking' else 'company', password=uuid.uuid4().hex,
+            experience='Stress test' if kind == 'booking' else '', address='' if kind == 'booking' else 'Paris',
+            capacity=0 if kind == 'booking' else total
+        )
+        animal = Animal.objects.create(owner=owner, name='Stress', animal_type='dog')
+
+        if kind == 'booking':
+            url, payload = '/api/bookings/', {'animal': animal.id, 'sitter': provider.id}
+        else:
+            url, payload = '/api/company-bookings/', {'animal': animal.id, 'company': provider.id}
+        payload.update({'start_date': '2099-01-01', 'end_date': '2099-01-07'})
+
+        statuses = Counter()
+        latencies = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(total)
+
+        def send():
+            client = APIClient()
+            client.force_authenticate(owner)
+            try:
+                barrier.wait()
+                started = time.perf_counter()
+                response = client.post(url, payload, format='json')
+                elapsed = time.perf_counter() - started
+                with lock:
+                    statuses[response.status_code] += 1
+                    latencies.append(elapsed)
+            finally:
+                connections.close_all()
+
+        try:
+            # Notification emails are kept in memory during the run
+            with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+                threads = [threading.Thread(target=send) for _ in range(total)]
+                started = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                duration = time.perf_counter() - started
+
+            model = Booking if kind == 'booking' else CompanyBooking
+            created = model.objects.filter(animal=animal).count()
+        finally:
+            owner.delete()
+            provider.delete()
+
+        latencies.sort()
+        self.stdout.write(f'Requests: {total} in {duration:.2f}s ({total / duration:.1f} req/s)')
+        self.stdout.write(
+            f'Latency: median {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+            f'max {latencies[-1] * 1000:.1f} ms'
+        )
+        self.stdout.write('Status codes: ' + ', '.join(f'{code}: {count}' for code, count in sorted(statuses.items())))
+
+        if created != 1 or statuses.get(201) != 1:
+            raise CommandError(f'Expected exactly one booking, {created} were created')
+        self.stdout.write(self.style.SUCCESS('Exactly one booking was created'))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 13:56
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of core.models.EXPERIENCE_YEARS_PATTERN: the migration must replay the same
+# way whatever the model module becomes
+EXPERIENCE_YEARS_PATTERN = re.compile(r'(\d+)\s*(?:ans?|years?)\b', re.IGNORECASE)
+
+
+def backfill_experience_years(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    for user in User.objects.exclude(experience='').only('id', 'experience'):
+        match = EXPERIENCE_YEARS_PATTERN.search(user.experience)
+        User.objects.filter(pk=user.pk).update(
+            experience_years=int(match.group(1)) if match else 0
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0017_alter_animal_maladie'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='experience_years',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_experience_years, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'name'], name='user_role_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'experience_years'], name='user_role_experience_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_user_experience_years'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='companybooking',
+            index=models.Index(fields=['company', 'status', 'end_date'], name='cbooking_company_status_idx'),
+        ),
+    ]
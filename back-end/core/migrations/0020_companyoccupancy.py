@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-18 13:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_occupancy(apps, schema_editor):
+    from core.occupancy import count_occupancy
+
+    CompanyBooking = apps.get_model('core', 'CompanyBooking')
+    CompanyOccupancy = apps.get_model('core', 'CompanyOccupancy')
+    bookings = CompanyBooking.objects.filter(
+        status__in=['accepted', 'paid']
+    ).values_list('company_id', 'start_date', 'end_date')
+    CompanyOccupancy.objects.bulk_create(
+        [CompanyOccupancy(company_id=company_id, day=day, occupied=occupied)
+         for (company_id, day), occupied in count_occupancy(bookings).items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_companybooking_company_status_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('occupied', models.IntegerField(default=0)),
+                ('company', models.ForeignKey(limit_choices_to={'role': 'company'}, on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company', 'day'), name='unique_company_occupancy_day')],
+            },
+        ),
+        migrations.RunPython(populate_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_companyoccupancy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['sitter', 'status', 'end_date'], name='booking_sitter_status_idx'),
+        ),
+    ]
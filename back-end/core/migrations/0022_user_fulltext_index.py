@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 14:10
+
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    from core.fulltext import create_index, stem_text, FTS_TABLE
+
+    create_index(schema_editor)
+    if schema_editor.connection.vendor == 'sqlite':
+        User = apps.get_model('core', 'User')
+        for user_id, name, experience in User.objects.values_list('id', 'name', 'experience'):
+            schema_editor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, experience) VALUES (%s, %s, %s)",
+                (user_id, stem_text(name), stem_text(experience))
+            )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    from core.fulltext import drop_index
+
+    drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_booking_sitter_status_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+def geocode_addresses(apps, schema_editor):
+    from core.geocoding import geocode
+
+    User = apps.get_model('core', 'User')
+    for user in User.objects.exclude(address='').only('id', 'address'):
+        coordinates = geocode(user.address)
+        if coordinates:
+            User.objects.filter(pk=user.pk).update(latitude=coordinates[0], longitude=coordinates[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0022_user_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'latitude', 'longitude'], name='user_role_location_idx'),
+        ),
+        migrations.RunPython(geocode_addresses, migrations.RunPython.noop),
+    ]
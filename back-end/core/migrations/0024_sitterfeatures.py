@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 14:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_sitter_features(apps, schema_editor):
+    from core.recommendations import keyword_mask, ACCEPTED_STATUSES, REFUSED_STATUSES
+
+    User = apps.get_model('core', 'User')
+    Booking = apps.get_model('core', 'Booking')
+    SitterFeatures = apps.get_model('core', 'SitterFeatures')
+    features = []
+    for sitter in User.objects.filter(role='petsitter'):
+        bookings = Booking.objects.filter(sitter=sitter)
+        features.append(SitterFeatures(
+            sitter_id=sitter.id,
+            keywords=keyword_mask(sitter.experience),
+            experience_years=sitter.experience_years,
+            accepted_count=bookings.filter(status__in=ACCEPTED_STATUSES).count(),
+            refused_count=bookings.filter(status__in=REFUSED_STATUSES).count(),
+        ))
+    SitterFeatures.objects.bulk_create(features, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_user_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SitterFeatures',
+            fields=[
+                ('sitter', models.OneToOneField(limit_choices_to={'role': 'petsitter'}, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='features', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('keywords', models.IntegerField(default=0)),
+                ('experience_years', models.PositiveSmallIntegerField(default=0)),
+                ('accepted_count', models.IntegerField(default=0)),
+                ('refused_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(populate_sitter_features, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_sitterfeatures'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['animal', 'status', 'start_date', 'end_date'], name='booking_animal_overlap_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companybooking',
+            index=models.Index(fields=['animal', 'status', 'start_date', 'end_date'], name='cbooking_animal_overlap_idx'),
+        ),
+    ]
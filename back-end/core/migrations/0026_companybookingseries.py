@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 14:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_animal_overlap_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyBookingSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('interval_weeks', models.PositiveSmallIntegerField(default=1)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('cancelled', 'Annulée')], default='active', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('animal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.animal')),
+                ('company', models.ForeignKey(limit_choices_to={'role': 'company'}, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='companybooking',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='core.companybookingseries'),
+        ),
+        migrations.AddIndex(
+            model_name='companybookingseries',
+            index=models.Index(fields=['animal', 'status', 'start_date', 'end_date'], name='series_animal_overlap_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 14:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_companybookingseries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='status',
+            field=models.CharField(choices=[('pending', 'En attente'), ('accepted', 'Acceptée'), ('refused', 'Refusée'), ('cancelled', 'Annulée'), ('paid', 'Payée'), ('expired', 'Expirée')], default='pending', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='companybooking',
+            name='status',
+            field=models.CharField(choices=[('pending', 'En attente'), ('accepted', 'Acceptée'), ('refused', 'Refusée'), ('cancelled', 'Annulée'), ('paid', 'Payée'), ('expired', 'Expirée')], default='pending', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'start_date'], name='booking_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companybooking',
+            index=models.Index(fields=['status', 'created_at'], name='cbooking_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companybooking',
+            index=models.Index(fields=['status', 'start_date'], name='cbooking_status_start_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 14:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_owners(apps, schema_editor):
+    Animal = apps.get_model('core', 'Animal')
+    Booking = apps.get_model('core', 'Booking')
+    CompanyBooking = apps.get_model('core', 'CompanyBooking')
+    Payment = apps.get_model('core', 'Payment')
+
+    animal_owner = Animal.objects.filter(pk=models.OuterRef('animal_id')).values('owner_id')[:1]
+    Booking.objects.update(owner_id=models.Subquery(animal_owner))
+    CompanyBooking.objects.update(owner_id=models.Subquery(animal_owner))
+    Payment.objects.filter(booking__isnull=False).update(owner_id=models.Subquery(
+        Booking.objects.filter(pk=models.OuterRef('booking_id')).values('owner_id')[:1]
+    ))
+    Payment.objects.filter(booking__isnull=True, company_booking__isnull=False).update(owner_id=models.Subquery(
+        CompanyBooking.objects.filter(pk=models.OuterRef('company_booking_id')).values('owner_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_booking_expiry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='owner_bookings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='companybooking',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='owner_company_bookings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='owner',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='owner_payments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_owners, migrations.RunPython.noop),
+    ]
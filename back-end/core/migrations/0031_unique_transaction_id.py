@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+def deduplicate_transaction_ids(apps, schema_editor):
+    Payment = apps.get_model('core', 'Payment')
+
+    Payment.objects.filter(transaction_id='').update(transaction_id=None)
+    duplicates = (
+        Payment.objects.exclude(transaction_id=None).values('transaction_id')
+        .annotate(count=models.Count('id')).filter(count__gt=1).values_list('transaction_id', flat=True)
+    )
+    # The oldest payment keeps its ID, the others get the payment id appended
+    kept = set()
+    for payment in Payment.objects.filter(transaction_id__in=list(duplicates)).order_by('id'):
+        if payment.transaction_id in kept:
+            Payment.objects.filter(pk=payment.pk).update(transaction_id=f'{payment.transaction_id}-{payment.id}')
+        else:
+            kept.add(payment.transaction_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_transaction_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='transaction_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 14:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_unique_transaction_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='daily_rate',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule_type', models.CharField(choices=[('animal_type', "Type d'animal"), ('weekend', 'Week-end'), ('season', 'Saison')], max_length=20)),
+                ('animal_type', models.CharField(blank=True, choices=[('dog', 'Dog'), ('cat', 'Cat'), ('other', 'Other')], max_length=10)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('percent', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('provider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pricing_rules', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
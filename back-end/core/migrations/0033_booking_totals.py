@@ -0,0 +1,82 @@
+# Generated by Django 5.2 on 2026-10-18 14:35
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+from core.pricing import compile_rules, compute_price
+
+BATCH_SIZE = 500
+
+
+def backfill_totals(apps, schema_editor):
+    PricingRule = apps.get_model('core', 'PricingRule')
+    rules = list(PricingRule.objects.all())
+    default_rate = Decimal(str(settings.DEFAULT_DAILY_RATE))
+    rule_sets = {}
+
+    for model_name, provider_field in (('Booking', 'sitter'), ('CompanyBooking', 'company')):
+        model = apps.get_model('core', model_name)
+        batch = []
+        for booking in model.objects.select_related('animal', provider_field).iterator(chunk_size=BATCH_SIZE):
+            provider = getattr(booking, provider_field)
+            if provider.id not in rule_sets:
+                rule_sets[provider.id] = compile_rules([rule for rule in rules if rule.provider_id in (None, provider.id)])
+            booking.total_days = (booking.end_date - booking.start_date).days + 1
+            booking.total_price = compute_price(
+                provider.daily_rate or default_rate, rule_sets[provider.id],
+                booking.start_date, booking.end_date, booking.animal.animal_type
+            )
+            batch.append(booking)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, ['total_days', 'total_price'])
+                batch = []
+        model.objects.bulk_update(batch, ['total_days', 'total_price'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_pricing_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='total_days',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='companybooking',
+            name='total_days',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='companybooking',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['owner', 'total_price'], name='booking_owner_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['sitter', 'status', 'start_date', 'total_price'], name='booking_sitter_revenue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companybooking',
+            index=models.Index(fields=['owner', 'total_price'], name='cbooking_owner_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companybooking',
+            index=models.Index(fields=['company', 'status', 'start_date', 'total_price'], name='cbooking_company_revenue_idx'),
+        ),
+    ]
@@ -2,6 +2,20 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 from django.db import models
 from django.utils import timezone
 from datetime import datetime
+import re
+
+# Motif pour extraire le nombre d'années d'expérience ("5 ans", "3 years", ...)
+EXPERIENCE_YEARS_PATTERN = re.compile(r'(\d+)\s*(?:ans?|years?)\b', re.IGNORECASE)
+
+def extract_experience_years(experience):
+    """
+    Extrait le nombre d'années d'expérience d'un texte libre (0 si absent).
+    Extracts the number of years of experience from free text (0 if missing).
+    """
+    if not experience:
+        return 0
+    match = EXPERIENCE_YEARS_PATTERN.search(experience)
+    return int(match.group(1)) if match else 0
 
 class CustomUserManager(BaseUserManager):
     """
@@ -57,8 +71,15 @@ class User(AbstractBaseUser, PermissionsMixin):
         ('company', 'Company'),
     ])
     address = models.CharField(max_length=255, blank=True, default="")
+    # Coordonnées géocodées hors ligne à partir de l'adresse
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     experience = models.TextField(blank=True, default="")
+    # Années d'expérience extraites de `experience`, pour filtrer en base
+    experience_years = models.PositiveSmallIntegerField(default=0)
     capacity = models.IntegerField(null=True, blank=True, default=0)
+    # Tarif journalier du pet-sitter ou de l'entreprise, vide = tarif par défaut (voir core/pricing.py)
+    daily_rate = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
 
     # Champs pour la réinitialisation du mot de passe
@@ -89,6 +110,13 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name', 'role']
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['role', 'name'], name='user_role_name_idx'),
+            models.Index(fields=['role', 'experience_years'], name='user_role_experience_idx'),
+            models.Index(fields=['role', 'latitude', 'longitude'], name='user_role_location_idx'),
+        ]
+
     def clean(self):
         """
         Valide les champs en fonction du rôle de l'utilisateur.
@@ -122,12 +150,27 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def save(self, *args, **kwargs):
         """
-        Sauvegarde l'utilisateur après validation des champs.
-        Saves the user after validating the fields.
+        Sauvegarde l'utilisateur après validation des champs et met à jour l'index de recherche.
+        Saves the user after validating the fields and updates the search index.
         """
+        from .fulltext import index_user
+        from .geocoding import geocode
+        from .recommendations import refresh_sitter_features
+
         self.clean()
+        self.experience_years = extract_experience_years(self.experience)
+        self.latitude, self.longitude = geocode(self.address) or (None, None)
         super().save(*args, **kwargs)
 
+        # Garder l'index plein texte synchronisé avec le nom et l'expérience
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'name', 'experience'} & set(update_fields):
+            index_user(self)
+
+        # Rafraîchir le vecteur de caractéristiques utilisé pour les recommandations
+        if self.role == 'petsitter' and (update_fields is None or {'experience', 'is_active'} & set(update_fields)):
+            refresh_sitter_features(self)
+
     def __str__(self):
         """
         Renvoie l'adresse e-mail comme représentation textuelle de l'utilisateur.
@@ -135,6 +178,25 @@ class User(AbstractBaseUser, PermissionsMixin):
         """
         return self.email
 
+class SitterFeatures(models.Model):
+    """
+    Vecteur de caractéristiques précalculé d'un pet-sitter, utilisé pour les recommandations.
+    Precomputed feature vector of a pet sitter, used for recommendations.
+    """
+    sitter = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='features', limit_choices_to={'role': 'petsitter'})
+    keywords = models.IntegerField(default=0)  # Masque de bits des mots-clés trouvés dans l'expérience
+    experience_years = models.PositiveSmallIntegerField(default=0)
+    accepted_count = models.IntegerField(default=0)  # Réservations acceptées ou payées
+    refused_count = models.IntegerField(default=0)  # Réservations refusées
+    updated_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        """
+        Renvoie une représentation textuelle des caractéristiques du pet-sitter.
+        Returns a string representation of the pet sitter features.
+        """
+        return f"Features of {self.sitter.name}"
+
 class Animal(models.Model):
     """
     Modèle pour les animaux de compagnie enregistrés dans l'application.
@@ -153,6 +215,22 @@ class Animal(models.Model):
     age = models.CharField(max_length=50, default="Non spécifié")
     maladie = models.CharField(max_length=200, null=True, blank=True, default="No known illnesses")
 
+    def save(self, *args, **kwargs):
+        """
+        Enregistre l'animal et recopie un changement de propriétaire sur ses réservations et paiements.
+        Saves the animal and copies an owner change to its bookings and payments.
+        """
+        previous_owner_id = None
+        if not self._state.adding:
+            previous_owner_id = Animal.objects.filter(pk=self.pk).values_list('owner_id', flat=True).first()
+        super().save(*args, **kwargs)
+        if previous_owner_id is not None and previous_owner_id != self.owner_id:
+            Booking.objects.filter(animal=self).update(owner_id=self.owner_id)
+            CompanyBooking.objects.filter(animal=self).update(owner_id=self.owner_id)
+            Payment.objects.filter(
+                models.Q(booking__animal=self) | models.Q(company_booking__animal=self)
+            ).update(owner_id=self.owner_id)
+
     def __str__(self):
         """
         Renvoie une représentation textuelle de l'animal (nom et race).
@@ -171,32 +249,52 @@ class Booking(models.Model):
         ('refused', 'Refusée'),
         ('cancelled', 'Annulée'),
         ('paid', 'Payée'),  # Nouvel état pour les réservations payées
+        ('expired', 'Expirée'),  # Demande restée sans réponse (voir core/expiry.py)
     ]
 
+    # Statuts qui bloquent les dates du pet-sitter et de l'animal
+    ACTIVE_STATUSES = ['pending', 'accepted', 'paid']
+
     animal = models.ForeignKey(Animal, on_delete=models.CASCADE)
+    # Propriétaire de l'animal, recopié pour filtrer sans jointure sur Animal
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owner_bookings', editable=False)
     sitter = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'petsitter'})
     start_date = models.DateField()
     end_date = models.DateField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
-    
-    @property
-    def total_days(self):
-        """
-        Calcule le nombre total de jours de garde (inclut le premier et le dernier jour).
-        Calculates the total number of days for the booking (includes first and last day).
-        """
-        start_date = self.start_date
-        end_date = self.end_date
-        delta = end_date - start_date
-        return delta.days + 1  # Inclure le premier jour
-    
-    @property
-    def total_price(self):
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Durée et prix calculés à l'enregistrement (voir core/pricing.py), pour trier et agréger en base
+    total_days = models.PositiveIntegerField(default=0, editable=False)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sitter', 'status', 'end_date'], name='booking_sitter_status_idx'),
+            # Vérification des chevauchements de l'animal (voir core/availability.py)
+            models.Index(fields=['animal', 'status', 'start_date', 'end_date'], name='booking_animal_overlap_idx'),
+            # Expiration des demandes en attente (voir core/expiry.py)
+            models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+            models.Index(fields=['status', 'start_date'], name='booking_status_start_idx'),
+            # Tableau de bord du propriétaire
+            models.Index(fields=['owner', 'status', 'start_date'], name='booking_owner_status_idx'),
+            # Tri par prix et chiffre d'affaires du pet-sitter, calculés en base
+            models.Index(fields=['owner', 'total_price'], name='booking_owner_price_idx'),
+            models.Index(fields=['sitter', 'status', 'start_date', 'total_price'], name='booking_sitter_revenue_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
         """
-        Calcule le prix total de la réservation (10€ par jour).
-        Calculates the total price of the booking (10€ per day).
+        Recopie le propriétaire de l'animal et recalcule la durée et le prix, sauf pour un
+        enregistrement partiel (update_fields) qui ne touche pas aux dates.
+        Copies the animal's owner and recomputes the duration and price, except for a
+        partial save (update_fields) that leaves the dates alone.
         """
-        return self.total_days * 10
+        from .pricing import set_booking_totals
+
+        self.owner_id = self.animal.owner_id
+        if kwargs.get('update_fields') is None:
+            set_booking_totals([self])
+        super().save(*args, **kwargs)
     
     def __str__(self):
         """
@@ -216,34 +314,60 @@ class CompanyBooking(models.Model):
         ('refused', 'Refusée'),
         ('cancelled', 'Annulée'),
         ('paid', 'Payée'),  # Added 'paid' status to match Booking model
+        ('expired', 'Expirée'),  # Demande restée sans réponse (voir core/expiry.py)
     ]
 
+    # Statuts qui occupent une place dans l'entreprise
+    OCCUPYING_STATUSES = ['accepted', 'paid']
+
+    # Statuts qui bloquent les dates de l'animal
+    ACTIVE_STATUSES = ['pending', 'accepted', 'paid']
+
     animal = models.ForeignKey(Animal, on_delete=models.CASCADE)
+    # Propriétaire de l'animal, recopié pour filtrer sans jointure sur Animal
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owner_company_bookings', editable=False)
     company = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'company'})
     start_date = models.DateField()
     end_date = models.DateField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     company_paid = models.BooleanField(default=False)  # Track if the company has paid their share
+    # Durée et prix calculés à l'enregistrement (voir core/pricing.py), pour trier et agréger en base
+    total_days = models.PositiveIntegerField(default=0, editable=False)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # Série récurrente dont la réservation est une occurrence confirmée
+    series = models.ForeignKey(
+        'CompanyBookingSeries', on_delete=models.SET_NULL, related_name='bookings', null=True, blank=True
+    )
 
-    @property
-    def total_days(self):
-        """
-        Calcule le nombre total de jours de garde (inclut le premier et le dernier jour).
-        Calculates the total number of days for the booking (includes first and last day).
-        """
-        start_date = self.start_date
-        end_date = self.end_date
-        delta = end_date - start_date
-        return delta.days + 1  # Inclure le premier jour
-    
-    @property
-    def total_price(self):
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'status', 'end_date'], name='cbooking_company_status_idx'),
+            # Vérification des chevauchements de l'animal (voir core/availability.py)
+            models.Index(fields=['animal', 'status', 'start_date', 'end_date'], name='cbooking_animal_overlap_idx'),
+            # Expiration des demandes en attente (voir core/expiry.py)
+            models.Index(fields=['status', 'created_at'], name='cbooking_status_created_idx'),
+            models.Index(fields=['status', 'start_date'], name='cbooking_status_start_idx'),
+            # Tableau de bord du propriétaire
+            models.Index(fields=['owner', 'status', 'start_date'], name='cbooking_owner_status_idx'),
+            # Tri par prix et chiffre d'affaires de l'entreprise, calculés en base
+            models.Index(fields=['owner', 'total_price'], name='cbooking_owner_price_idx'),
+            models.Index(fields=['company', 'status', 'start_date', 'total_price'], name='cbooking_company_revenue_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
         """
-        Calcule le prix total de la réservation (10€ par jour).
-        Calculates the total price of the booking (10€ per day).
+        Recopie le propriétaire de l'animal et recalcule la durée et le prix, sauf pour un
+        enregistrement partiel (update_fields) qui ne touche pas aux dates.
+        Copies the animal's owner and recomputes the duration and price, except for a
+        partial save (update_fields) that leaves the dates alone.
         """
-        return self.total_days * 10
+        from .pricing import set_booking_totals
+
+        self.owner_id = self.animal.owner_id
+        if kwargs.get('update_fields') is None:
+            set_booking_totals([self])
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """
@@ -252,6 +376,67 @@ class CompanyBooking(models.Model):
         """
         return f"{self.animal.name} à {self.company.name} du {self.start_date} au {self.end_date}"
 
+class CompanyBookingSeries(models.Model):
+    """
+    Réservation récurrente auprès d'une entreprise (ex. garderie tous les mardis pendant six mois).
+    Les occurrences sont calculées à la demande à partir de la règle ; seules les occurrences
+    confirmées ou payées sont enregistrées, comme CompanyBooking liées à la série.
+    Recurring booking with a company (e.g. daycare every Tuesday for six months).
+    Occurrences are computed on demand from the rule; only confirmed or paid occurrences
+    are stored, as CompanyBooking rows linked to the series.
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('cancelled', 'Annulée'),
+    ]
+
+    animal = models.ForeignKey(Animal, on_delete=models.CASCADE)
+    company = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'role': 'company'})
+    # Première occurrence (fixe le jour de la semaine) et date limite incluse
+    start_date = models.DateField()
+    end_date = models.DateField()
+    interval_weeks = models.PositiveSmallIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['animal', 'status', 'start_date', 'end_date'], name='series_animal_overlap_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Renvoie une représentation textuelle de la série.
+        Returns a string representation of the series.
+        """
+        return (
+            f"{self.animal.name} à {self.company.name} toutes les {self.interval_weeks} semaine(s) "
+            f"du {self.start_date} au {self.end_date}"
+        )
+
+class CompanyOccupancy(models.Model):
+    """
+    Projection du nombre de places occupées par jour et par entreprise, maintenue
+    à chaque changement de statut d'une réservation d'entreprise.
+    Per-day, per-company projection of occupied places, maintained whenever
+    a company booking changes status.
+    """
+    company = models.ForeignKey(User, on_delete=models.CASCADE, related_name='occupancy', limit_choices_to={'role': 'company'})
+    day = models.DateField()
+    occupied = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'day'], name='unique_company_occupancy_day'),
+        ]
+
+    def __str__(self):
+        """
+        Renvoie une représentation textuelle de l'occupation.
+        Returns a string representation of the occupancy.
+        """
+        return f"{self.company.name} le {self.day}: {self.occupied}"
+
 class PetSitterCompanyBooking(models.Model):
     """
     Modèle pour les réservations de services professionnels entre pet-sitters et entreprises.
@@ -286,6 +471,48 @@ class PetSitterCompanyBooking(models.Model):
         """
         return f"{self.petsitter.name} avec {self.company.name} ({self.get_service_type_display()}) du {self.start_date} au {self.end_date}"
 
+class PricingRule(models.Model):
+    """
+    Règle de tarification : majoration (ou remise si négative) en pourcentage du tarif journalier.
+    Pricing rule: surcharge (or discount if negative) as a percentage of the daily rate.
+    """
+    RULE_TYPE_CHOICES = [
+        ('animal_type', "Type d'animal"),  # Chaque jour de garde d'un type d'animal
+        ('weekend', 'Week-end'),  # Chaque samedi et dimanche
+        ('season', 'Saison'),  # Chaque jour entre start_date et end_date
+    ]
+
+    # Vide : règle commune à tous les prestataires, remplacée par les règles du même type du prestataire
+    provider = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pricing_rules', null=True, blank=True)
+    rule_type = models.CharField(max_length=20, choices=RULE_TYPE_CHOICES)
+    animal_type = models.CharField(max_length=10, choices=Animal.ANIMAL_TYPE_CHOICES, blank=True)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    percent = models.DecimalField(max_digits=6, decimal_places=2)
+
+    def clean(self):
+        """
+        Valide les champs requis par le type de règle.
+        Validates the fields required by the rule type.
+        """
+        from django.core.exceptions import ValidationError
+
+        if self.rule_type == 'animal_type' and not self.animal_type:
+            raise ValidationError('An animal type is required for animal type rules')
+        if self.rule_type == 'season':
+            if not self.start_date or not self.end_date:
+                raise ValidationError('Start and end dates are required for season rules')
+            if self.start_date > self.end_date:
+                raise ValidationError('The start date must be before the end date')
+
+    def __str__(self):
+        """
+        Renvoie une représentation textuelle de la règle de tarification.
+        Returns a string representation of the pricing rule.
+        """
+        provider = self.provider.name if self.provider else 'all providers'
+        return f"{self.get_rule_type_display()} {self.percent:+}% for {provider}"
+
 class Payment(models.Model):
     """
     Modèle pour stocker les informations de paiement pour les réservations.
@@ -306,11 +533,31 @@ class Payment(models.Model):
     
     booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='payments', null=True, blank=True)
     company_booking = models.ForeignKey(CompanyBooking, on_delete=models.CASCADE, related_name='payments', null=True, blank=True)
+    # Propriétaire de l'animal de la réservation payée (vide pour les paiements entre pet-sitters et entreprises)
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='owner_payments', null=True, blank=True, editable=False
+    )
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     payment_date = models.DateTimeField(auto_now_add=True)
     payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='pending')
     payment_type = models.CharField(max_length=10, choices=PAYMENT_TYPE_CHOICES, default='card')
-    transaction_id = models.CharField(max_length=100, null=True, blank=True)
+    # Identifiant unique de la transaction (voir core/transaction_ids.py), indexé pour le rapprochement
+    transaction_id = models.CharField(max_length=100, null=True, blank=True, unique=True)
+
+    class Meta:
+        indexes = [
+            # Paiements du propriétaire (voir PaymentViewSet)
+            models.Index(fields=['owner', 'payment_status', 'payment_date'], name='payment_owner_status_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Recopie le propriétaire de la réservation payée.
+        Copies the owner of the paid booking.
+        """
+        booking = self.booking or self.company_booking
+        self.owner_id = booking.owner_id if booking else None
+        super().save(*args, **kwargs)
     
     def __str__(self):
         """
@@ -322,3 +569,43 @@ class Payment(models.Model):
         elif self.company_booking:
             return f"Payment of {self.amount}€ for a booking compagny #{self.company_booking.id}"
         return f"Payment of {self.amount}€"
+
+class IdempotencyKey(models.Model):
+    """
+    Réponse enregistrée d'une requête de paiement, rejouée si le client renvoie la même clé.
+    Stored response of a payment request, replayed when the client sends the same key again.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)  # En-tête Idempotency-Key envoyé par le client
+    endpoint = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # Empreinte de la requête (méthode, chemin, corps)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # Vide tant que la requête est en cours
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+
+    def __str__(self):
+        """
+        Renvoie une représentation textuelle de la clé d'idempotence.
+        Returns a string representation of the idempotency key.
+        """
+        return f"Idempotency key {self.key} of {self.user.name}"
+
+class CacheVersion(models.Model):
+    """
+    Version d'une portée de cache (voir core/caching.py), partagée par tous les processus.
+    Version of a cache scope (see core/caching.py), shared by every process.
+    """
+    scope = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        """
+        Renvoie une représentation textuelle de la version.
+        Returns a string representation of the version.
+        """
+        return f"{self.scope}: {self.version}"
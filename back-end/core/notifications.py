@@ -0,0 +1,453 @@
+import logging
+import queue
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import send_mail, send_mass_mail
+from django.db import connections
+
+from .models import PetSitterCompanyBooking
+
+logger = logging.getLogger(__name__)
+
+# Notification jobs waiting to be sent by the background worker
+jobs = queue.Queue()
+worker_lock = threading.Lock()
+worker = None
+
+
+def run_jobs():
+    """
+    Background worker: sends the queued notifications one job at a time.
+    """
+    while True:
+        func, args = jobs.get()
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Error sending notification email')
+        finally:
+            # The worker has its own database connection, released between jobs
+            connections.close_all()
+            jobs.task_done()
+
+
+def enqueue(func, *args):
+    """
+    Hands a notification job to the background worker, so that the request does not wait
+    for the mail server. With ASYNC_NOTIFICATIONS = False the job runs immediately.
+    """
+    global worker
+    if not getattr(settings, 'ASYNC_NOTIFICATIONS', True):
+        func(*args)
+        return
+    with worker_lock:
+        if worker is None or not worker.is_alive():
+            worker = threading.Thread(target=run_jobs, name='notifications', daemon=True)
+            worker.start()
+    jobs.put((func, args))
+
+
+def wait_for_notifications():
+    """
+    Blocks until every queued notification has been sent (management commands, tests).
+    """
+    jobs.join()
+
+
+# Helper function to send emails at each step of the booking process
+def send_summaries(build_messages, *args):
+    """
+    Builds (subject, message, from_email, recipients) tuples with build_messages(*args) and
+    sends them over a single connection.
+    """
+    try:
+        send_mass_mail(build_messages(*args), fail_silently=True)
+    except Exception:
+        logger.exception('Error sending notification email')
+        # Don't fail the operation if email sending fails
+
+
+def send_booking_status_email(booking, status, booking_type='standard'):
+    """
+    Sends a notification email to inform users about a change in booking status.
+    
+    Args:
+        booking: The booking object (Booking, CompanyBooking or PetSitterCompanyBooking)
+        status: The new status of the booking
+        booking_type: The type of booking ('standard', 'company', or 'petsitter_company')
+    """
+    try:
+        # Prepare details based on booking type
+        if booking_type == 'standard':
+            # Standard booking (pet owner -> pet sitter)
+            pet_owner = booking.animal.owner
+            pet_sitter = booking.sitter
+            animal = booking.animal
+            start_date = booking.start_date
+            end_date = booking.end_date
+            
+            # Email to pet owner
+            owner_subject = f"Booking update - {animal.name}"
+            owner_message = f"""Hello {pet_owner.name},
+
+The status of your booking for {animal.name} with {pet_sitter.name} has been updated.
+
+New status: {status}
+Dates: {start_date} to {end_date}
+
+"""
+            if status == 'pending':
+                owner_message += "Your booking request has been registered and is awaiting confirmation from the pet sitter."
+            elif status == 'accepted':
+                owner_message += "Your booking has been accepted by the pet sitter. You can now proceed to payment."
+            elif status == 'refused':
+                owner_message += "We're sorry, but your booking request has been declined by the pet sitter."
+            elif status == 'cancelled':
+                owner_message += "Your booking has been cancelled as requested."
+            elif status == 'paid':
+                owner_message += "Your payment has been confirmed. Your booking is now finalized."
+            elif status == 'expired':
+                owner_message += "Your booking request has expired without an answer. You can send a new request."
+            
+            owner_message += "\n\nThank you for using Pet at Work!"
+            
+            send_mail(
+                owner_subject,
+                owner_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [pet_owner.email],
+                fail_silently=True,
+            )
+            
+            # Email to pet sitter
+            sitter_subject = f"Booking update - {animal.name}"
+            sitter_message = f"""Hello {pet_sitter.name},
+
+The status of a booking for the pet {animal.name} from {pet_owner.name} has been updated.
+
+New status: {status}
+Dates: {start_date} to {end_date}
+
+"""
+            if status == 'pending':
+                sitter_message += "A new booking request has been registered. Please accept or decline it from your personal area."
+            elif status == 'accepted':
+                sitter_message += "You have accepted this booking. The pet owner has been notified."
+            elif status == 'refused':
+                sitter_message += "You have declined this booking. The pet owner has been notified."
+            elif status == 'cancelled':
+                sitter_message += "This booking has been cancelled by the pet owner."
+            elif status == 'paid':
+                sitter_message += "Payment for this booking has been confirmed. The booking is now finalized."
+            elif status == 'expired':
+                sitter_message += "This booking request has expired without an answer."
+            
+            sitter_message += "\n\nThank you for using Pet at Work!"
+            
+            send_mail(
+                sitter_subject,
+                sitter_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [pet_sitter.email],
+                fail_silently=True,
+            )
+            
+        elif booking_type == 'company':
+            # Company booking (pet owner -> company)
+            pet_owner = booking.animal.owner
+            company = booking.company
+            animal = booking.animal
+            start_date = booking.start_date
+            end_date = booking.end_date
+            
+            # Email to pet owner
+            owner_subject = f"Company booking update - {animal.name}"
+            owner_message = f"""Hello {pet_owner.name},
+
+The status of your booking for {animal.name} with {company.name} has been updated.
+
+New status: {status}
+Dates: {start_date} to {end_date}
+
+"""
+            if status == 'pending':
+                owner_message += "Your booking request has been registered and is awaiting confirmation from the company."
+            elif status == 'accepted':
+                owner_message += "Your booking has been accepted by the company. You can now proceed to payment."
+            elif status == 'refused':
+                owner_message += "We're sorry, but your booking request has been declined by the company."
+            elif status == 'cancelled':
+                owner_message += "Your booking has been cancelled as requested."
+            elif status == 'paid':
+                owner_message += "Your payment has been confirmed. Your booking is now finalized."
+            elif status == 'expired':
+                owner_message += "Your booking request has expired without an answer. You can send a new request."
+            
+            owner_message += "\n\nThank you for using Pet at Work!"
+            
+            send_mail(
+                owner_subject,
+                owner_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [pet_owner.email],
+                fail_silently=True,
+            )
+            
+            # Email to company
+            company_subject = f"Booking update - {animal.name}"
+            company_message = f"""Hello {company.name},
+
+The status of a booking for the pet {animal.name} from {pet_owner.name} has been updated.
+
+New status: {status}
+Dates: {start_date} to {end_date}
+
+"""
+            if status == 'pending':
+                company_message += "A new booking request has been registered. Please accept or decline it from your company dashboard."
+            elif status == 'accepted':
+                company_message += "You have accepted this booking. The pet owner has been notified."
+            elif status == 'refused':
+                company_message += "You have declined this booking. The pet owner has been notified."
+            elif status == 'cancelled':
+                company_message += "This booking has been cancelled by the pet owner."
+            elif status == 'paid':
+                company_message += "Payment for this booking has been confirmed. The booking is now finalized."
+            elif status == 'expired':
+                company_message += "This booking request has expired without an answer."
+            
+            company_message += "\n\nThank you for using Pet at Work!"
+            
+            send_mail(
+                company_subject,
+                company_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [company.email],
+                fail_silently=True,
+            )
+            
+        elif booking_type == 'petsitter_company':
+            # Pet sitter -> company booking
+            pet_sitter = booking.petsitter
+            company = booking.company
+            start_date = booking.start_date
+            end_date = booking.end_date
+            
+            # Email to pet sitter
+            sitter_subject = f"Booking update with {company.name}"
+            sitter_message = f"""Hello {pet_sitter.name},
+
+The status of your booking with {company.name} has been updated.
+
+New status: {status}
+Dates: {start_date} to {end_date}
+Service: {booking.get_service_type_display()}
+
+"""
+            if status == 'pending':
+                sitter_message += "Your booking request has been registered and is awaiting confirmation from the company."
+            elif status == 'accepted':
+                sitter_message += "Your booking has been accepted by the company."
+            elif status == 'refused':
+                sitter_message += "We're sorry, but your booking request has been declined by the company."
+            elif status == 'cancelled':
+                sitter_message += "Your booking has been cancelled as requested."
+            elif status == 'finished':
+                sitter_message += "Your booking is now completed."
+            
+            sitter_message += "\n\nThank you for using Pet at Work!"
+            
+            send_mail(
+                sitter_subject,
+                sitter_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [pet_sitter.email],
+                fail_silently=True,
+            )
+            
+            # Email to company
+            company_subject = f"Booking update with {pet_sitter.name}"
+            company_message = f"""Hello {company.name},
+
+The status of a booking from pet sitter {pet_sitter.name} has been updated.
+
+New status: {status}
+Dates: {start_date} to {end_date}
+Service: {booking.get_service_type_display()}
+
+"""
+            if status == 'pending':
+                company_message += "A new booking request has been registered. Please accept or decline it from your company dashboard."
+            elif status == 'accepted':
+                company_message += "You have accepted this booking. The pet sitter has been notified."
+            elif status == 'refused':
+                company_message += "You have declined this booking. The pet sitter has been notified."
+            elif status == 'cancelled':
+                company_message += "This booking has been cancelled by the pet sitter."
+            elif status == 'finished':
+                company_message += "This booking is now completed."
+            
+            company_message += "\n\nThank you for using Pet at Work!"
+            
+            send_mail(
+                company_subject,
+                company_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [company.email],
+                fail_silently=True,
+            )
+    
+    except Exception:
+        logger.exception('Error sending notification email')
+
+
+def batch_booking_messages(bookings, company_bookings):
+    """
+    Builds the notification emails of a batch of new bookings: one summary per pet owner
+    and one per pet sitter or company, instead of two emails per booking.
+    Returns (subject, message, from_email, recipients) tuples for send_mass_mail.
+    """
+    items = [(booking, booking.sitter) for booking in bookings]
+    items += [(booking, booking.company) for booking in company_bookings]
+
+    by_owner = defaultdict(list)
+    by_provider = defaultdict(list)
+    for booking, provider in items:
+        by_owner[booking.animal.owner].append((booking, provider))
+        by_provider[provider].append(booking)
+
+    messages = []
+    for owner, owner_items in by_owner.items():
+        message = f"Hello {owner.name},\n\nYour booking requests have been registered and are awaiting confirmation:\n\n"
+        message += '\n'.join(
+            f"- {booking.animal.name} with {provider.name}: {booking.start_date} to {booking.end_date}"
+            for booking, provider in owner_items
+        )
+        message += "\n\nThank you for using Pet at Work!"
+        messages.append((
+            f"{len(owner_items)} new booking request(s)", message, settings.DEFAULT_FROM_EMAIL, [owner.email]
+        ))
+
+    for provider, provider_bookings in by_provider.items():
+        message = f"Hello {provider.name},\n\nNew booking requests have been registered. "
+        message += "Please accept or decline them from your personal area:\n\n"
+        message += '\n'.join(
+            f"- {booking.animal.name} from {booking.animal.owner.name}: {booking.start_date} to {booking.end_date}"
+            for booking in provider_bookings
+        )
+        message += "\n\nThank you for using Pet at Work!"
+        messages.append((
+            f"{len(provider_bookings)} new booking request(s)", message, settings.DEFAULT_FROM_EMAIL, [provider.email]
+        ))
+    return messages
+
+
+def send_batch_booking_emails(bookings, company_bookings):
+    """
+    Sends the notification emails of a batch of new bookings over a single connection.
+    """
+    send_summaries(batch_booking_messages, bookings, company_bookings)
+
+
+def cancelled_collaboration_messages(collaborations):
+    """
+    Builds the notification emails of pet sitter/company bookings cancelled by a cascade:
+    one summary per pet sitter and one per company.
+    Returns (subject, message, from_email, recipients) tuples for send_mass_mail.
+    """
+    by_sitter = defaultdict(list)
+    by_company = defaultdict(list)
+    for collaboration in collaborations:
+        by_sitter[collaboration.petsitter].append(collaboration)
+        by_company[collaboration.company].append(collaboration)
+
+    messages = []
+    for sitter, sitter_collaborations in by_sitter.items():
+        message = f"Hello {sitter.name},\n\nThe following bookings with companies have been cancelled:\n\n"
+        message += '\n'.join(
+            f"- {collaboration.company.name} ({collaboration.get_service_type_display()}): "
+            f"{collaboration.start_date} to {collaboration.end_date}"
+            for collaboration in sitter_collaborations
+        )
+        message += "\n\nThank you for using Pet at Work!"
+        messages.append((
+            f"{len(sitter_collaborations)} booking(s) with companies cancelled", message,
+            settings.DEFAULT_FROM_EMAIL, [sitter.email]
+        ))
+
+    for company, company_collaborations in by_company.items():
+        message = f"Hello {company.name},\n\nThe following bookings from pet sitters have been cancelled:\n\n"
+        message += '\n'.join(
+            f"- {collaboration.petsitter.name} ({collaboration.get_service_type_display()}): "
+            f"{collaboration.start_date} to {collaboration.end_date}"
+            for collaboration in company_collaborations
+        )
+        message += "\n\nThank you for using Pet at Work!"
+        messages.append((
+            f"{len(company_collaborations)} booking(s) from pet sitters cancelled", message,
+            settings.DEFAULT_FROM_EMAIL, [company.email]
+        ))
+    return messages
+
+
+def send_cancelled_collaboration_emails(collaboration_ids):
+    """
+    Sends the notification emails of cancelled pet sitter/company bookings over a single
+    connection. Meant to run in the background worker: the rows are read there.
+    """
+    collaborations = PetSitterCompanyBooking.objects.select_related('petsitter', 'company').filter(
+        id__in=collaboration_ids
+    ).order_by('start_date', 'id')
+    send_summaries(cancelled_collaboration_messages, collaborations)
+
+
+def booking_parties(booking):
+    """
+    Returns (type label, [(user, counterpart)]) for a booking of any of the three models:
+    the users to notify, each with the other party shown in their summary.
+    """
+    if isinstance(booking, PetSitterCompanyBooking):
+        return 'petsitter_company', [(booking.petsitter, booking.company), (booking.company, booking.petsitter)]
+    provider = booking.sitter if hasattr(booking, 'sitter') else booking.company
+    return (
+        'standard' if hasattr(booking, 'sitter') else 'company',
+        [(booking.animal.owner, provider), (provider, booking.animal.owner)]
+    )
+
+
+def status_change_messages(bookings, status):
+    """
+    Builds the notification emails of a batch status change: one summary per user involved.
+    Returns (subject, message, from_email, recipients) tuples for send_mass_mail.
+    """
+    by_user = defaultdict(list)
+    for booking in bookings:
+        for user, counterpart in booking_parties(booking)[1]:
+            by_user[user].append((booking, counterpart))
+
+    messages = []
+    for user, user_bookings in by_user.items():
+        message = f"Hello {user.name},\n\nThe following bookings are now {status}:\n\n"
+        message += '\n'.join(
+            f"- {booking.animal.name + ' with ' if hasattr(booking, 'animal') else ''}{counterpart.name}: "
+            f"{booking.start_date} to {booking.end_date}"
+            for booking, counterpart in user_bookings
+        )
+        message += "\n\nThank you for using Pet at Work!"
+        messages.append((
+            f"{len(user_bookings)} booking(s) {status}", message, settings.DEFAULT_FROM_EMAIL, [user.email]
+        ))
+    return messages
+
+
+def send_status_change_emails(bookings, status):
+    """
+    Notifies a status change: the detailed email for a single booking, one summary
+    per user over a single connection for a batch.
+    """
+    if len(bookings) == 1:
+        send_booking_status_email(bookings[0], status, booking_parties(bookings[0])[0])
+        return
+    send_summaries(status_change_messages, bookings, status)
@@ -0,0 +1,147 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import CompanyBooking, CompanyOccupancy
+
+
+def booking_days(start_date, end_date):
+    """
+    Returns every day covered by a booking (first and last day included).
+    """
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def count_occupancy(bookings):
+    """
+    Counts occupied places per (company_id, day) for (company_id, start_date, end_date) tuples.
+    """
+    counts = Counter()
+    for company_id, start_date, end_date in bookings:
+        for day in booking_days(start_date, end_date):
+            counts[(company_id, day)] += 1
+    return counts
+
+
+def shift_occupancy(company_id, start_date, end_date, delta):
+    """
+    Adds delta occupied places to a company for every day of a date range.
+    Missing days are created first so the update stays a single range UPDATE.
+    """
+    CompanyOccupancy.objects.bulk_create(
+        [CompanyOccupancy(company_id=company_id, day=day) for day in booking_days(start_date, end_date)],
+        ignore_conflicts=True
+    )
+    CompanyOccupancy.objects.filter(
+        company_id=company_id,
+        day__gte=start_date,
+        day__lte=end_date
+    ).update(occupied=F('occupied') + delta)
+
+
+def shift_occupancy_days(company_id, days, delta):
+    """
+    Adds delta occupied places to a company on a set of (non contiguous) days,
+    with one insert of the missing days and one UPDATE.
+    """
+    CompanyOccupancy.objects.bulk_create(
+        [CompanyOccupancy(company_id=company_id, day=day) for day in days],
+        ignore_conflicts=True
+    )
+    CompanyOccupancy.objects.filter(company_id=company_id, day__in=days).update(occupied=F('occupied') + delta)
+
+
+def shift_bookings_occupancy(bookings, delta):
+    """
+    Adds delta occupied places for every day of several company bookings, with one insert
+    of the missing days and one UPDATE per company and number of bookings covering a day.
+    """
+    counts = count_occupancy((booking.company_id, booking.start_date, booking.end_date) for booking in bookings)
+    if not counts:
+        return
+    CompanyOccupancy.objects.bulk_create(
+        [CompanyOccupancy(company_id=company_id, day=day) for company_id, day in counts],
+        ignore_conflicts=True
+    )
+    days_by_count = defaultdict(list)
+    for (company_id, day), count in counts.items():
+        days_by_count[(company_id, count)].append(day)
+    for (company_id, count), days in days_by_count.items():
+        CompanyOccupancy.objects.filter(company_id=company_id, day__in=days).update(
+            occupied=F('occupied') + count * delta
+        )
+
+
+def update_company_occupancy(booking, old_status=None):
+    """
+    Updates the occupancy projection after a company booking was created (old_status=None)
+    or changed status. Must run in the same transaction as the booking change.
+    """
+    was_occupying = old_status in CompanyBooking.OCCUPYING_STATUSES
+    is_occupying = booking.status in CompanyBooking.OCCUPYING_STATUSES
+    if was_occupying == is_occupying:
+        return
+    shift_occupancy(booking.company_id, booking.start_date, booking.end_date, 1 if is_occupying else -1)
+
+
+def release_company_occupancy(booking):
+    """
+    Frees the places of a company booking that is about to be deleted.
+    """
+    if booking.status in CompanyBooking.OCCUPYING_STATUSES:
+        shift_occupancy(booking.company_id, booking.start_date, booking.end_date, -1)
+
+
+def peak_occupancy(company_id, start_date, end_date):
+    """
+    Returns the highest number of occupied places of a company over a date range.
+    """
+    peak = CompanyOccupancy.objects.filter(
+        company_id=company_id,
+        day__gte=start_date,
+        day__lte=end_date
+    ).aggregate(peak=Max('occupied'))['peak']
+    return peak or 0
+
+
+def with_free_capacity(companies, start_date=None, end_date=None):
+    """
+    Filters a company queryset down to the companies whose busiest day between
+    start_date and end_date (each bound optional) stays below their capacity.
+    The peak is read from the occupancy projection in a correlated subquery.
+    """
+    occupancy = CompanyOccupancy.objects.filter(company=OuterRef('pk'))
+    if start_date:
+        occupancy = occupancy.filter(day__gte=start_date)
+    if end_date:
+        occupancy = occupancy.filter(day__lte=end_date)
+    peak = occupancy.values('company').annotate(peak=Max('occupied')).values('peak')
+
+    return companies.filter(capacity__gt=0).annotate(
+        occupied=Coalesce(Subquery(peak), 0)
+    ).filter(
+        occupied__lt=F('capacity')
+    )
+
+
+def rebuild_company_occupancy():
+    """
+    Rebuilds the whole occupancy projection from the company bookings.
+    Returns the number of (company, day) rows written.
+    """
+    bookings = CompanyBooking.objects.filter(
+        status__in=CompanyBooking.OCCUPYING_STATUSES
+    ).values_list('company_id', 'start_date', 'end_date').iterator()
+    counts = count_occupancy(bookings)
+
+    with transaction.atomic():
+        CompanyOccupancy.objects.all().delete()
+        CompanyOccupancy.objects.bulk_create(
+            [CompanyOccupancy(company_id=company_id, day=day, occupied=occupied)
+             for (company_id, day), occupied in counts.items()],
+            batch_size=1000
+        )
+    return len(counts)
@@ -0,0 +1,138 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Default pagination for every list endpoint.
+    Uses an opaque cursor (the primary key by default) so each page is an index range scan,
+    whatever the size of the table. The client can adjust the page size with ?page_size= (max 200).
+
+    DRF's cursor only stores the first ordering field and an offset among the rows sharing
+    its value, capped at 1000: sorted by price or duration, a page deep inside a long run of
+    equal prices is an OFFSET scan, and past the cap it cannot be reached. Here the cursor
+    stores every ordering field of the last row, the primary key included, and the next page
+    is the rows after it: (total_price, id) > (12.80, 42) is
+    total_price > 12.80 OR (total_price = 12.80 AND id > 42).
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        """
+        ?ordering= on a non-unique column (total_price, start_date...) gets the primary key
+        as a tiebreaker, in the same direction, so that every row has its own position.
+        """
+        ordering = super().get_ordering(request, queryset, view)
+        if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        CursorPagination.paginate_queryset with a position made of every ordering field.
+        The positions are unique, so the links built by CursorPagination never need an offset.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self.keyset_filter(current_position, reverse))
+
+        # One extra row tells whether there is a following page
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def keyset_filter(self, position, reverse):
+        """
+        Rows after a position in the ordering (before it for a reverse cursor).
+        The first field is also bounded on its own (total_price >= 12.80) so the database
+        starts the index scan at the position instead of at the start of the index.
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        after = Q()
+        equal = {}
+        for order, value in zip(self.ordering, values):
+            field = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            after |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        first = self.ordering[0]
+        lookup = 'lte' if first.startswith('-') != reverse else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{lookup}': values[0]}) & after
+
+    def _get_position_from_instance(self, instance, ordering):
+        """
+        Position of a row: the values of every ordering field, as strings in a JSON list.
+        """
+        values = []
+        for order in ordering:
+            field_name = order.lstrip('-')
+            value = instance[field_name] if isinstance(instance, dict) else getattr(instance, field_name)
+            values.append(str(value))
+        return json.dumps(values)
+
+
+class DirectoryPagination(PageNumberPagination):
+    """
+    Pagination for the pet sitter / company directory.
+    The client can adjust the page size with ?page_size= (max 100).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,248 @@
+"""
+Booking prices.
+
+A provider (pet sitter or company) charges its daily rate (DEFAULT_DAILY_RATE if it has
+none) for every day of a booking, plus the percentages of the pricing rules that apply
+to each day:
+- animal_type: every day, for the given animal type
+- weekend: every Saturday and Sunday
+- season: every day between the start and end dates of the rule
+
+Rules without a provider apply to every provider; a provider's own rules replace the
+common rules of the same type (and, for animal types, of the same animal type). The
+payment adds the service fee (BOOKING_SERVICE_FEE) to the price.
+
+The rules of each provider are compiled once into a rule set, cached and versioned by
+the 'pricing' scope. Prices are then computed in closed form (number of weekend days,
+overlap with each season) without iterating over the days, so quoting a batch of
+(provider, dates) candidates costs one provider query, one version query and at most one
+rule query.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from .caching import PRICING_SCOPE, get_timeout, get_versions
+from .models import Animal, Booking, PricingRule, User
+
+KEY_PREFIX = 'pricing'
+CENT = Decimal('0.01')
+MAX_QUOTE_ITEMS = 500
+ANIMAL_TYPES = [animal_type for animal_type, _ in Animal.ANIMAL_TYPE_CHOICES]
+
+
+def default_daily_rate():
+    return Decimal(str(settings.DEFAULT_DAILY_RATE))
+
+
+def service_fee():
+    """
+    Service fee added to the price of every payment.
+    """
+    return Decimal(str(settings.BOOKING_SERVICE_FEE))
+
+
+def compile_rules(rules):
+    """
+    Compiles the rules of one provider (common rules first, then its own) into a rule set:
+    {'animal_type': {type: percent}, 'weekend': percent, 'seasons': [(start, end, percent)]}.
+    """
+    common = {'animal_type': {}, 'weekend': Decimal(0), 'seasons': []}
+    own = {'animal_type': {}, 'weekend': None, 'seasons': []}
+    for rule in rules:
+        target = own if rule.provider_id else common
+        if rule.rule_type == 'animal_type':
+            target['animal_type'][rule.animal_type] = target['animal_type'].get(rule.animal_type, 0) + rule.percent
+        elif rule.rule_type == 'weekend':
+            target['weekend'] = (target['weekend'] or 0) + rule.percent
+        elif rule.rule_type == 'season' and rule.start_date and rule.end_date:
+            target['seasons'].append((rule.start_date, rule.end_date, rule.percent))
+
+    return {
+        'animal_type': {**common['animal_type'], **own['animal_type']},
+        'weekend': common['weekend'] if own['weekend'] is None else own['weekend'],
+        'seasons': sorted(own['seasons'] or common['seasons']),
+    }
+
+
+def rule_sets(provider_ids):
+    """
+    Returns {provider id: compiled rule set}, read from the cache in one call. The rule
+    sets missing from the cache are compiled from one query and cached.
+    """
+    version = get_versions([PRICING_SCOPE])[0]
+    keys = {provider_id: f'{KEY_PREFIX}:{version}:{provider_id}' for provider_id in provider_ids}
+    cached = cache.get_many(keys.values())
+    result = {provider_id: cached[key] for provider_id, key in keys.items() if key in cached}
+
+    missing = [provider_id for provider_id in keys if provider_id not in result]
+    if missing:
+        rules = list(PricingRule.objects.filter(Q(provider__isnull=True) | Q(provider_id__in=missing)))
+        common = [rule for rule in rules if rule.provider_id is None]
+        compiled = {
+            provider_id: compile_rules(common + [rule for rule in rules if rule.provider_id == provider_id])
+            for provider_id in missing
+        }
+        cache.set_many({keys[provider_id]: rule_set for provider_id, rule_set in compiled.items()}, timeout=get_timeout())
+        result.update(compiled)
+    return result
+
+
+def weekend_days(start_date, end_date):
+    """
+    Number of Saturdays and Sundays between two dates (both included).
+    """
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        return 0
+    full_weeks, remainder = divmod(days, 7)
+    first_weekday = start_date.weekday()
+    return full_weeks * 2 + sum(1 for offset in range(remainder) if (first_weekday + offset) % 7 >= 5)
+
+
+def overlap_days(start_date, end_date, other_start, other_end):
+    """
+    Number of days shared by two date ranges (both included).
+    """
+    return max((min(end_date, other_end) - max(start_date, other_start)).days + 1, 0)
+
+
+def compute_price(daily_rate, rule_set, start_date, end_date, animal_type=None):
+    """
+    Price of a stay with a provider (without the service fee), rounded to the cent.
+    """
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        return Decimal(0)
+    # Sum over the days of the percentages applying to each day
+    percent_days = rule_set['animal_type'].get(animal_type, 0) * days
+    if rule_set['weekend']:
+        percent_days += rule_set['weekend'] * weekend_days(start_date, end_date)
+    for season_start, season_end, percent in rule_set['seasons']:
+        if season_start > end_date:
+            break
+        percent_days += percent * overlap_days(start_date, end_date, season_start, season_end)
+
+    price = daily_rate * days + daily_rate * Decimal(percent_days) / 100
+    return max(price, Decimal(0)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def quote_prices(items):
+    """
+    Prices a batch of stays: items are (provider, start_date, end_date, animal_type) with
+    provider a User. Returns the prices in the same order.
+    """
+    if not items:
+        return []
+    compiled = rule_sets({provider.id for provider, _, _, _ in items})
+    return [
+        compute_price(provider.daily_rate or default_daily_rate(), compiled[provider.id], start_date, end_date, animal_type)
+        for provider, start_date, end_date, animal_type in items
+    ]
+
+
+def set_booking_totals(bookings):
+    """
+    Sets total_days and total_price of pet sitter and company bookings (not saved), pricing
+    the whole list in one batch.
+    """
+    prices = quote_prices([
+        (
+            booking.sitter if isinstance(booking, Booking) else booking.company,
+            booking.start_date, booking.end_date, booking.animal.animal_type
+        )
+        for booking in bookings
+    ])
+    for booking, price in zip(bookings, prices):
+        booking.total_days = (booking.end_date - booking.start_date).days + 1
+        booking.total_price = price
+
+
+def collaboration_price(booking):
+    """
+    Price of a pet sitter/company booking: the pet sitter's rate, without animal surcharge.
+    """
+    return quote_prices([(booking.petsitter, booking.start_date, booking.end_date, None)])[0]
+
+
+def parse_quote_date(value):
+    """
+    Parses a YYYY-MM-DD date of a quote item, raises ValueError if it is invalid.
+    """
+    try:
+        parsed = parse_date(value) if isinstance(value, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'Invalid date "{value}", expected format YYYY-MM-DD')
+    return parsed
+
+
+def parse_quote_item(item, default_animal_type=None):
+    """
+    Validates the shape of one quote item. Returns (provider_id, start_date, end_date, animal_type).
+    Raises ValueError with the message returned to the client.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Each item must be an object')
+    if not item.get('provider'):
+        raise ValueError('Please specify a pet sitter or company')
+    if not item.get('start_date') or not item.get('end_date'):
+        raise ValueError('Start and end dates are required')
+    start_date = parse_quote_date(item['start_date'])
+    end_date = parse_quote_date(item['end_date'])
+    if start_date > end_date:
+        raise ValueError('The start date must be before the end date')
+    animal_type = item.get('animal_type', default_animal_type)
+    if animal_type is not None and animal_type not in ANIMAL_TYPES:
+        raise ValueError(f'Invalid animal type. Valid types are: {", ".join(ANIMAL_TYPES)}')
+    try:
+        return int(item['provider']), start_date, end_date, animal_type
+    except (TypeError, ValueError):
+        raise ValueError('Provider must be an id')
+
+
+def quote(items, default_animal_type=None):
+    """
+    Prices a batch of candidate stays in one pass. Returns one result per item, in the same order:
+    {'index', 'status': 'ok', 'provider', 'start_date', 'end_date', 'days', 'price', 'service_fee', 'total'}
+    or {'index', 'status': 'error', 'error'}.
+    """
+    results = [None] * len(items)
+    parsed = {}
+    for index, item in enumerate(items):
+        try:
+            parsed[index] = parse_quote_item(item, default_animal_type)
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+
+    providers = User.objects.filter(
+        id__in={provider_id for provider_id, _, _, _ in parsed.values()},
+        role__in=['petsitter', 'company'],
+        is_active=True
+    ).only('id', 'daily_rate').in_bulk()
+    valid = {index: values for index, values in parsed.items() if values[0] in providers}
+    for index in parsed.keys() - valid.keys():
+        results[index] = {'index': index, 'status': 'error', 'error': 'Pet sitter or company not found'}
+
+    fee = service_fee()
+    prices = quote_prices([
+        (providers[provider_id], start_date, end_date, animal_type)
+        for provider_id, start_date, end_date, animal_type in valid.values()
+    ])
+    for (index, (provider_id, start_date, end_date, _)), price in zip(valid.items(), prices):
+        results[index] = {
+            'index': index,
+            'status': 'ok',
+            'provider': provider_id,
+            'start_date': start_date,
+            'end_date': end_date,
+            'days': (end_date - start_date).days + 1,
+            'price': price,
+            'service_fee': fee,
+            'total': price + fee,
+        }
+    return results
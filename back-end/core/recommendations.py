@@ -0,0 +1,227 @@
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from .fulltext import stem_text, stem_word
+from .models import Booking, SitterFeatures, User
+
+# Keyword categories: bit of the feature mask -> stems searched in the texts
+KEYWORD_CATEGORIES = {
+    'dog': (1 << 0, ('chien', 'canin', 'dog')),
+    'cat': (1 << 1, ('chat', 'felin', 'cat')),
+    'nac': (1 << 2, ('nac', 'reptil', 'amphibien', 'rongeur', 'lapin', 'oiseau', 'furet')),
+    'horse': (1 << 3, ('equit', 'cheval', 'chevaux', 'poney')),
+    'medical': (1 << 4, ('soin', 'veterinair', 'medic', 'secour', 'malad', 'traitement', 'infirm')),
+    'senior': (1 << 5, ('age', 'senior', 'vieux', 'vieil')),
+    'large': (1 << 6, ('grand', 'gross', 'berger', 'molosse')),
+    'behavior': (1 << 7, ('comport', 'dress', 'educat', 'rehabilit')),
+}
+
+# Keywords go through the same stemmer as the texts they are compared to
+KEYWORD_STEMS = [(bit, tuple(stem_word(keyword) for keyword in keywords)) for bit, keywords in KEYWORD_CATEGORIES.values()]
+
+ANIMAL_TYPE_CATEGORIES = {
+    'dog': ['dog'],
+    'cat': ['cat'],
+    'other': ['nac', 'horse'],
+}
+
+# Default texts of the Animal model that carry no information (stemmed)
+NO_INFORMATION = {stem_text(text) for text in ('', 'Non spécifiée', 'Non spécifié', 'No known illnesses')}
+
+# Number of bits set for every possible keyword mask
+BIT_COUNTS = [bin(mask).count('1') for mask in range(1 << len(KEYWORD_CATEGORIES))]
+
+SENIOR_AGE = 10
+
+# Score weights
+KEYWORD_WEIGHT = 3.0
+ACCEPTANCE_WEIGHT = 2.0
+EXPERIENCE_WEIGHT = 0.2
+MAX_EXPERIENCE_YEARS = 10
+
+ACCEPTED_STATUSES = ['accepted', 'paid']
+REFUSED_STATUSES = ['refused']
+
+
+def keyword_mask(text):
+    """
+    Returns the bit mask of the keyword categories found in a text.
+    """
+    mask = 0
+    words = stem_text(text).split()
+    for bit, stems in KEYWORD_STEMS:
+        if any(word.startswith(stem) for word in words for stem in stems):
+            mask |= bit
+    return mask
+
+
+def animal_mask(animal):
+    """
+    Returns the bit mask of what a sitter should know to look after an animal.
+    """
+    mask = 0
+    for category in ANIMAL_TYPE_CATEGORIES.get(animal.animal_type, []):
+        mask |= KEYWORD_CATEGORIES[category][0]
+    if stem_text(animal.breed) not in NO_INFORMATION:
+        mask |= keyword_mask(animal.breed)
+    if stem_text(animal.maladie) not in NO_INFORMATION:
+        mask |= KEYWORD_CATEGORIES['medical'][0] | keyword_mask(animal.maladie)
+    age = re.search(r'\d+', animal.age or '')
+    if age and int(age.group()) >= SENIOR_AGE:
+        mask |= KEYWORD_CATEGORIES['senior'][0]
+    return mask
+
+
+def refresh_sitter_features(sitter):
+    """
+    Recomputes the text features of a pet sitter (called by User.save).
+    Booking counters are kept, they are maintained by record_booking_status.
+    """
+    SitterFeatures.objects.update_or_create(
+        sitter=sitter,
+        defaults={
+            'keywords': keyword_mask(sitter.experience),
+            'experience_years': sitter.experience_years,
+            'updated_at': timezone.now(),
+        }
+    )
+
+
+def record_booking_status(sitter_id, old_status, new_status):
+    """
+    Updates the acceptance counters of a sitter after a booking was created
+    (old_status=None), changed status or was deleted (new_status=None).
+    """
+    accepted_delta = (new_status in ACCEPTED_STATUSES) - (old_status in ACCEPTED_STATUSES)
+    refused_delta = (new_status in REFUSED_STATUSES) - (old_status in REFUSED_STATUSES)
+    if not accepted_delta and not refused_delta:
+        return
+    SitterFeatures.objects.filter(sitter_id=sitter_id).update(
+        accepted_count=F('accepted_count') + accepted_delta,
+        refused_count=F('refused_count') + refused_delta,
+        updated_at=timezone.now()
+    )
+
+
+def record_status_changes(changes):
+    """
+    Batch version of record_booking_status for (sitter_id, old_status, new_status) tuples:
+    the deltas are summed per sitter, with one UPDATE per sitter.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for sitter_id, old_status, new_status in changes:
+        deltas[sitter_id][0] += (new_status in ACCEPTED_STATUSES) - (old_status in ACCEPTED_STATUSES)
+        deltas[sitter_id][1] += (new_status in REFUSED_STATUSES) - (old_status in REFUSED_STATUSES)
+    now = timezone.now()
+    for sitter_id, (accepted_delta, refused_delta) in deltas.items():
+        if accepted_delta or refused_delta:
+            SitterFeatures.objects.filter(sitter_id=sitter_id).update(
+                accepted_count=F('accepted_count') + accepted_delta,
+                refused_count=F('refused_count') + refused_delta,
+                updated_at=now
+            )
+
+
+def rebuild_sitter_features():
+    """
+    Recomputes the features of every pet sitter. Returns the number of sitters.
+    """
+    sitters = User.objects.filter(role='petsitter').annotate(
+        accepted=Count('booking', filter=Q(booking__status__in=ACCEPTED_STATUSES)),
+        refused=Count('booking', filter=Q(booking__status__in=REFUSED_STATUSES)),
+    )
+    now = timezone.now()
+    features = [
+        SitterFeatures(
+            sitter_id=sitter.id,
+            keywords=keyword_mask(sitter.experience),
+            experience_years=sitter.experience_years,
+            accepted_count=sitter.accepted,
+            refused_count=sitter.refused,
+            updated_at=now
+        )
+        for sitter in sitters.iterator()
+    ]
+    with transaction.atomic():
+        SitterFeatures.objects.all().delete()
+        SitterFeatures.objects.bulk_create(features, batch_size=1000)
+    return len(features)
+
+
+class FeatureMatrix:
+    """
+    In-process snapshot of every sitter feature vector, stored as parallel lists.
+    It is reloaded (one query) only when a feature row changed since the last load,
+    which is detected with the latest updated_at and the row count. Requests finding
+    it stale queue on the lock and only the first one reloads it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.sitter_ids = []
+        self.keywords = []
+        self.base_scores = []
+
+    def refresh(self):
+        version = SitterFeatures.objects.aggregate(latest=Max('updated_at'), rows=Count('sitter'))
+        if version == self.version:
+            return
+        with self.lock:
+            # Reloaded by another request while this one waited for the lock
+            if version == self.version:
+                return
+            rows = SitterFeatures.objects.filter(sitter__is_active=True).values_list(
+                'sitter_id', 'keywords', 'experience_years', 'accepted_count', 'refused_count'
+            )
+            sitter_ids, keywords, base_scores = [], [], []
+            for sitter_id, mask, years, accepted, refused in rows:
+                # Smoothed acceptance rate, so that new sitters start at 0.5
+                acceptance = (accepted + 1) / (accepted + refused + 2)
+                sitter_ids.append(sitter_id)
+                keywords.append(mask)
+                base_scores.append(
+                    ACCEPTANCE_WEIGHT * acceptance + EXPERIENCE_WEIGHT * min(years, MAX_EXPERIENCE_YEARS)
+                )
+            self.sitter_ids, self.keywords, self.base_scores = sitter_ids, keywords, base_scores
+            self.version = version
+
+    def rank(self, mask, limit, excluded=()):
+        """
+        Scores every sitter in one pass and returns the best (sitter_id, score) pairs.
+        """
+        self.refresh()
+        scores = zip(
+            self.sitter_ids,
+            (KEYWORD_WEIGHT * BIT_COUNTS[mask & keywords] + base for keywords, base in zip(self.keywords, self.base_scores))
+        )
+        if excluded:
+            scores = ((sitter_id, score) for sitter_id, score in scores if sitter_id not in excluded)
+        return heapq.nlargest(limit, scores, key=lambda item: item[1])
+
+
+feature_matrix = FeatureMatrix()
+
+
+def recommend_sitters(animal, limit=10, start_date=None, end_date=None):
+    """
+    Returns the best (sitter, score) pairs for an animal. If dates are given,
+    sitters with an active booking overlapping them are left out.
+    """
+    excluded = set()
+    if start_date and end_date:
+        excluded = set(Booking.objects.filter(
+            status__in=Booking.ACTIVE_STATUSES,
+            start_date__lte=end_date,
+            end_date__gte=start_date
+        ).values_list('sitter_id', flat=True))
+
+    ranking = feature_matrix.rank(animal_mask(animal), limit, excluded)
+    sitters = User.objects.in_bulk([sitter_id for sitter_id, _ in ranking])
+    return [(sitters[sitter_id], round(score, 3)) for sitter_id, score in ranking if sitter_id in sitters]
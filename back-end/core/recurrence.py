@@ -0,0 +1,148 @@
+"""
+Recurring company bookings (CompanyBookingSeries).
+
+A series is stored as a rule only. Its occurrences are expanded on demand for a window
+(calendar views, overlap and capacity checks), and an occurrence becomes a CompanyBooking
+row only once the company confirms it, so a six-month series costs one row until then.
+"""
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.db import transaction
+
+from .availability import active_animal_bookings, occurrence_dates
+from .caching import AVAILABILITY_SCOPE, invalidate
+from .conditional import model_scope, user_scope
+from .models import CompanyBooking, CompanyOccupancy
+from .occupancy import shift_occupancy_days
+from .pricing import set_booking_totals
+
+MAX_SERIES_DAYS = 366
+MAX_INTERVAL_WEEKS = 4
+DEFAULT_CALENDAR_DAYS = 90
+
+
+def series_dates(series, date_from=None, date_to=None):
+    """
+    Lazily yields the occurrence dates of a series, optionally restricted to a window.
+    """
+    return occurrence_dates(series.start_date, series.end_date, series.interval_weeks, date_from, date_to)
+
+
+def occurrence_conflicts(animal_id, dates, exclude_series=None):
+    """
+    Returns the bookings and other series of an animal blocking at least one of the dates,
+    as {'bookings': [ids], 'company_bookings': [ids], 'series': [ids]}. The whole set is
+    checked with one query over its span instead of one query per date.
+    """
+    dates = sorted(dates)
+    conflicts = {'bookings': [], 'company_bookings': [], 'series': []}
+    if not dates:
+        return conflicts
+    for kind, row_id, _, start_date, end_date in active_animal_bookings([animal_id], dates[0], dates[-1]):
+        if kind == 'series' and row_id == exclude_series:
+            continue
+        # First date of the set on or after the start of the blocking range
+        index = bisect_left(dates, start_date)
+        if index < len(dates) and dates[index] <= end_date and row_id not in conflicts[kind]:
+            conflicts[kind].append(row_id)
+    return conflicts
+
+
+def full_dates(company, dates):
+    """
+    Returns the dates on which the company has no free place left, read from the
+    occupancy projection in one range query.
+    """
+    dates = sorted(dates)
+    if not dates:
+        return []
+    occupied = dict(CompanyOccupancy.objects.filter(
+        company=company,
+        day__gte=dates[0],
+        day__lte=dates[-1]
+    ).values_list('day', 'occupied'))
+    return [day for day in dates if occupied.get(day, 0) >= company.capacity]
+
+
+def series_calendar(series, date_from, date_to):
+    """
+    Returns the occurrences of a series between two dates: materialized occurrences carry
+    the status and id of their CompanyBooking, the others are 'pending' (or 'cancelled').
+    """
+    materialized = {
+        booking.start_date: booking
+        for booking in series.bookings.filter(start_date__gte=date_from, start_date__lte=date_to)
+    }
+    virtual_status = 'pending' if series.status == 'active' else 'cancelled'
+    calendar = []
+    for day in series_dates(series, date_from, date_to):
+        booking = materialized.get(day)
+        calendar.append({
+            'date': day,
+            'status': booking.status if booking else virtual_status,
+            'booking_id': booking.id if booking else None,
+        })
+    return calendar
+
+
+def confirm_occurrences(series, dates, status='accepted'):
+    """
+    Materializes occurrences of a series as CompanyBooking rows with the given status
+    and takes their places in the occupancy projection. Returns the created bookings.
+    Must run in the transaction holding the company row lock, after validate_confirmation.
+    """
+    bookings = [
+        CompanyBooking(
+            animal=series.animal,
+            owner_id=series.animal.owner_id,
+            company=series.company,
+            start_date=day,
+            end_date=day,
+            status=status,
+            series=series
+        )
+        for day in dates
+    ]
+    # bulk_create does not call save(): price the occurrences here
+    set_booking_totals(bookings)
+    CompanyBooking.objects.bulk_create(bookings)
+    if status in CompanyBooking.OCCUPYING_STATUSES:
+        shift_occupancy_days(series.company_id, dates, 1)
+
+    # bulk_create sends no post_save signal: bump the cache versions here
+    scopes = [
+        model_scope(CompanyBooking), AVAILABILITY_SCOPE,
+        user_scope(series.animal.owner_id), user_scope(series.company_id),
+    ]
+    transaction.on_commit(lambda: invalidate(*scopes))
+    return bookings
+
+
+def validate_confirmation(series, dates):
+    """
+    Checks that dates can be confirmed: occurrences of the active series, not confirmed
+    yet, and with a free place in the company. Returns an error message or None.
+    """
+    if series.status != 'active':
+        return 'This series is cancelled'
+    dates = sorted(set(dates))
+    occurrences = set(series_dates(series, dates[0], dates[-1]))
+    invalid = [day for day in dates if day not in occurrences]
+    if invalid:
+        return f'Not occurrences of this series: {", ".join(str(day) for day in invalid)}'
+    confirmed = series.bookings.filter(start_date__in=dates, status__in=CompanyBooking.ACTIVE_STATUSES)
+    if confirmed.exists():
+        return 'Some of these occurrences are already confirmed'
+    full = full_dates(series.company, dates)
+    if full:
+        return f'The company is full on: {", ".join(str(day) for day in full)}'
+    return None
+
+
+def default_window(date_from, date_to, today):
+    """
+    Returns the calendar window, from today and DEFAULT_CALENDAR_DAYS long by default.
+    """
+    date_from = date_from or today
+    return date_from, date_to or date_from + timedelta(days=DEFAULT_CALENDAR_DAYS)
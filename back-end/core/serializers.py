@@ -1,15 +1,17 @@
 from rest_framework import serializers
-from .models import User, Animal, Booking, CompanyBooking, PetSitterCompanyBooking, Payment
+from .models import User, Animal, Booking, CompanyBooking, CompanyBookingSeries, PetSitterCompanyBooking, Payment
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'name', 'email', 'password', 'role', 'address', 'experience', 'capacity']
+        fields = ['id', 'name', 'email', 'password', 'role', 'address', 'experience', 'capacity', 'daily_rate', 'latitude', 'longitude']
+        read_only_fields = ['latitude', 'longitude']
         extra_kwargs = {
             'password': {'write_only': True},
             'address': {'required': False},
             'experience': {'required': False},
-            'capacity': {'required': False}
+            'capacity': {'required': False},
+            'daily_rate': {'required': False}
         }
 
     def create(self, validated_data):
@@ -34,7 +36,7 @@ class AnimalSerializer(serializers.ModelSerializer):
 
 class BookingSerializer(serializers.ModelSerializer):
     total_days = serializers.IntegerField(read_only=True)
-    total_price = serializers.IntegerField(read_only=True)
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True, coerce_to_string=False)
     
     class Meta:
         model = Booking
@@ -42,11 +44,25 @@ class BookingSerializer(serializers.ModelSerializer):
 
 class CompanyBookingSerializer(serializers.ModelSerializer):
     total_days = serializers.IntegerField(read_only=True)
-    total_price = serializers.IntegerField(read_only=True)
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True, coerce_to_string=False)
     
     class Meta:
         model = CompanyBooking
-        fields = ['id', 'animal', 'company', 'start_date', 'end_date', 'status', 'created_at', 'total_days', 'total_price']
+        fields = ['id', 'animal', 'company', 'start_date', 'end_date', 'status', 'created_at', 'total_days', 'total_price', 'series']
+        read_only_fields = ['series']
+
+class CompanyBookingSeriesSerializer(serializers.ModelSerializer):
+    occurrence_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CompanyBookingSeries
+        fields = ['id', 'animal', 'company', 'start_date', 'end_date', 'interval_weeks', 'status', 'created_at', 'occurrence_count']
+        read_only_fields = ['status', 'created_at']
+
+    def get_occurrence_count(self, obj):
+        # Computed from the rule, occurrences are not stored
+        weeks = (obj.end_date - obj.start_date).days // 7
+        return weeks // obj.interval_weeks + 1 if obj.interval_weeks else 0
 
 class PetSitterCompanyBookingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import AVAILABILITY_SCOPE, DIRECTORY_SCOPE, PRICING_SCOPE, invalidate
+from .conditional import change_scopes
+from .fulltext import unindex_user
+from .models import Animal, Booking, CompanyBooking, CompanyBookingSeries, PetSitterCompanyBooking, Payment, PricingRule, User
+
+# Saves that do not change anything shown in the directory
+IGNORED_USER_FIELDS = {'last_login'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_directory_cache(sender, instance, update_fields=None, **kwargs):
+    """
+    Invalidates the cached directory responses when a user changes.
+    Runs after the commit, so a request cannot cache the data of a transaction being rolled back.
+    """
+    if update_fields and set(update_fields) <= IGNORED_USER_FIELDS:
+        return
+    transaction.on_commit(lambda: invalidate(DIRECTORY_SCOPE))
+
+
+@receiver(post_delete, sender=User)
+def remove_from_search_index(sender, instance, **kwargs):
+    """
+    Removes a deleted user from the full-text index (rolled back with the deletion).
+    """
+    unindex_user(instance.pk)
+
+
+@receiver(post_save, sender=CompanyBooking)
+@receiver(post_delete, sender=CompanyBooking)
+def invalidate_availability_cache(sender, instance, **kwargs):
+    """
+    Invalidates the cached company availability when a company booking changes
+    (the occupancy projection is updated in the same transaction).
+    """
+    transaction.on_commit(lambda: invalidate(AVAILABILITY_SCOPE))
+
+
+@receiver(post_save, sender=PricingRule)
+@receiver(post_delete, sender=PricingRule)
+def invalidate_pricing_cache(sender, instance, **kwargs):
+    """
+    Invalidates the compiled rule sets when a pricing rule changes.
+    """
+    transaction.on_commit(lambda: invalidate(PRICING_SCOPE))
+
+
+# Models whose changes are tracked by the ETag change counters (see core/conditional.py)
+VERSIONED_MODELS = [User, Animal, Booking, CompanyBooking, CompanyBookingSeries, PetSitterCompanyBooking, Payment]
+
+
+def bump_change_counters(sender, instance, update_fields=None, **kwargs):
+    """
+    Bumps the change counters of the model and of every user involved in the row,
+    so that the ETags of the responses showing it no longer match.
+    """
+    if sender is User and update_fields and set(update_fields) <= IGNORED_USER_FIELDS:
+        return
+    # The involved users are read now, while the related rows still exist
+    scopes = change_scopes(instance)
+    transaction.on_commit(lambda: invalidate(*scopes))
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_change_counters, sender=model, dispatch_uid=f'bump_change_counters_{model.__name__}')
+    post_delete.connect(bump_change_counters, sender=model, dispatch_uid=f'bump_change_counters_delete_{model.__name__}')
@@ -1,3 +1,1600 @@
-from django.test import TestCase
+import base64
+import threading
+import time
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from importlib import import_module
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import Count, Max, Q, QuerySet
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from . import expiry, idempotency
+from .availability import animal_conflicts, occurrence_dates
+from .cascade import cancel_linked_collaborations
+from .caching import DIRECTORY_SCOPE, get_versions, invalidate
+from .expiry import expire_stale_bookings
+from .fulltext import FTS_TABLE, search_users
+from .geocoding import distance_km, geocode
+from .idempotency import purge_expired_keys
+from .models import (
+    Animal, Booking, CompanyBooking, CompanyBookingSeries, CompanyOccupancy, IdempotencyKey,
+    PetSitterCompanyBooking, Payment, PricingRule, SitterFeatures, User
+)
+from .notifications import enqueue, send_batch_booking_emails, wait_for_notifications
+from .occupancy import peak_occupancy, rebuild_company_occupancy, shift_occupancy, with_free_capacity
+from .pagination import KeysetPagination
+from .pricing import compile_rules, compute_price, overlap_days, service_fee, weekend_days
+from .recommendations import KEYWORD_CATEGORIES, animal_mask, feature_matrix, keyword_mask, record_status_changes
+from .serializers import PaymentSerializer
+from .transaction_ids import ALPHABET, new_transaction_id, new_ulid
+from .transitions import (
+    StatusConflict, allowed_sources, apply_transition, booking_error, swap_status, transition_error
+)
+from .views import BookingViewSet
+
+# Far enough in the future for the bookings never to be expired by their start date
+START = date(2099, 3, 2)
+
+
+def make_owner(name='Owner'):
+    return User.objects.create_user(
+        email=f'{name.lower()}@example.com', name=name, role='petowner', password='secret', address='Paris'
+    )
+
+
+def make_sitter(name='Sitter', experience='3 ans de garde de chiens'):
+    return User.objects.create_user(
+        email=f'{name.lower()}@example.com', name=name, role='petsitter', password='secret', experience=experience
+    )
+
+
+def make_company(name='Company', capacity=5, address='Lyon'):
+    return User.objects.create_user(
+        email=f'{name.lower()}@example.com', name=name, role='company', password='secret',
+        address=address, capacity=capacity
+    )
+
+
+def make_admin():
+    return User.objects.create_superuser(email='admin@example.com', name='Admin', role='petowner', password='secret')
+
+
+def make_animal(owner, name='Rex', animal_type='dog'):
+    return Animal.objects.create(owner=owner, name=name, animal_type=animal_type)
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@override_settings(ASYNC_NOTIFICATIONS=False)
+class CoreTestCase(TestCase):
+    """
+    Notifications are sent in the request (to the locmem mail backend) and the cache
+    starts empty: ids are reused between tests, so are the cache keys built from them.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+
+class CompanyOccupancyTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.company = make_company(capacity=2)
+        self.animal = make_animal(self.owner)
+
+    def book(self, start_date=START, days=3, **fields):
+        response = client_for(self.owner).post('/api/company-bookings/', {
+            'animal': self.animal.id, 'company': self.company.id,
+            'start_date': start_date.isoformat(),
+            'end_date': (start_date + timedelta(days=days - 1)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        booking = CompanyBooking.objects.get(id=response.data['id'])
+        if fields:
+            CompanyBooking.objects.filter(id=booking.id).update(**fields)
+            booking.refresh_from_db()
+        return booking
+
+    def occupancy(self):
+        return dict(CompanyOccupancy.objects.filter(company=self.company, occupied__gt=0).values_list('day', 'occupied'))
+
+    def test_pending_booking_takes_no_place(self):
+        self.book()
+        self.assertEqual(self.occupancy(), {})
+
+    def test_accept_then_cancel(self):
+        booking = self.book(company_paid=True)
+        self.assertEqual(apply_transition(CompanyBooking, self.company, [booking.id], 'accepted')[0]['status'], 'updated')
+        self.assertEqual(self.occupancy(), {START + timedelta(days=offset): 1 for offset in range(3)})
+        self.assertEqual(peak_occupancy(self.company.id, START, START + timedelta(days=10)), 1)
+
+        self.assertEqual(apply_transition(CompanyBooking, self.owner, [booking.id], 'cancelled')[0]['status'], 'updated')
+        self.assertEqual(self.occupancy(), {})
+
+    def test_overlapping_bookings_add_up(self):
+        other = make_animal(self.owner, name='Felix', animal_type='cat')
+        first = self.book(company_paid=True)
+        self.animal = other
+        second = self.book(start_date=START + timedelta(days=2), company_paid=True)
+        apply_transition(CompanyBooking, self.company, [first.id, second.id], 'accepted')
+
+        occupancy = self.occupancy()
+        self.assertEqual(occupancy[START], 1)
+        self.assertEqual(occupancy[START + timedelta(days=2)], 2)
+        self.assertEqual(occupancy[START + timedelta(days=4)], 1)
+
+    def test_expired_booking_takes_no_place(self):
+        booking = self.book()
+        CompanyBooking.objects.filter(id=booking.id).update(created_at=booking.created_at - timedelta(days=30))
+        self.assertEqual(expire_stale_bookings()['company_bookings'], 1)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'expired')
+        self.assertEqual(self.occupancy(), {})
+
+    def test_rebuild_matches_projection(self):
+        booking = self.book(company_paid=True)
+        apply_transition(CompanyBooking, self.company, [booking.id], 'accepted')
+        expected = self.occupancy()
+        CompanyOccupancy.objects.all().delete()
+        rebuild_company_occupancy()
+        self.assertEqual(self.occupancy(), expected)
+
+    def test_full_company_is_not_listed_as_available(self):
+        for name in ('Rex', 'Felix'):
+            self.animal = make_animal(self.owner, name=name)
+            booking = self.book(company_paid=True)
+            apply_transition(CompanyBooking, self.company, [booking.id], 'accepted')
+        companies = User.objects.filter(role='company')
+        self.assertFalse(with_free_capacity(companies, START, START).exists())
+        self.assertTrue(with_free_capacity(companies, START + timedelta(days=3), START + timedelta(days=5)).exists())
+
+
+class FullTextSearchTests(CoreTestCase):
+    def search(self, query):
+        return list(search_users(User.objects.filter(role='petsitter'), query).values_list('name', flat=True))
+
+    def test_stemmed_search(self):
+        make_sitter('Alice', experience='Promenades quotidiennes de chiens')
+        make_sitter('Bob', experience='Garde de chats')
+        self.assertEqual(self.search('promenade'), ['Alice'])
+        self.assertEqual(self.search('chat'), ['Bob'])
+
+    def test_index_follows_updates(self):
+        sitter = make_sitter('Alice', experience='Garde de chats')
+        sitter.experience = 'Promenades de chiens'
+        sitter.save()
+        self.assertEqual(self.search('chat'), [])
+        self.assertEqual(self.search('promenade'), ['Alice'])
+
+    def test_deleted_user_leaves_the_index(self):
+        sitter = make_sitter('Alice', experience='Garde de chats')
+        sitter_id = sitter.id
+        sitter.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE rowid = %s", [sitter_id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class NearbyTests(CoreTestCase):
+    def test_companies_sorted_by_distance(self):
+        lyon = make_company('Lyon')
+        make_company('Paris', address='Paris')
+
+        response = APIClient().get('/api/users/nearby/', {'near': 'Lyon', 'radius': 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['results']], [lyon.id])
+        self.assertEqual(response.data['results'][0]['distance_km'], 0)
+
+        response = APIClient().get('/api/users/nearby/', {'near': 'Lyon', 'radius': 200, 'role': 'petsitter'})
+        self.assertEqual([item['id'] for item in response.data['results']], [lyon.id])
+
+    def test_unknown_origin(self):
+        response = APIClient().get('/api/users/nearby/', {'near': 'Atlantis'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_communes_of_a_department_are_told_apart(self):
+        lyon = make_company('Lyon', address='3 place Bellecour, 69002 Lyon')
+        villeurbanne = make_company('Villeurbanne', address='1 avenue Henri Barbusse, 69100 Villeurbanne')
+        make_company('Givors', address='2 rue de la Liberté, 69700 Givors')
+
+        response = APIClient().get('/api/users/nearby/', {'near': '69002', 'radius': 5})
+        self.assertEqual([item['id'] for item in response.data['results']], [lyon.id, villeurbanne.id])
+        self.assertLess(response.data['results'][0]['distance_km'], response.data['results'][1]['distance_km'])
+
+
+class GeocodingTests(TestCase):
+    def assertNear(self, coordinates, expected, km=10):
+        self.assertIsNotNone(coordinates)
+        self.assertLess(distance_km(*coordinates, *expected), km)
+
+    def test_locality_after_the_postal_code(self):
+        self.assertNear(geocode('12 rue de Paris, 69100 Villeurbanne'), (45.77, 4.88), km=3)
+        # A street named after a city is not the locality
+        self.assertNear(geocode('rue de Paris, Lyon'), (45.76, 4.85))
+        self.assertIsNone(geocode('rue de Lyon'))
+
+    def test_homonyms_are_resolved_by_department(self):
+        self.assertNear(geocode('1 place de la Mairie, 38160 Saint-Sauveur'), (45.15, 5.35))
+        self.assertNear(geocode('1 place de la Mairie, 60320 St Sauveur'), (49.32, 2.78))
+
+    def test_fallbacks(self):
+        # Arrondissements have their own postal code entries
+        self.assertNear(geocode('75015 Paris'), (48.84, 2.30), km=2)
+        self.assertNear(geocode('Paris 15e'), (48.85, 2.35))
+        # Unknown commune: the department's prefecture
+        self.assertEqual(geocode('5 chemin des Bois, 23220 Lieu-dit'), geocode('23000'))
+        self.assertNear(geocode('97300 Cayenne'), (4.92, -52.31))
+
+
+class ConditionalGetTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.client = client_for(self.owner)
+
+    def test_not_modified_until_a_row_changes(self):
+        response = self.client.get('/api/animals/my_animals/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get('/api/animals/my_animals/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_animal(self.owner)
+        response = self.client.get('/api/animals/my_animals/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_other_users_changes_keep_the_etag(self):
+        etag = self.client.get('/api/animals/my_animals/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            make_animal(make_owner('Other'))
+        response = self.client.get('/api/animals/my_animals/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_versions_are_shared_between_processes(self):
+        before = get_versions([DIRECTORY_SCOPE])[0]
+        invalidate(DIRECTORY_SCOPE)
+        # Another worker has its own local cache, but reads the same versions
+        cache.clear()
+        self.assertEqual(get_versions([DIRECTORY_SCOPE]), [before + 1])
+
+    def test_diagnostic_login_has_no_etag(self):
+        response = APIClient().get('/api/test-auth/', {'email': 'owner@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        response = APIClient().get(
+            '/api/test-auth/', {'email': 'owner@example.com', 'password': 'wrong'}, HTTP_IF_NONE_MATCH='*'
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(ASYNC_NOTIFICATIONS=False)
+class ConcurrentBookingTests(TransactionTestCase):
+    """
+    Simultaneous requests for the same animal and dates, one database connection per
+    thread: the creations are serialized and exactly one booking is created.
+    """
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.company = make_company(capacity=50)
+        self.animal = make_animal(self.owner)
+        self.dates = {'start_date': '2099-01-01', 'end_date': '2099-01-07'}
+
+    def post_concurrently(self, requests, user=None):
+        """
+        Sends the (url, payload) requests at the same time. Returns the status codes, or
+        the exception raised by a request.
+        """
+        barrier = threading.Barrier(len(requests))
+        codes = []
+        lock = threading.Lock()
+
+        def send(url, payload):
+            client = client_for(user or self.owner)
+            try:
+                barrier.wait()
+                result = client.post(url, payload, format='json').status_code
+            except Exception as e:
+                result = repr(e)
+            finally:
+                connections.close_all()
+            with lock:
+                codes.append(result)
+
+        threads = [threading.Thread(target=send, args=request) for request in requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(codes, key=str)
+
+    def test_pet_sitter_bookings(self):
+        payload = {'animal': self.animal.id, 'sitter': self.sitter.id, **self.dates}
+        codes = self.post_concurrently([('/api/bookings/', payload)] * self.THREADS)
+        self.assertEqual(codes, [201] + [400] * (self.THREADS - 1))
+        self.assertEqual(Booking.objects.filter(animal=self.animal).count(), 1)
+
+    def test_company_bookings(self):
+        payload = {'animal': self.animal.id, 'company': self.company.id, **self.dates}
+        codes = self.post_concurrently([('/api/company-bookings/', payload)] * self.THREADS)
+        self.assertEqual(codes, [201] + [400] * (self.THREADS - 1))
+        self.assertEqual(CompanyBooking.objects.filter(animal=self.animal).count(), 1)
+
+    def test_pet_sitter_and_company_bookings(self):
+        requests = [
+            ('/api/bookings/', {'animal': self.animal.id, 'sitter': self.sitter.id, **self.dates}),
+            ('/api/company-bookings/', {'animal': self.animal.id, 'company': self.company.id, **self.dates}),
+        ] * (self.THREADS // 2)
+        codes = self.post_concurrently(requests)
+        self.assertEqual(codes, [201] + [400] * (self.THREADS - 1))
+        created = Booking.objects.filter(animal=self.animal).count()
+        created += CompanyBooking.objects.filter(animal=self.animal).count()
+        self.assertEqual(created, 1)
+
+    def test_series_confirmations_share_the_capacity(self):
+        self.company.capacity = 1
+        self.company.save()
+        # Different series (and animals) of the same company, all with an occurrence on START
+        requests = []
+        for index in range(self.THREADS):
+            series = CompanyBookingSeries.objects.create(
+                animal=make_animal(self.owner, name=f'Pet{index}'), company=self.company,
+                start_date=START, end_date=START + timedelta(days=7 * index)
+            )
+            requests.append((f'/api/company-booking-series/{series.id}/confirm/', {'dates': [str(START)]}))
+        codes = self.post_concurrently(requests, user=self.company)
+        self.assertEqual(codes, [201] + [400] * (self.THREADS - 1))
+        self.assertEqual(CompanyBooking.objects.filter(company=self.company, start_date=START).count(), 1)
+        self.assertEqual(CompanyOccupancy.objects.get(company=self.company, day=START).occupied, 1)
+
+
+class AnimalConflictTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.company = make_company()
+        self.animal = make_animal(self.owner)
+
+    def create(self, model, provider, start_date, end_date, **fields):
+        field = 'sitter' if model is Booking else 'company'
+        return model.objects.create(
+            animal=self.animal, start_date=start_date, end_date=end_date, **{field: provider}, **fields
+        )
+
+    def test_conflicts_across_tables(self):
+        booking = self.create(Booking, self.sitter, START, START + timedelta(days=4))
+        company_booking = self.create(CompanyBooking, self.company, START + timedelta(days=10), START + timedelta(days=12))
+        series = CompanyBookingSeries.objects.create(
+            animal=self.animal, company=self.company, start_date=START + timedelta(days=21),
+            end_date=START + timedelta(days=90), interval_weeks=2
+        )
+
+        with self.assertNumQueries(1):
+            conflicts = animal_conflicts(self.animal.id, START + timedelta(days=4), START + timedelta(days=21))
+        self.assertEqual(conflicts, {
+            'bookings': [booking.id], 'company_bookings': [company_booking.id], 'series': [series.id]
+        })
+        # Between two occurrences of the series
+        self.assertEqual(
+            animal_conflicts(self.animal.id, START + timedelta(days=22), START + timedelta(days=34))['series'], []
+        )
+
+    def test_inactive_bookings_do_not_conflict(self):
+        for status in ('refused', 'cancelled', 'expired'):
+            self.create(Booking, self.sitter, START, START + timedelta(days=4), status=status)
+            self.create(CompanyBooking, self.company, START, START + timedelta(days=4), status=status)
+        self.assertEqual(
+            animal_conflicts(self.animal.id, START, START + timedelta(days=4)),
+            {'bookings': [], 'company_bookings': [], 'series': []}
+        )
+
+    def test_adjacent_dates_do_not_conflict(self):
+        self.create(Booking, self.sitter, START, START + timedelta(days=4))
+        conflicts = animal_conflicts(self.animal.id, START + timedelta(days=5), START + timedelta(days=6))
+        self.assertEqual(conflicts['bookings'], [])
+        conflicts = animal_conflicts(self.animal.id, START + timedelta(days=4), START + timedelta(days=6))
+        self.assertEqual(len(conflicts['bookings']), 1)
+
+    def test_company_booking_refused_over_a_sitter_booking(self):
+        self.create(Booking, self.sitter, START, START + timedelta(days=4))
+        response = client_for(self.owner).post('/api/company-bookings/', {
+            'animal': self.animal.id, 'company': self.company.id,
+            'start_date': (START + timedelta(days=2)).isoformat(), 'end_date': (START + timedelta(days=8)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['conflicts']['bookings']), 1)
+        self.assertFalse(CompanyBooking.objects.exists())
+
+
+class BulkBookingTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.company = make_company()
+        self.rex = make_animal(self.owner)
+        self.felix = make_animal(self.owner, name='Felix', animal_type='cat')
+
+    def post(self, items):
+        return client_for(self.owner).post('/api/bookings/bulk/', {'items': items}, format='json')
+
+    def item(self, animal, start_offset, days, **provider):
+        return {
+            'animal': animal.id,
+            'start_date': (START + timedelta(days=start_offset)).isoformat(),
+            'end_date': (START + timedelta(days=start_offset + days - 1)).isoformat(),
+            **provider,
+        }
+
+    def test_valid_items_are_created_and_others_reported(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post([
+                self.item(self.rex, 0, 3, sitter=self.sitter.id),
+                self.item(self.felix, 0, 3, company=self.company.id),
+                # Overlaps the first item of the batch
+                self.item(self.rex, 2, 3, company=self.company.id),
+                self.item(self.rex, 10, 2, sitter=self.company.id),
+                {'animal': self.rex.id, 'sitter': self.sitter.id, 'start_date': 'tomorrow', 'end_date': '2099-01-01'},
+            ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 3))
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'created', 'error', 'error', 'error'])
+        self.assertEqual(results[2]['conflicts']['items'], [0])
+        self.assertEqual(results[3]['error'], 'Pet sitter not found')
+
+        booking = Booking.objects.get(id=results[0]['id'])
+        self.assertEqual((booking.owner_id, booking.total_days), (self.owner.id, 3))
+        self.assertEqual(booking.total_price, Decimal('30.00'))
+        self.assertTrue(CompanyBooking.objects.filter(id=results[1]['id'], animal=self.felix).exists())
+        # One summary for the owner, one for each provider
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(ASYNC_NOTIFICATIONS=True)
+    def test_emails_are_sent_by_the_worker(self):
+        with mock.patch('core.bulk_bookings.enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post([self.item(self.rex, 0, 3, sitter=self.sitter.id)])
+        enqueue.assert_called_once()
+        self.assertIs(enqueue.call_args.args[0], send_batch_booking_emails)
+
+    def test_existing_booking_conflicts(self):
+        Booking.objects.create(animal=self.rex, sitter=self.sitter, start_date=START, end_date=START + timedelta(days=4))
+        response = self.post([self.item(self.rex, 4, 2, company=self.company.id)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['results'][0]['conflicts']['bookings']), 1)
+        self.assertEqual(CompanyBooking.objects.count(), 0)
+
+
+class CompanyBookingSeriesTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.company = make_company(capacity=1)
+        self.animal = make_animal(self.owner)
+
+    def create_series(self, animal=None, weeks=8, interval_weeks=2):
+        return client_for(self.owner).post('/api/company-booking-series/', {
+            'animal': (animal or self.animal).id, 'company': self.company.id, 'start_date': START.isoformat(),
+            'end_date': (START + timedelta(weeks=weeks)).isoformat(), 'interval_weeks': interval_weeks,
+        }, format='json')
+
+    def test_occurrence_dates(self):
+        self.assertEqual(
+            list(occurrence_dates(START, START + timedelta(weeks=6), 2)),
+            [START + timedelta(weeks=weeks) for weeks in (0, 2, 4, 6)]
+        )
+        # The window starts between two occurrences: the first one is computed, not walked to
+        self.assertEqual(
+            list(occurrence_dates(START, START + timedelta(weeks=52), 2, START + timedelta(days=15), START + timedelta(days=40))),
+            [START + timedelta(weeks=4)]
+        )
+
+    def test_series_is_stored_as_a_rule(self):
+        response = self.create_series()
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['occurrence_count'], 5)
+        self.assertFalse(CompanyBooking.objects.exists())
+
+        response = client_for(self.owner).get(
+            f"/api/company-booking-series/{response.data['id']}/occurrences/",
+            {'from': START.isoformat(), 'to': (START + timedelta(weeks=3)).isoformat()}
+        )
+        self.assertEqual(
+            [(item['date'], item['status']) for item in response.data['occurrences']],
+            [(START, 'pending'), (START + timedelta(weeks=2), 'pending')]
+        )
+
+    def test_confirm_occurrences(self):
+        series_id = self.create_series().data['id']
+        url = f'/api/company-booking-series/{series_id}/confirm/'
+        dates = [START.isoformat(), (START + timedelta(weeks=4)).isoformat()]
+
+        response = client_for(self.company).post(url, {'dates': dates}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            sorted(CompanyBooking.objects.filter(series_id=series_id, status='accepted').values_list('start_date', flat=True)),
+            [START, START + timedelta(weeks=4)]
+        )
+        self.assertEqual(peak_occupancy(self.company.id, START, START), 1)
+
+        response = client_for(self.company).post(url, {'dates': dates[:1]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client_for(self.company).post(url, {'dates': [(START + timedelta(days=1)).isoformat()]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client_for(self.owner).post(url, {'dates': dates}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_conflicting_series_and_full_company(self):
+        self.assertEqual(self.create_series().status_code, 201)
+        response = client_for(self.owner).post('/api/bookings/', {
+            'animal': self.animal.id, 'sitter': make_sitter().id,
+            'start_date': (START + timedelta(weeks=2)).isoformat(), 'end_date': (START + timedelta(weeks=2)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['conflicts']['series']), 1)
+
+        # The only place of the company is taken by another animal on the first occurrence
+        shift_occupancy(self.company.id, START, START, 1)
+        response = self.create_series(animal=make_animal(self.owner, name='Felix'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['full_dates'], [START])
+
+    def test_cancel_drops_pending_occurrences(self):
+        series_id = self.create_series().data['id']
+        response = client_for(self.owner).post(f'/api/company-booking-series/{series_id}/cancel/')
+        self.assertEqual(response.data['status'], 'cancelled')
+        self.assertEqual(animal_conflicts(self.animal.id, START, START + timedelta(weeks=8))['series'], [])
+        response = client_for(self.owner).post(f'/api/company-booking-series/{series_id}/cancel/')
+        self.assertEqual(response.status_code, 400)
+
+
+class TimelineTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.company = make_company()
+        rex, felix = make_animal(self.owner), make_animal(self.owner, name='Felix', animal_type='cat')
+        # Several rows share a start date, across kinds and within a kind
+        for animal, offset in ((rex, 0), (felix, 0), (rex, 3), (rex, 7)):
+            Booking.objects.create(animal=animal, sitter=self.sitter, start_date=START + timedelta(days=offset),
+                                   end_date=START + timedelta(days=offset))
+        for offset in (0, 3, 5):
+            CompanyBooking.objects.create(animal=felix, company=self.company, start_date=START + timedelta(days=offset),
+                                          end_date=START + timedelta(days=offset), status='cancelled')
+        PetSitterCompanyBooking.objects.create(
+            petsitter=self.sitter, company=self.company, service_type='formation', start_date=START, end_date=START
+        )
+
+    def pages(self, user, **params):
+        """
+        Follows the next links of the timeline, returns the (kind, id) of every row and the number of pages.
+        """
+        client = client_for(user)
+        response = client.get('/api/timeline/', params)
+        rows, pages = [], 0
+        while True:
+            self.assertEqual(response.status_code, 200, response.data)
+            rows += [(row['kind'], row['id']) for row in response.data['results']]
+            pages += 1
+            if not response.data['next']:
+                return rows, pages
+            response = client.get(response.data['next'])
+
+    def expected(self, kinds, descending=False):
+        rows = []
+        for kind, model in (('booking', Booking), ('company_booking', CompanyBooking),
+                            ('petsitter_company_booking', PetSitterCompanyBooking)):
+            if kind in kinds:
+                rows += [(start_date, kind, row_id) for row_id, start_date in model.objects.values_list('id', 'start_date')]
+        return [(kind, row_id) for _, kind, row_id in sorted(rows, reverse=descending)]
+
+    def test_pages_follow_the_sort_order(self):
+        kinds = ('booking', 'company_booking')
+        full, pages = self.pages(self.owner, page_size=50)
+        self.assertEqual((full, pages), (self.expected(kinds), 1))
+        for page_size in (1, 2, 3):
+            self.assertEqual(self.pages(self.owner, page_size=page_size)[0], full)
+
+    def test_descending_pages(self):
+        rows, pages = self.pages(self.owner, page_size=2, order='desc')
+        self.assertEqual(rows, self.expected(('booking', 'company_booking'), descending=True))
+        self.assertEqual(pages, 4)
+
+    def test_filters(self):
+        rows, _ = self.pages(self.owner, page_size=2, status='cancelled', to=(START + timedelta(days=3)).isoformat())
+        self.assertEqual([kind for kind, _ in rows], ['company_booking', 'company_booking'])
+        rows, _ = self.pages(self.sitter, page_size=2, type='petsitter_company_booking')
+        self.assertEqual(rows, self.expected(('petsitter_company_booking',)))
+
+    def test_sitter_sees_bookings_and_collaborations(self):
+        rows, _ = self.pages(self.sitter, page_size=3)
+        self.assertEqual(rows, self.expected(('booking', 'petsitter_company_booking')))
+
+    def test_invalid_cursor(self):
+        response = client_for(self.owner).get('/api/timeline/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CancellationCascadeTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.company = make_company()
+        self.booking = Booking.objects.create(
+            animal=make_animal(self.owner), sitter=self.sitter, start_date=START, end_date=START + timedelta(days=6),
+            status='accepted'
+        )
+
+    def collaboration(self, start_offset, end_offset, sitter=None, status='accepted'):
+        return PetSitterCompanyBooking.objects.create(
+            petsitter=sitter or self.sitter, company=self.company, service_type='collaboration', status=status,
+            start_date=START + timedelta(days=start_offset), end_date=START + timedelta(days=end_offset)
+        )
+
+    def test_owner_cancellation_cancels_linked_collaborations(self):
+        inside = [self.collaboration(0, 2), self.collaboration(4, 6, status='pending')]
+        overlapping = self.collaboration(5, 9)
+        other_sitter = self.collaboration(0, 2, sitter=make_sitter('Other'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for(self.owner).patch(
+                f'/api/bookings/{self.booking.id}/update_status/', {'status': 'cancelled'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        statuses = dict(PetSitterCompanyBooking.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[row.id] for row in inside], ['cancelled', 'cancelled'])
+        self.assertEqual(statuses[overlapping.id], 'accepted')
+        self.assertEqual(statuses[other_sitter.id], 'accepted')
+        # Status email of the booking, then one summary for the sitter and one for the company
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_cascade_is_one_update(self):
+        collaborations = [self.collaboration(offset, offset) for offset in range(5)]
+        # One UPDATE ... RETURNING, inside the savepoint of the cascade
+        with self.assertNumQueries(3):
+            ids = cancel_linked_collaborations([self.booking])
+        self.assertEqual(sorted(ids), [row.id for row in collaborations])
+        self.assertEqual(cancel_linked_collaborations([self.booking]), [])
+
+    def test_sitter_refusal_does_not_cascade(self):
+        self.booking.status = 'pending'
+        self.booking.save()
+        collaboration = self.collaboration(0, 2)
+        apply_transition(Booking, self.sitter, [self.booking.id], 'refused')
+        collaboration.refresh_from_db()
+        self.assertEqual(collaboration.status, 'accepted')
+
+
+class NotificationWorkerTests(TestCase):
+    @override_settings(ASYNC_NOTIFICATIONS=True)
+    def test_failures_are_logged(self):
+        def fail():
+            raise RuntimeError('SMTP server unreachable')
+
+        with self.assertLogs('core.notifications', 'ERROR') as logs:
+            enqueue(fail)
+            wait_for_notifications()
+        self.assertIn('SMTP server unreachable', logs.output[0])
+
+    def test_batch_failures_do_not_fail_the_operation(self):
+        with mock.patch('core.notifications.send_mass_mail', side_effect=ConnectionError('SMTP server unreachable')), \
+                self.assertLogs('core.notifications', 'ERROR') as logs:
+            send_batch_booking_emails([], [])
+        self.assertIn('SMTP server unreachable', logs.output[0])
+
+
+class ExpiryTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.company = make_company()
+        self.now = timezone.now()
+
+    def booking(self, name, status='pending', hours_old=0, start_date=START):
+        booking = Booking.objects.create(
+            animal=make_animal(self.owner, name=name), sitter=self.sitter, start_date=start_date,
+            end_date=start_date, status=status
+        )
+        # created_at is auto_now_add: backdate it with an UPDATE
+        Booking.objects.filter(id=booking.id).update(created_at=self.now - timedelta(hours=hours_old))
+        return booking
+
+    def statuses(self):
+        return dict(Booking.objects.values_list('animal__name', 'status'))
+
+    def test_stale_requests_expire(self):
+        self.booking('Old', hours_old=73)
+        self.booking('Recent', hours_old=71)
+        self.booking('Started', start_date=timezone.localdate(self.now) - timedelta(days=1))
+        self.booking('Answered', status='accepted', hours_old=200)
+        CompanyBooking.objects.create(
+            animal=make_animal(self.owner, name='Daycare'), company=self.company,
+            start_date=timezone.localdate(self.now) - timedelta(days=1), end_date=START
+        )
+
+        counts = expire_stale_bookings(ttl_hours=72, now=self.now)
+        self.assertEqual(counts, {'bookings': 2, 'company_bookings': 1})
+        self.assertEqual(
+            self.statuses(), {'Old': 'expired', 'Recent': 'pending', 'Started': 'expired', 'Answered': 'accepted'}
+        )
+        self.assertEqual(CompanyBooking.objects.get().status, 'expired')
+        self.assertEqual(expire_stale_bookings(ttl_hours=72, now=self.now), {'bookings': 0, 'company_bookings': 0})
+
+    def test_batches_until_done(self):
+        for index in range(5):
+            self.booking(f'Pet{index}', hours_old=100)
+        with mock.patch('core.expiry.expire_batch', wraps=expiry.expire_batch) as expire_batch:
+            counts = expire_stale_bookings(ttl_hours=72, batch_size=2, now=self.now)
+        self.assertEqual(counts['bookings'], 5)
+        # Booking batches of 2, 2 and 1 by age, one empty batch by start date, one per criterion for companies
+        self.assertEqual(expire_batch.call_count, 6)
+        self.assertEqual(set(self.statuses().values()), {'expired'})
+
+    def test_expired_dates_are_free_again(self):
+        self.booking('Rex', hours_old=100)
+        expire_stale_bookings(ttl_hours=72, now=self.now)
+        response = client_for(self.owner).post('/api/bookings/', {
+            'animal': Animal.objects.get(name='Rex').id, 'sitter': self.sitter.id,
+            'start_date': START, 'end_date': START,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_users_are_notified(self):
+        self.booking('Rex', hours_old=100)
+        self.booking('Felix', hours_old=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            expire_stale_bookings(ttl_hours=72, now=self.now)
+        # One summary for the owner and one for the sitter
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [self.owner.email, self.sitter.email])
+
+    def test_bookings_answered_meanwhile_are_not_notified(self):
+        self.booking('Rex', hours_old=100)
+        felix = self.booking('Felix', hours_old=100)
+        real_update = QuerySet.update
+
+        def concurrent_update(queryset, **values):
+            # The sitter accepts Felix between the read of the batch and its UPDATE
+            real_update(Booking.objects.filter(id=felix.id), status='accepted')
+            return real_update(queryset, **values)
+
+        with mock.patch('core.expiry.enqueue') as enqueue_mock, self.captureOnCommitCallbacks(execute=True):
+            with mock.patch.object(QuerySet, 'update', concurrent_update):
+                counts = expire_stale_bookings(ttl_hours=72, now=self.now)
+        self.assertEqual(counts['bookings'], 1)
+        self.assertEqual(self.statuses(), {'Rex': 'expired', 'Felix': 'accepted'})
+        notified = [booking for call in enqueue_mock.call_args_list for booking in call.args[1]]
+        self.assertEqual([booking.animal.name for booking in notified], ['Rex'])
+
+    def test_scheduler_logs_failures(self):
+        with mock.patch('core.expiry.time.sleep', side_effect=[None, SystemExit]), \
+                mock.patch('core.expiry.expire_stale_bookings', side_effect=RuntimeError('database is locked')), \
+                mock.patch('core.expiry.connections'), \
+                self.assertLogs('core.expiry', 'ERROR') as logs:
+            with self.assertRaises(SystemExit):
+                expiry.run_scheduler(60)
+        self.assertIn('database is locked', logs.output[0])
+
+
+class TransitionTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.company = make_company()
+        self.animal = make_animal(self.owner)
+
+    def booking(self, status='pending'):
+        return Booking.objects.create(
+            animal=self.animal, sitter=self.sitter, start_date=START, end_date=START, status=status
+        )
+
+    def company_booking(self, status='pending', company_paid=False):
+        return CompanyBooking.objects.create(
+            animal=self.animal, company=self.company, start_date=START, end_date=START, status=status,
+            company_paid=company_paid
+        )
+
+    def update_status(self, user, url, new_status):
+        return client_for(user).patch(url, {'status': new_status}, format='json')
+
+    def test_allowed_sources(self):
+        self.assertEqual(allowed_sources(Booking, 'petsitter', 'accepted'), ['pending'])
+        self.assertEqual(allowed_sources(Booking, 'petowner', 'accepted'), [])
+        self.assertEqual(allowed_sources(Booking, 'petowner', 'cancelled'), ['pending', 'accepted', 'paid'])
+        self.assertEqual(allowed_sources(PetSitterCompanyBooking, 'company', 'cancelled'), ['accepted'])
+        self.assertNotIn('paid', allowed_sources(Booking, 'admin', 'paid'))
+        self.assertEqual(allowed_sources(Booking, 'admin', 'unknown'), [])
+
+    def test_transition_errors(self):
+        self.assertIsNone(transition_error(Booking, self.sitter, 'refused'))
+        self.assertEqual(transition_error(Booking, self.company, 'accepted')[1], 403)
+        self.assertEqual(transition_error(Booking, self.owner, 'accepted')[1], 400)
+        self.assertEqual(transition_error(Booking, self.sitter, 'unknown')[1], 400)
+        self.assertIsNone(transition_error(Booking, make_admin(), 'paid'))
+
+    def test_sitter_accepts_pending_booking(self):
+        booking = self.booking()
+        response = self.update_status(self.sitter, f'/api/bookings/{booking.id}/update_status/', 'accepted')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['booking']['status'], 'accepted')
+
+        # Already accepted: the sitter cannot answer it again
+        response = self.update_status(self.sitter, f'/api/bookings/{booking.id}/update_status/', 'refused')
+        self.assertEqual(response.status_code, 409)
+
+    def test_only_parties_change_the_status(self):
+        booking = self.booking()
+        response = self.update_status(make_sitter('Other'), f'/api/bookings/{booking.id}/update_status/', 'accepted')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(booking_error(Booking, booking, make_sitter('Third'), 'accepted')[1], 403)
+        response = self.update_status(self.owner, f'/api/bookings/{booking.id}/update_status/', 'accepted')
+        self.assertEqual(response.status_code, 400)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'pending')
+
+    def test_owner_cancels_paid_booking(self):
+        booking = self.booking(status='paid')
+        response = self.update_status(self.owner, f'/api/bookings/{booking.id}/update_status/', 'cancelled')
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_company_acceptance_requires_payment(self):
+        booking = self.company_booking()
+        url = f'/api/company-bookings/{booking.id}/update_status/'
+        response = self.update_status(self.company, url, 'accepted')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['requires_payment'])
+        self.assertEqual(response.data['total_amount'], booking.total_price + service_fee())
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'pending')
+
+        # The bulk endpoint has no payment step: unpaid bookings are refused
+        response = client_for(self.company).post(
+            '/api/company-bookings/bulk_status/', {'ids': [booking.id], 'status': 'accepted'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['results'][0]['error'], 'Please proceed to payment to confirm this booking')
+
+        CompanyBooking.objects.filter(id=booking.id).update(company_paid=True)
+        response = self.update_status(self.company, url, 'accepted')
+        self.assertEqual(response.data['booking']['status'], 'accepted')
+
+    def test_bulk_status_reports_each_booking(self):
+        pending, accepted = self.booking(), self.booking(status='accepted')
+        response = client_for(self.sitter).post('/api/bookings/bulk_status/', {
+            'ids': [pending.id, accepted.id, 999999], 'status': 'refused'
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']], ['updated', 'error', 'error']
+        )
+        self.assertEqual(response.data['results'][2]['error'], 'Booking not found')
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'refused')
+
+    def test_collaboration_transitions(self):
+        collaboration = PetSitterCompanyBooking.objects.create(
+            petsitter=self.sitter, company=self.company, service_type='formation', start_date=START, end_date=START
+        )
+        url = f'/api/petsitter-company-bookings/{collaboration.id}/update_status/'
+        self.assertEqual(self.update_status(self.company, url, 'cancelled').status_code, 409)
+        self.assertEqual(self.update_status(self.company, url, 'accepted').status_code, 200)
+        self.assertEqual(self.update_status(self.sitter, url, 'cancelled').status_code, 200)
+
+
+class CompareAndSwapTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.booking = Booking.objects.create(
+            animal=make_animal(self.owner), sitter=self.sitter, start_date=START, end_date=START, status='accepted'
+        )
+
+    def test_swap_status(self):
+        swap_status(self.booking, 'accepted', 'paid')
+        self.assertEqual(self.booking.status, 'paid')
+        self.assertEqual(Booking.objects.get(id=self.booking.id).status, 'paid')
+
+    def test_stale_status_is_a_conflict(self):
+        stale = Booking.objects.get(id=self.booking.id)
+        Booking.objects.filter(id=self.booking.id).update(status='cancelled')
+        with self.assertRaises(StatusConflict):
+            swap_status(stale, 'accepted', 'paid')
+        self.assertEqual(stale.status, 'accepted')
+        self.assertEqual(Booking.objects.get(id=self.booking.id).status, 'cancelled')
+
+    def test_stale_bulk_transition_is_rolled_back(self):
+        other = Booking.objects.create(
+            animal=make_animal(self.owner, name='Felix'), sitter=self.sitter, start_date=START, end_date=START
+        )
+        real_update = QuerySet.update
+
+        def concurrent_update(queryset, **values):
+            # Another request cancels the booking between the read and the update
+            real_update(Booking.objects.filter(id=other.id), status='cancelled')
+            return real_update(queryset, **values)
+
+        with mock.patch.object(QuerySet, 'update', concurrent_update):
+            response = client_for(self.sitter).post(
+                '/api/bookings/bulk_status/', {'ids': [other.id], 'status': 'accepted'}, format='json'
+            )
+        self.assertEqual(response.status_code, 409)
+        # The simulated write shares the request transaction: the whole batch is rolled back
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'pending')
+
+    def test_payment_marks_the_booking_paid(self):
+        response = client_for(self.owner).post(
+            '/api/payments/process_payment/', {'booking': self.booking.id}, format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'paid')
+        payment = Payment.objects.get(booking=self.booking)
+        self.assertEqual(payment.amount, self.booking.total_price + service_fee())
+        self.assertEqual(payment.owner_id, self.owner.id)
+
+    def test_failed_payment_leaves_the_booking_unpaid(self):
+        client = client_for(self.owner)
+        client.raise_request_exception = False
+        with mock.patch('core.views.new_transaction_id', side_effect=RuntimeError('Payment provider down')):
+            response = client.post('/api/payments/process_payment/', {'booking': self.booking.id}, format='json')
+        self.assertEqual(response.status_code, 500)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'accepted')
+        self.assertFalse(Payment.objects.exists())
+
+    def test_concurrent_refunds(self):
+        payment = Payment.objects.create(
+            booking=self.booking, amount=Decimal('12.80'), payment_status='completed', transaction_id='TR-1'
+        )
+        admin = make_admin()
+        self.assertEqual(client_for(admin).post(f'/api/payments/{payment.id}/refund/').status_code, 200)
+        stale = Payment.objects.get(id=payment.id)
+        stale.payment_status = 'completed'
+        with self.assertRaises(StatusConflict):
+            swap_status(stale, 'completed', 'refunded', field='payment_status')
+
+    def test_company_payment_confirms_a_pending_booking(self):
+        company = make_company()
+        booking = CompanyBooking.objects.create(
+            animal=make_animal(self.owner, name='Felix'), company=company, start_date=START, end_date=START
+        )
+        response = client_for(company).post(f'/api/company-bookings/{booking.id}/company_payment/')
+        self.assertEqual(response.status_code, 201, response.data)
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.company_paid), ('accepted', True))
+        self.assertEqual(peak_occupancy(company.id, START, START), 1)
+
+    def test_unpayable_company_bookings_are_rejected(self):
+        company = make_company()
+        client = client_for(company)
+        for booking_status, company_paid in [('cancelled', False), ('refused', False), ('expired', False),
+                                             ('accepted', True)]:
+            booking = CompanyBooking.objects.create(
+                animal=make_animal(self.owner, name=booking_status), company=company, start_date=START,
+                end_date=START, status=booking_status, company_paid=company_paid
+            )
+            for url, data in [(f'/api/company-bookings/{booking.id}/company_payment/', {}),
+                              (f'/api/process-company-payment/{booking.id}/', {'payment_stage': 'process'})]:
+                with self.subTest(status=booking_status, url=url):
+                    response = client.post(url, data, format='json')
+                    self.assertEqual(response.status_code, 400)
+                    booking.refresh_from_db()
+                    self.assertEqual(booking.status, booking_status)
+        self.assertFalse(Payment.objects.exists())
+        # No place was taken by the cancelled, refused or expired bookings
+        self.assertEqual(peak_occupancy(company.id, START, START), 0)
+
+    def test_company_payment_of_a_booking_cancelled_meanwhile_is_a_conflict(self):
+        company = make_company()
+        booking = CompanyBooking.objects.create(
+            animal=make_animal(self.owner, name='Felix'), company=company, start_date=START, end_date=START
+        )
+        real_is_valid = PaymentSerializer.is_valid
+
+        def cancel_meanwhile(serializer, *args, **kwargs):
+            # The owner cancels the booking between the read and the payment
+            CompanyBooking.objects.filter(id=booking.id).update(status='cancelled')
+            return real_is_valid(serializer, *args, **kwargs)
+
+        with mock.patch.object(PaymentSerializer, 'is_valid', cancel_meanwhile):
+            response = client_for(company).post(
+                f'/api/process-company-payment/{booking.id}/', {'payment_stage': 'process'}, format='json'
+            )
+        self.assertEqual(response.status_code, 409)
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.company_paid), ('cancelled', False))
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(peak_occupancy(company.id, START, START), 0)
+
+
+class OwnerDenormalizationTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.new_owner = make_owner('Bob')
+        self.animal = make_animal(self.owner)
+        self.booking = Booking.objects.create(
+            animal=self.animal, sitter=make_sitter(), start_date=START, end_date=START, status='accepted'
+        )
+        self.company_booking = CompanyBooking.objects.create(
+            animal=self.animal, company=make_company(), start_date=START, end_date=START
+        )
+        self.payments = [
+            Payment.objects.create(booking=self.booking, amount=Decimal('12.80'), transaction_id='TR-1'),
+            Payment.objects.create(
+                company_booking=self.company_booking, amount=Decimal('12.80'), transaction_id='TR-2'
+            ),
+        ]
+
+    def owner_ids(self):
+        return {
+            Booking.objects.get(id=self.booking.id).owner_id,
+            CompanyBooking.objects.get(id=self.company_booking.id).owner_id,
+            *Payment.objects.values_list('owner_id', flat=True),
+        }
+
+    def listed_ids(self, user):
+        client = client_for(user)
+        return [
+            [row['id'] for row in client.get(url).data['results']]
+            for url in ('/api/bookings/', '/api/bookings/my_bookings/', '/api/company-bookings/my_bookings/',
+                        '/api/payments/my_payments/')
+        ]
+
+    def test_owner_change_is_copied(self):
+        everything = [
+            [self.booking.id], [self.booking.id], [self.company_booking.id],
+            sorted((payment.id for payment in self.payments), reverse=True),
+        ]
+        self.assertEqual(self.owner_ids(), {self.owner.id})
+        self.assertEqual(self.listed_ids(self.owner), everything)
+
+        self.animal.owner = self.new_owner
+        with self.captureOnCommitCallbacks(execute=True):
+            self.animal.save()
+        self.assertEqual(self.owner_ids(), {self.new_owner.id})
+        self.assertEqual(self.listed_ids(self.owner), [[], [], [], []])
+        self.assertEqual(self.listed_ids(self.new_owner), everything)
+
+    def test_other_saves_leave_the_owner_alone(self):
+        self.animal.name = 'Max'
+        with self.assertNumQueries(2):
+            self.animal.save()
+        self.assertEqual(self.owner_ids(), {self.owner.id})
+
+    def test_backfill(self):
+        backfill_owners = import_module('core.migrations.0028_booking_owner').backfill_owners
+        Booking.objects.update(owner=self.new_owner)
+        CompanyBooking.objects.update(owner=self.new_owner)
+        Payment.objects.update(owner=None)
+        backfill_owners(django_apps, None)
+        self.assertEqual(self.owner_ids(), {self.owner.id})
+
+
+class IdempotencyTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.client = client_for(self.owner)
+        self.booking = Booking.objects.create(
+            animal=make_animal(self.owner), sitter=make_sitter(), start_date=START, end_date=START, status='accepted'
+        )
+
+    def pay(self, key, **data):
+        return self.client.post(
+            '/api/payments/process_payment/', {'booking': self.booking.id, **data}, format='json',
+            HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replays_the_response(self):
+        first = self.pay('key-1')
+        self.assertEqual(first.status_code, 201, first.data)
+        mail.outbox.clear()
+        retry = self.pay('key-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['payment']['transaction_id'], first.data['payment']['transaction_id'])
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(mail.outbox, [])
+
+    def test_keys_are_per_user(self):
+        self.assertEqual(self.pay('key-1').status_code, 201)
+        other = make_owner('Other')
+        IdempotencyKey.objects.create(user=other, key='key-2', endpoint='/', fingerprint='x', status_code=200)
+        # Another user's key does not collide with this one
+        response = self.pay('key-2')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_different_request_is_rejected(self):
+        self.assertEqual(self.pay('key-1').status_code, 201)
+        response = self.pay('key-1', payment_type='paypal')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_request_in_progress_is_a_conflict(self):
+        retries = []
+        real_run = idempotency.run
+
+        def retry_while_running(record, build):
+            # The first request reserved the key but has not stored its response yet
+            self.assertIsNone(record.status_code)
+            retries.append(self.pay('key-1'))
+            return real_run(record, build)
+
+        with mock.patch('core.idempotency.run', side_effect=retry_while_running):
+            self.assertEqual(self.pay('key-1').status_code, 201)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_server_errors_release_the_key(self):
+        self.client.raise_request_exception = False
+        with mock.patch('core.views.new_transaction_id', side_effect=RuntimeError('Payment provider down')):
+            self.assertEqual(self.pay('key-1').status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.pay('key-1').status_code, 201)
+
+    def test_client_errors_are_replayed(self):
+        self.booking.status = 'paid'
+        self.booking.save()
+        self.assertEqual(self.pay('key-1').status_code, 400)
+        self.booking.status = 'accepted'
+        self.booking.save()
+        response = self.pay('key-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_expired_keys(self):
+        self.assertEqual(self.pay('key-1').status_code, 201)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(hours=25))
+        IdempotencyKey.objects.create(user=self.owner, key='key-2', endpoint='/', fingerprint='x')
+        self.assertEqual(purge_expired_keys(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['key-2'])
+
+
+class TransactionIdTests(CoreTestCase):
+    def test_format(self):
+        ulid = new_ulid()
+        self.assertEqual(len(ulid), 26)
+        self.assertTrue(set(ulid) <= set(ALPHABET))
+        self.assertRegex(new_transaction_id(), r'^TR-[0-9A-HJKMNP-TV-Z]{26}$')
+        self.assertTrue(new_transaction_id('TR-COMP').startswith('TR-COMP-'))
+
+    def test_timestamp_encoding(self):
+        self.assertEqual(new_ulid(0)[:10], '0000000000')
+        self.assertEqual(new_ulid(32)[:10], '0000000010')
+        # Largest 48-bit timestamp
+        self.assertEqual(new_ulid(2 ** 48 - 1)[:10], '7ZZZZZZZZZ')
+
+    def test_ids_sort_by_time(self):
+        timestamps = [0, 1, 31, 32, 1_000, 1_700_000_000_000, 1_700_000_000_001, 2 ** 48 - 1]
+        ids = [new_ulid(timestamp) for timestamp in timestamps]
+        self.assertEqual(sorted(ids), ids)
+
+    def test_ids_are_unique(self):
+        # Same millisecond: only the 80 random bits tell the IDs apart
+        ids = {new_ulid(1_700_000_000_000) for _ in range(10_000)}
+        self.assertEqual(len(ids), 10_000)
+
+    def test_lookup_by_transaction_id(self):
+        owner = make_owner()
+        booking = Booking.objects.create(
+            animal=make_animal(owner), sitter=make_sitter(), start_date=START, end_date=START, status='accepted'
+        )
+        response = client_for(owner).post('/api/payments/process_payment/', {'booking': booking.id}, format='json')
+        transaction_id = response.data['payment']['transaction_id']
+
+        url = '/api/payments/by_transaction/'
+        response = client_for(owner).get(url, {'transaction_id': transaction_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['booking'], booking.id)
+        self.assertEqual(client_for(make_owner('Other')).get(url, {'transaction_id': transaction_id}).status_code, 404)
+        self.assertEqual(client_for(owner).get(url).status_code, 400)
+
+
+def reference_price(daily_rate, rule_set, start_date, end_date, animal_type=None):
+    """
+    Day-by-day price, as the closed form of compute_price must compute it.
+    """
+    total = Decimal(0)
+    day = start_date
+    while day <= end_date:
+        percent = rule_set['animal_type'].get(animal_type, 0)
+        if day.weekday() >= 5:
+            percent += rule_set['weekend']
+        for season_start, season_end, season_percent in rule_set['seasons']:
+            if season_start <= day <= season_end:
+                percent += season_percent
+        total += daily_rate + daily_rate * Decimal(percent) / 100
+        day += timedelta(days=1)
+    return max(total, Decimal(0)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class PricingTests(CoreTestCase):
+    RULE_SET = {
+        'animal_type': {'dog': Decimal('10'), 'cat': Decimal('-5')},
+        'weekend': Decimal('25'),
+        'seasons': [
+            (date(2099, 3, 10), date(2099, 3, 20), Decimal('15.5')),
+            (date(2099, 3, 18), date(2099, 4, 2), Decimal('-30')),
+        ],
+    }
+
+    def test_closed_forms_match_day_by_day(self):
+        season_start, season_end = date(2099, 3, 10), date(2099, 3, 20)
+        for start_offset in range(10):
+            for length in range(-1, 40):
+                start_date = START + timedelta(days=start_offset)
+                end_date = start_date + timedelta(days=length)
+                days = [start_date + timedelta(days=offset) for offset in range(length + 1)]
+                with self.subTest(start_date=start_date, end_date=end_date):
+                    self.assertEqual(weekend_days(start_date, end_date), sum(day.weekday() >= 5 for day in days))
+                    self.assertEqual(
+                        overlap_days(start_date, end_date, season_start, season_end),
+                        sum(season_start <= day <= season_end for day in days)
+                    )
+                    for animal_type in ('dog', 'cat', 'bird'):
+                        self.assertEqual(
+                            compute_price(Decimal('13.37'), self.RULE_SET, start_date, end_date, animal_type),
+                            reference_price(Decimal('13.37'), self.RULE_SET, start_date, end_date, animal_type)
+                        )
+
+    def test_discounts_never_make_a_negative_price(self):
+        rule_set = {'animal_type': {}, 'weekend': Decimal('-150'), 'seasons': []}
+        saturday = START + timedelta(days=5)
+        self.assertEqual(compute_price(Decimal('10'), rule_set, saturday, saturday + timedelta(days=1)), Decimal(0))
+
+    def test_provider_rules_replace_common_rules(self):
+        sitter = make_sitter()
+        PricingRule.objects.bulk_create([
+            PricingRule(rule_type='animal_type', animal_type='dog', percent=10),
+            PricingRule(rule_type='animal_type', animal_type='cat', percent=20),
+            PricingRule(rule_type='weekend', percent=25),
+            PricingRule(rule_type='season', start_date=START, end_date=START, percent=50),
+            PricingRule(provider=sitter, rule_type='animal_type', animal_type='dog', percent=5),
+            PricingRule(provider=sitter, rule_type='weekend', percent=0),
+        ])
+        rule_set = compile_rules(PricingRule.objects.filter(Q(provider__isnull=True) | Q(provider=sitter)))
+        self.assertEqual(rule_set, {
+            'animal_type': {'dog': 5, 'cat': 20},
+            'weekend': 0,
+            'seasons': [(START, START, 50)],
+        })
+
+    def test_booking_totals_are_set_on_save(self):
+        sitter = make_sitter()
+        sitter.daily_rate = Decimal('20.00')
+        sitter.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            PricingRule.objects.create(rule_type='weekend', percent=50)
+        # Monday to Sunday: 7 days, two of them +50%
+        booking = Booking.objects.create(
+            animal=make_animal(make_owner()), sitter=sitter, start_date=START, end_date=START + timedelta(days=6)
+        )
+        self.assertEqual((booking.total_days, booking.total_price), (7, Decimal('160.00')))
+
+        booking.end_date = START
+        booking.save()
+        self.assertEqual((booking.total_days, booking.total_price), (1, Decimal('20.00')))
+        # A partial save leaves the dates, so the totals, alone
+        booking.end_date = START + timedelta(days=1)
+        booking.save(update_fields=['status'])
+        booking.refresh_from_db()
+        self.assertEqual((booking.total_days, booking.total_price), (1, Decimal('20.00')))
+
+    def test_quote(self):
+        sitter = make_sitter()
+        company = make_company()
+        company.daily_rate = Decimal('30.00')
+        company.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            PricingRule.objects.create(rule_type='animal_type', animal_type='cat', percent=10)
+        response = APIClient().post('/api/quote/', {'animal_type': 'cat', 'items': [
+            {'provider': sitter.id, 'start_date': '2099-03-02', 'end_date': '2099-03-03'},
+            {'provider': company.id, 'start_date': '2099-03-02', 'end_date': '2099-03-02', 'animal_type': 'dog'},
+            {'provider': sitter.id, 'start_date': '2099-03-03', 'end_date': '2099-03-02'},
+            {'provider': make_owner().id, 'start_date': '2099-03-02', 'end_date': '2099-03-02'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual((results[0]['days'], results[0]['price'], results[0]['total']), (2, Decimal('22.00'), Decimal('24.80')))
+        self.assertEqual(results[1]['price'], Decimal('30.00'))
+        self.assertEqual([result['status'] for result in results], ['ok', 'ok', 'error', 'error'])
+        self.assertEqual(results[3]['error'], 'Pet sitter or company not found')
+
+
+class BookingOrderingTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        # Many bookings share each price and duration
+        for index in range(12):
+            start_date = START + timedelta(days=10 * index)
+            Booking.objects.create(
+                animal=make_animal(self.owner, name=f'Pet{index}'), sitter=self.sitter, start_date=start_date,
+                end_date=start_date + timedelta(days=index % 3)
+            )
+
+    def pages(self, **params):
+        """
+        Follows the next links of the booking list, returns the ids of every row.
+        """
+        client = client_for(self.owner)
+        response = client.get('/api/bookings/', params)
+        total = Booking.objects.count()
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, 200, response.data)
+            ids += [row['id'] for row in response.data['results']]
+            # More rows than the table means the pages repeat themselves: stop there
+            if not response.data['next'] or len(ids) > total:
+                return ids
+            response = client.get(response.data['next'])
+
+    def test_ordering_gets_an_id_tiebreaker(self):
+        pagination = KeysetPagination()
+        view = BookingViewSet()
+        for query, expected in (
+            ('', ('-id',)),
+            ('?ordering=total_price', ('total_price', 'id')),
+            ('?ordering=-total_days', ('-total_days', '-id')),
+            ('?ordering=total_days,-total_price', ('total_days', '-total_price', 'id')),
+        ):
+            request = Request(RequestFactory().get(f'/api/bookings/{query}'))
+            with self.subTest(query=query):
+                self.assertEqual(pagination.get_ordering(request, Booking.objects.all(), view), expected)
+
+    def test_ordered_pages_have_no_duplicates_or_gaps(self):
+        bookings = list(Booking.objects.values_list('id', 'total_price', 'total_days'))
+        for ordering, key in (
+            ('total_price', lambda row: (row[1], row[0])),
+            ('-total_price', lambda row: (-row[1], -row[0])),
+            ('-total_days', lambda row: (-row[2], -row[0])),
+        ):
+            expected = [row[0] for row in sorted(bookings, key=key)]
+            for page_size in (1, 2, 5):
+                with self.subTest(ordering=ordering, page_size=page_size):
+                    self.assertEqual(self.pages(ordering=ordering, page_size=page_size), expected)
+
+    def test_long_runs_of_equal_prices(self):
+        # More rows at one price than the offset cap of DRF's cursors (1000)
+        animal = make_animal(self.owner, name='Rex')
+        Booking.objects.bulk_create([
+            Booking(animal=animal, owner=self.owner, sitter=self.sitter, start_date=START, end_date=START,
+                    total_days=1, total_price=Decimal('25.00'))
+            for _ in range(1500)
+        ])
+        bookings = list(Booking.objects.values_list('id', 'total_price'))
+        expected = [row[0] for row in sorted(bookings, key=lambda row: (row[1], row[0]))]
+        self.assertEqual(self.pages(ordering='total_price', page_size=200), expected)
+        expected = [row[0] for row in sorted(bookings, key=lambda row: (-row[1], -row[0]))]
+        self.assertEqual(self.pages(ordering='-total_price', page_size=200), expected)
+
+    def test_previous_links(self):
+        client = client_for(self.owner)
+        response = client.get('/api/bookings/', {'ordering': 'total_price', 'page_size': 5})
+        first_page = [row['id'] for row in response.data['results']]
+        second_page = client.get(response.data['next'])
+        self.assertEqual(
+            [row['id'] for row in client.get(second_page.data['previous']).data['results']], first_page
+        )
+
+    def test_invalid_cursor(self):
+        client = client_for(self.owner)
+        for position in ('12.80', '["12.80"]'):
+            cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+            with self.subTest(position=position):
+                response = client.get('/api/bookings/', {'ordering': 'total_price', 'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class RecommendationTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vet = make_sitter('Vet', 'Auxiliaire vétérinaire, 8 ans de garde de chiens')
+        self.dogs = make_sitter('Dogs', '3 ans de garde de chiens')
+        self.cats = make_sitter('Cats', '10 ans de garde de chats')
+        self.owner = make_owner()
+        self.animal = Animal.objects.create(
+            owner=self.owner, name='Rex', animal_type='dog', maladie='Diabète, traitement quotidien'
+        )
+        # The snapshot is shared by the process: start from an empty one
+        feature_matrix.version = None
+
+    def ranking(self, **params):
+        response = client_for(self.owner).get(f'/api/animals/{self.animal.id}/recommended_sitters/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(item['id'], item['score']) for item in response.data['results']]
+
+    def test_masks(self):
+        dog, cat, medical, senior, large = (KEYWORD_CATEGORIES[name][0] for name in ('dog', 'cat', 'medical', 'senior', 'large'))
+        self.assertEqual(keyword_mask('Auxiliaire vétérinaire, garde de chiens'), dog | medical)
+        self.assertEqual(keyword_mask('Pas de mot-clé'), 0)
+        self.assertEqual(animal_mask(self.animal), dog | medical)
+        self.assertEqual(animal_mask(Animal(animal_type='dog', breed='Berger allemand', age='12 ans')), dog | senior | large)
+        # Default texts carry no information
+        self.assertEqual(animal_mask(Animal(animal_type='cat')), cat)
+
+    def test_ranking(self):
+        # Keywords (3 per category shared) + smoothed acceptance (2 * 1/2) + experience (0.2 per year)
+        self.assertEqual(self.ranking(), [(self.vet.id, 8.6), (self.dogs.id, 4.6), (self.cats.id, 3.0)])
+        self.assertEqual(self.ranking(limit=1), [(self.vet.id, 8.6)])
+
+    def test_acceptance_history(self):
+        record_status_changes([(self.dogs.id, 'pending', 'refused'), (self.dogs.id, 'pending', 'refused')])
+        record_status_changes([(self.cats.id, None, 'accepted'), (self.cats.id, 'pending', 'paid')])
+        features = SitterFeatures.objects.get(sitter=self.dogs)
+        self.assertEqual((features.accepted_count, features.refused_count), (0, 2))
+        # The snapshot is reloaded: 3 + 2 * 1/4 + 0.6 and 0 + 2 * 3/4 + 2
+        self.assertEqual(self.ranking(), [(self.vet.id, 8.6), (self.dogs.id, 4.1), (self.cats.id, 3.5)])
+
+        record_status_changes([(self.dogs.id, 'refused', 'accepted'), (self.dogs.id, 'refused', 'cancelled')])
+        features.refresh_from_db()
+        self.assertEqual((features.accepted_count, features.refused_count), (1, 0))
+
+    def test_booked_sitters_are_excluded(self):
+        Booking.objects.create(
+            animal=make_animal(make_owner('Other')), sitter=self.vet, start_date=START, end_date=START + timedelta(days=4)
+        )
+        Booking.objects.create(
+            animal=make_animal(make_owner('Third')), sitter=self.dogs, start_date=START, end_date=START, status='cancelled'
+        )
+        ranking = self.ranking(start_date=START + timedelta(days=4), end_date=START + timedelta(days=9))
+        self.assertEqual([sitter_id for sitter_id, _ in ranking], [self.dogs.id, self.cats.id])
+        ranking = self.ranking(start_date=START + timedelta(days=5), end_date=START + timedelta(days=9))
+        self.assertEqual(ranking[0][0], self.vet.id)
+
+    def test_snapshot_reloads_once_per_change(self):
+        feature_matrix.refresh()
+        with self.assertNumQueries(1):
+            feature_matrix.refresh()
+        make_sitter('New', 'Éducateur canin')
+        with self.assertNumQueries(2):
+            feature_matrix.refresh()
+        self.assertIn(User.objects.get(name='New').id, feature_matrix.sitter_ids)
+
+    def test_concurrent_refreshes_reload_once(self):
+        version = SitterFeatures.objects.aggregate(latest=Max('updated_at'), rows=Count('sitter'))
+        checked, loads = [], []
+
+        def stale_version(*args, **kwargs):
+            checked.append(True)
+            return version
+
+        def load(*args, **kwargs):
+            loads.append(True)
+            return []
+
+        # Every request finds the snapshot stale before any of them takes the lock
+        with mock.patch.object(QuerySet, 'aggregate', side_effect=stale_version), \
+                mock.patch.object(QuerySet, 'values_list', side_effect=load):
+            threads = [threading.Thread(target=feature_matrix.refresh) for _ in range(4)]
+            with feature_matrix.lock:
+                for thread in threads:
+                    thread.start()
+                while len(checked) < len(threads):
+                    time.sleep(0.01)
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(loads), 1)
+
+
+class CachedResponseTests(CoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_owner()
+        self.sitter = make_sitter()
+        self.company = make_company(capacity=1)
+
+    def get(self, url, user=None, **params):
+        response = client_for(user or self.owner).get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response['X-Cache'], [item['id'] for item in response.data['results']]
+
+    def test_directory_is_cached_until_a_user_changes(self):
+        self.assertEqual(self.get('/api/users/', role='petsitter'), ('MISS', [self.sitter.id]))
+        self.assertEqual(self.get('/api/users/', role='petsitter'), ('HIT', [self.sitter.id]))
+        # Different parameters, different entry
+        self.assertEqual(self.get('/api/users/', role='company')[0], 'MISS')
+
+        # Logging in does not change the directory
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.last_login = timezone.now()
+            self.owner.save(update_fields=['last_login'])
+        self.assertEqual(self.get('/api/users/', role='petsitter')[0], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other = make_sitter('Other')
+        self.assertEqual(self.get('/api/users/', role='petsitter'), ('MISS', [other.id, self.sitter.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(self.get('/api/users/', role='petsitter'), ('MISS', [self.sitter.id]))
+
+    def test_companies_list_is_shared_by_sitters(self):
+        self.assertEqual(self.get('/api/users/companies/', self.sitter), ('MISS', [self.company.id]))
+        self.assertEqual(self.get('/api/users/companies/', make_sitter('Other')), ('HIT', [self.company.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.name = 'Renamed'
+            self.company.save()
+        self.assertEqual(self.get('/api/users/companies/', self.sitter)[0], 'MISS')
+
+    def test_availability_follows_company_bookings(self):
+        url = '/api/users/available_companies/'
+        params = {'start_date': START, 'end_date': START}
+        self.assertEqual(self.get(url, **params), ('MISS', [self.company.id]))
+        self.assertEqual(self.get(url, **params), ('HIT', [self.company.id]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = CompanyBooking.objects.create(
+                animal=make_animal(self.owner), company=self.company, start_date=START, end_date=START,
+                company_paid=True
+            )
+        # A pending booking takes no place, but the entry was still invalidated
+        self.assertEqual(self.get(url, **params), ('MISS', [self.company.id]))
+
+        # Accepted through a queryset UPDATE, which sends no post_save signal
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for(self.company).post(
+                '/api/company-bookings/bulk_status/', {'ids': [booking.id], 'status': 'accepted'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.get(url, **params), ('MISS', []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stale = CompanyBooking.objects.create(
+                animal=make_animal(self.owner, name='Felix'), company=make_company('Second'),
+                start_date=START, end_date=START
+            )
+        self.assertEqual(self.get(url, **params)[0], 'MISS')
+        CompanyBooking.objects.filter(id=stale.id).update(created_at=timezone.now() - timedelta(days=10))
+        self.assertEqual(self.get(url, **params)[0], 'HIT')
+        # Expired in bulk by the expiry job
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_stale_bookings()['company_bookings'], 1)
+        self.assertEqual(self.get(url, **params)[0], 'MISS')
+
+    def test_pricing_rules_invalidate_the_compiled_rule_sets(self):
+        def price():
+            response = APIClient().post('/api/quote/', {'items': [
+                {'provider': self.sitter.id, 'start_date': '2099-03-02', 'end_date': '2099-03-02', 'animal_type': 'dog'},
+            ]}, format='json')
+            return response.data['results'][0]['price']
+
+        self.assertEqual(price(), Decimal('10.00'))
+        # Cached rule set: the provider and the version only, no rule query
+        with self.assertNumQueries(2):
+            self.assertEqual(price(), Decimal('10.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            rule = PricingRule.objects.create(rule_type='animal_type', animal_type='dog', percent=20)
+        self.assertEqual(price(), Decimal('12.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            rule.delete()
+        self.assertEqual(price(), Decimal('10.00'))
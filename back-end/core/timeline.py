@@ -0,0 +1,148 @@
+"""
+Unified booking timeline of a user: pet sitter bookings, company bookings and pet
+sitter/company bookings in one UNION ALL query with a common projection.
+
+Rows are sorted by (start_date, kind, id) and paginated with a keyset cursor. A union
+cannot be filtered once combined, so the cursor condition is pushed into every member
+of the union: each member only reads the rows after the cursor.
+"""
+import base64
+import binascii
+
+from django.db.models import CharField, F, IntegerField, Q, Value
+from django.utils.dateparse import parse_date
+
+from .models import Booking, CompanyBooking, PetSitterCompanyBooking
+
+COLUMNS = (
+    'kind', 'id', 'start_date', 'end_date', 'status',
+    'animal_id', 'animal_name', 'counterpart_id', 'counterpart_name', 'service_type',
+)
+KINDS = ('booking', 'company_booking', 'petsitter_company_booking')
+
+
+def timeline_members(user):
+    """
+    Returns {kind: queryset} of the booking rows involving a user, each annotated with the
+    common projection. The counterpart is the other party of the booking (for staff, the
+    pet sitter or company providing the service).
+    """
+    is_admin = user.is_staff or user.is_superuser
+    members = {}
+
+    if is_admin or user.role in ('petowner', 'petsitter'):
+        bookings = Booking.objects.all()
+        counterpart = 'sitter'
+        if not is_admin and user.role == 'petowner':
+            bookings = bookings.filter(owner=user)
+        elif not is_admin:
+            bookings = bookings.filter(sitter=user)
+            counterpart = 'owner'
+        members['booking'] = bookings.annotate(
+            animal_name=F('animal__name'),
+            counterpart_id=F(f'{counterpart}__id'),
+            counterpart_name=F(f'{counterpart}__name'),
+            service_type=Value(None, output_field=CharField()),
+        )
+
+    if is_admin or user.role in ('petowner', 'company'):
+        company_bookings = CompanyBooking.objects.all()
+        counterpart = 'company'
+        if not is_admin and user.role == 'petowner':
+            company_bookings = company_bookings.filter(owner=user)
+        elif not is_admin:
+            company_bookings = company_bookings.filter(company=user)
+            counterpart = 'owner'
+        members['company_booking'] = company_bookings.annotate(
+            animal_name=F('animal__name'),
+            counterpart_id=F(f'{counterpart}__id'),
+            counterpart_name=F(f'{counterpart}__name'),
+            service_type=Value(None, output_field=CharField()),
+        )
+
+    if is_admin or user.role in ('petsitter', 'company'):
+        collaborations = PetSitterCompanyBooking.objects.all()
+        counterpart = 'company'
+        if not is_admin and user.role == 'petsitter':
+            collaborations = collaborations.filter(petsitter=user)
+        elif not is_admin:
+            collaborations = collaborations.filter(company=user)
+            counterpart = 'petsitter'
+        members['petsitter_company_booking'] = collaborations.annotate(
+            animal_id=Value(None, output_field=IntegerField()),
+            animal_name=Value(None, output_field=CharField()),
+            counterpart_id=F(f'{counterpart}__id'),
+            counterpart_name=F(f'{counterpart}__name'),
+        )
+
+    return {
+        kind: queryset.annotate(kind=Value(kind, output_field=CharField()))
+        for kind, queryset in members.items()
+    }
+
+
+def encode_cursor(row):
+    """
+    Encodes the sort key (start_date, kind, id) of the last row of a page.
+    """
+    raw = f"{row['start_date'].isoformat()}|{row['kind']}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor into (start_date, kind, id). Raises ValueError if it is invalid.
+    """
+    try:
+        start_date, kind, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        start_date = parse_date(start_date)
+        row_id = int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if start_date is None or kind not in KINDS:
+        raise ValueError('Invalid cursor')
+    return start_date, kind, row_id
+
+
+def after_cursor(kind, position, descending=False):
+    """
+    Condition selecting, inside one member of the union, the rows sorted after a cursor.
+    Since kind is constant within a member, the (start_date, kind, id) comparison simplifies.
+    """
+    start_date, cursor_kind, row_id = position
+    after = 'lt' if descending else 'gt'
+    if kind == cursor_kind:
+        return Q(**{f'start_date__{after}': start_date}) | Q(start_date=start_date, **{f'id__{after}': row_id})
+    if (kind > cursor_kind) != descending:
+        return Q(**{f'start_date__{after}e': start_date})
+    return Q(**{f'start_date__{after}': start_date})
+
+
+def booking_timeline(user, statuses=None, kinds=None, date_from=None, date_to=None,
+                     position=None, descending=False, limit=50):
+    """
+    Returns up to `limit` rows of the user's timeline (dicts with the COLUMNS keys) and
+    whether more rows follow. statuses and kinds restrict the rows, date_from / date_to keep
+    the bookings overlapping the window, position is a decoded cursor.
+    """
+    querysets = []
+    for kind, queryset in timeline_members(user).items():
+        if kinds and kind not in kinds:
+            continue
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        if date_from:
+            queryset = queryset.filter(end_date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(start_date__lte=date_to)
+        if position:
+            queryset = queryset.filter(after_cursor(kind, position, descending))
+        querysets.append(queryset.values(*COLUMNS))
+
+    if not querysets:
+        return [], False
+
+    rows = querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]
+    ordering = ('-start_date', '-kind', '-id') if descending else ('start_date', 'kind', 'id')
+    rows = list(rows.order_by(*ordering)[:limit + 1])
+    return rows[:limit], len(rows) > limit
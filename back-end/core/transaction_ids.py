@@ -0,0 +1,43 @@
+"""
+Payment transaction IDs.
+
+IDs are ULID-style: 48 bits of millisecond timestamp followed by 80 random bits, written
+in Crockford base32 (26 characters). They sort by creation time to the millisecond, and
+two IDs created in the same millisecond only collide with probability 2^-80. The type
+prefix of the payment (TR, TR-COMP...) is kept, so IDs sort chronologically within each
+prefix.
+"""
+import secrets
+import time
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32: no I, L, O, U
+TIME_LENGTH = 10  # 48 bits of milliseconds
+RANDOM_BITS = 80
+RANDOM_LENGTH = 16
+
+
+def encode(value, length):
+    """
+    Encodes an integer in Crockford base32 on a fixed number of characters.
+    """
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def new_ulid(timestamp_ms=None):
+    """
+    Returns a 26-character ULID for the given time (milliseconds since the epoch, default now).
+    """
+    if timestamp_ms is None:
+        timestamp_ms = time.time_ns() // 1_000_000
+    return encode(timestamp_ms, TIME_LENGTH) + encode(secrets.randbits(RANDOM_BITS), RANDOM_LENGTH)
+
+
+def new_transaction_id(prefix='TR'):
+    """
+    Returns a new transaction ID, e.g. TR-01J9Z3K8M2XQ7N4V5B6C8D9E0F.
+    """
+    return f'{prefix}-{new_ulid()}'
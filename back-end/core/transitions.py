@@ -0,0 +1,239 @@
+"""
+Booking state machines.
+
+For each booking model, TRANSITIONS lists the status changes each party may make and the
+statuses they may start from; administrators may set any status. A transition is applied
+to a whole batch of bookings with one conditional UPDATE per status read, followed by the
+side effects of the model (sitter counters, company occupancy, cancellation cascade), the
+cache versions and the notifications.
+
+Status updates are compare-and-swaps: the UPDATE only matches rows still in the status
+they were read with, and a row changed meanwhile by a concurrent request raises
+StatusConflict (HTTP 409) instead of being silently overwritten.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .caching import AVAILABILITY_SCOPE, invalidate
+from .cascade import cancel_linked_collaborations
+from .conditional import change_scopes, model_scope, user_scope
+from .models import Booking, CompanyBooking, PetSitterCompanyBooking
+from .notifications import enqueue, send_status_change_emails
+from .occupancy import shift_bookings_occupancy
+from .recommendations import record_status_changes
+
+MAX_BULK_TRANSITIONS = 100
+
+# Parties of each booking model: user role -> field pointing to the user
+PARTIES = {
+    Booking: {'petsitter': 'sitter', 'petowner': 'owner'},
+    CompanyBooking: {'company': 'company', 'petowner': 'owner'},
+    PetSitterCompanyBooking: {'petsitter': 'petsitter', 'company': 'company'},
+}
+
+# Allowed transitions: role -> {new status: statuses it can be reached from}
+TRANSITIONS = {
+    Booking: {
+        'petsitter': {'accepted': ['pending'], 'refused': ['pending']},
+        'petowner': {'cancelled': ['pending', 'accepted', 'paid']},
+    },
+    CompanyBooking: {
+        'company': {'accepted': ['pending'], 'refused': ['pending']},
+        'petowner': {'cancelled': ['pending', 'accepted', 'paid']},
+    },
+    PetSitterCompanyBooking: {
+        'company': {'accepted': ['pending'], 'refused': ['pending'], 'cancelled': ['accepted']},
+        'petsitter': {'cancelled': ['pending', 'accepted']},
+    },
+}
+
+# Extra condition of a transition: (model, role, new status) -> (field, required value, error)
+CONDITIONS = {
+    (CompanyBooking, 'company', 'accepted'): (
+        'company_paid', True, 'Please proceed to payment to confirm this booking'
+    ),
+}
+
+ROLE_LABELS = {'petsitter': 'Pet sitters', 'petowner': 'Pet owners', 'company': 'Companies'}
+
+# Relations read by the side effects and the notifications
+RELATED = {
+    Booking: ('animal__owner', 'sitter'),
+    CompanyBooking: ('animal__owner', 'company'),
+    PetSitterCompanyBooking: ('petsitter', 'company'),
+}
+
+
+class StatusConflict(Exception):
+    """
+    A booking or payment changed status between the moment it was read and its update.
+    """
+
+
+def swap_status(instance, expected, new_status, field='status', **values):
+    """
+    Compare-and-swap of a status column:
+    UPDATE ... SET field = new_status[, values] WHERE id = ? AND field = expected.
+    Only the given columns are written. Updates the instance, or raises StatusConflict
+    if the row is no longer in the expected status.
+    """
+    model = type(instance)
+    values[field] = new_status
+    if not model.objects.filter(pk=instance.pk, **{field: expected}).update(**values):
+        raise StatusConflict(f'This {model._meta.verbose_name} was modified by another request. Please reload it.')
+    for name, value in values.items():
+        setattr(instance, name, value)
+
+    # A bulk UPDATE sends no post_save signal: bump the cache versions here
+    scopes = change_scopes(instance)
+    if model is CompanyBooking:
+        scopes.append(AVAILABILITY_SCOPE)
+    transaction.on_commit(lambda: invalidate(*scopes))
+
+
+def booking_effects(bookings, old_statuses, new_status, role):
+    """
+    Pet sitter bookings: acceptance counters of the sitters, and cancellation of the
+    sitters' bookings with companies when the owner cancels.
+    """
+    record_status_changes(
+        (booking.sitter_id, old_statuses[booking.id], new_status) for booking in bookings
+    )
+    if role == 'petowner' and new_status == 'cancelled':
+        cancel_linked_collaborations(bookings)
+
+
+def company_booking_effects(bookings, old_statuses, new_status, role):
+    """
+    Company bookings: places taken or freed in the occupancy projection.
+    """
+    occupying = CompanyBooking.OCCUPYING_STATUSES
+    if new_status in occupying:
+        shift_bookings_occupancy([b for b in bookings if old_statuses[b.id] not in occupying], 1)
+    else:
+        shift_bookings_occupancy([b for b in bookings if old_statuses[b.id] in occupying], -1)
+
+
+SIDE_EFFECTS = {
+    Booking: booking_effects,
+    CompanyBooking: company_booking_effects,
+}
+
+
+def user_role(model, user):
+    """
+    Role of a user in the transitions of a model: 'admin', a party role or None.
+    """
+    if user.is_staff or user.is_superuser:
+        return 'admin'
+    return user.role if user.role in PARTIES[model] else None
+
+
+def party_id(booking, lookup):
+    """
+    Id of the user behind a party lookup of a booking ('sitter', 'owner'...).
+    """
+    *path, field = lookup.split('__')
+    for name in path:
+        booking = getattr(booking, name)
+    return getattr(booking, f'{field}_id')
+
+
+def allowed_sources(model, role, new_status):
+    """
+    Statuses from which a role may move a booking to new_status (empty if it may not).
+    """
+    statuses = [status for status, _ in model.STATUS_CHOICES]
+    if new_status not in statuses:
+        return []
+    if role == 'admin':
+        return [status for status in statuses if status != new_status]
+    return TRANSITIONS[model].get(role, {}).get(new_status, [])
+
+
+def transition_error(model, user, new_status):
+    """
+    Checks that a user may move bookings of a model to new_status at all.
+    Returns None or (error message, HTTP status).
+    """
+    role = user_role(model, user)
+    if role is None:
+        return 'You are not authorized to modify this booking', 403
+    statuses = [status for status, _ in model.STATUS_CHOICES]
+    if new_status not in statuses:
+        return f'Invalid status. Valid statuses are: {", ".join(statuses)}', 400
+    if not allowed_sources(model, role, new_status):
+        targets = ', '.join(f'"{status}"' for status in TRANSITIONS[model][role])
+        return f'{ROLE_LABELS[role]} can only change the status to {targets}', 400
+    return None
+
+
+def booking_error(model, booking, user, new_status):
+    """
+    Checks that a user may move one booking to new_status (transition_error must pass first).
+    Returns None or (error message, HTTP status).
+    """
+    role = user_role(model, user)
+    if role != 'admin' and party_id(booking, PARTIES[model][role]) != user.id:
+        return 'You are not authorized to modify this booking', 403
+    if booking.status not in allowed_sources(model, role, new_status):
+        return f'Cannot change the status from "{booking.status}" to "{new_status}"', 409
+    condition = CONDITIONS.get((model, role, new_status))
+    if condition and getattr(booking, condition[0]) != condition[1]:
+        return condition[2], 409
+    return None
+
+
+def apply_transition(model, user, ids, new_status):
+    """
+    Moves the bookings with the given ids to new_status in one transaction (transition_error
+    must pass first). Valid changes are applied even if others fail. Returns one result per
+    id, in the same order: {'id', 'status': 'updated'} or {'id', 'status': 'error', 'error'}.
+    Raises StatusConflict (and rolls back the batch) if a row changed while being updated.
+    """
+    role = user_role(model, user)
+    results = {}
+    with transaction.atomic():
+        bookings = model.objects.select_related(*RELATED[model]).select_for_update(of=('self',)).filter(
+            id__in=ids
+        ).order_by('id')
+        changed = []
+        for booking in bookings:
+            error = booking_error(model, booking, user, new_status)
+            if error:
+                results[booking.id] = {'id': booking.id, 'status': 'error', 'error': error[0]}
+            else:
+                changed.append(booking)
+
+        if changed:
+            old_statuses = {booking.id: booking.status for booking in changed}
+            by_old_status = defaultdict(list)
+            for booking in changed:
+                by_old_status[booking.status].append(booking.id)
+            # One conditional UPDATE per status read: rows changed meanwhile are not overwritten
+            for old_status, booking_ids in by_old_status.items():
+                updated = model.objects.filter(id__in=booking_ids, status=old_status).update(status=new_status)
+                if updated != len(booking_ids):
+                    raise StatusConflict('Some bookings were modified by another request. Please reload them.')
+            for booking in changed:
+                booking.status = new_status
+                results[booking.id] = {'id': booking.id, 'status': 'updated'}
+
+            side_effects = SIDE_EFFECTS.get(model)
+            if side_effects:
+                side_effects(changed, old_statuses, new_status, role)
+
+            # A bulk UPDATE sends no post_save signal: bump the cache versions here
+            scopes = {model_scope(model)}
+            for booking in changed:
+                scopes.update(user_scope(party_id(booking, lookup)) for lookup in PARTIES[model].values())
+            if model is CompanyBooking:
+                scopes.add(AVAILABILITY_SCOPE)
+            transaction.on_commit(lambda: invalidate(*scopes))
+            transaction.on_commit(lambda: enqueue(send_status_change_emails, changed, new_status))
+
+    return [
+        results.get(booking_id, {'id': booking_id, 'status': 'error', 'error': 'Booking not found'})
+        for booking_id in ids
+    ]
@@ -1,12 +1,17 @@
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from django.contrib.auth.hashers import make_password
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import get_user_model
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils.dateparse import parse_date
 from django.utils import timezone
 from datetime import datetime, timedelta
 import random
@@ -14,237 +19,182 @@ import string
 import logging
 import sys
 
-from .models import Animal, Booking, CompanyBooking, PetSitterCompanyBooking, Payment
-from .serializers import UserSerializer, AnimalSerializer, BookingSerializer, CompanyBookingSerializer, PetSitterCompanyBookingSerializer, PaymentSerializer
+from .models import Animal, Booking, CompanyBooking, CompanyBookingSeries, PetSitterCompanyBooking, Payment
+from .serializers import UserSerializer, AnimalSerializer, BookingSerializer, CompanyBookingSerializer, CompanyBookingSeriesSerializer, PetSitterCompanyBookingSerializer, PaymentSerializer
+from .pagination import DirectoryPagination
+from .occupancy import update_company_occupancy, release_company_occupancy, with_free_capacity
+from .availability import sitter_calendar, free_sitters, animal_conflicts, occurrence_dates
+from .recurrence import (
+    occurrence_conflicts, full_dates, series_calendar, confirm_occurrences, validate_confirmation,
+    default_window, MAX_SERIES_DAYS, MAX_INTERVAL_WEEKS
+)
+from .fulltext import search_users
+from .geocoding import geocode, bounding_box, distance_km
+from .recommendations import record_booking_status, recommend_sitters
+from .bulk_bookings import create_bookings, MAX_BULK_ITEMS
+from .notifications import send_booking_status_email
+from .cascade import cancel_linked_collaborations
+from .transitions import transition_error, booking_error, apply_transition, swap_status, StatusConflict, MAX_BULK_TRANSITIONS
+from .timeline import booking_timeline, encode_cursor, decode_cursor, KINDS as TIMELINE_KINDS
+from .caching import cached_response, cache_stats, DIRECTORY_SCOPE, AVAILABILITY_SCOPE
+from .idempotency import idempotent
+from .transaction_ids import new_transaction_id
+from .pricing import quote as quote_prices, collaboration_price, service_fee as booking_service_fee, MAX_QUOTE_ITEMS
+from .conditional import ConditionalGetMixin, conditional_get, conditional_response, own_rows, all_rows, own_rows_scopes, user_scope, model_scope
 
 User = get_user_model()
 
-# Helper function to send emails at each step of the booking process
-def send_booking_status_email(booking, status, booking_type='standard'):
-    """
-    Sends a notification email to inform users about a change in booking status.
-    
-    Args:
-        booking: The booking object (Booking, CompanyBooking or PetSitterCompanyBooking)
-        status: The new status of the booking
-        booking_type: The type of booking ('standard', 'company', or 'petsitter_company')
-    """
-    try:
-        # Prepare details based on booking type
-        if booking_type == 'standard':
-            # Standard booking (pet owner -> pet sitter)
-            pet_owner = booking.animal.owner
-            pet_sitter = booking.sitter
-            animal = booking.animal
-            start_date = booking.start_date
-            end_date = booking.end_date
-            
-            # Email to pet owner
-            owner_subject = f"Booking update - {animal.name}"
-            owner_message = f"""Hello {pet_owner.name},
+logger = logging.getLogger(__name__)
 
-The status of your booking for {animal.name} with {pet_sitter.name} has been updated.
+# Roles that can be listed in the public directory
+DIRECTORY_ROLES = ['petsitter', 'company']
 
-New status: {status}
-Dates: {start_date} to {end_date}
+# Keywords searched in the experience text for each service of the frontend filter
+SERVICE_KEYWORDS = {
+    'garde': ['garde', 'pension', 'home'],
+    'promenade': ['promenade', 'balade', 'walk'],
+    'visite': ['visite', 'visit'],
+}
 
-"""
-            if status == 'pending':
-                owner_message += "Your booking request has been registered and is awaiting confirmation from the pet sitter."
-            elif status == 'accepted':
-                owner_message += "Your booking has been accepted by the pet sitter. You can now proceed to payment."
-            elif status == 'refused':
-                owner_message += "We're sorry, but your booking request has been declined by the pet sitter."
-            elif status == 'cancelled':
-                owner_message += "Your booking has been cancelled as requested."
-            elif status == 'paid':
-                owner_message += "Your payment has been confirmed. Your booking is now finalized."
-            
-            owner_message += "\n\nThank you for using Pet at Work!"
-            
-            send_mail(
-                owner_subject,
-                owner_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [pet_owner.email],
-                fail_silently=True,
-            )
-            
-            # Email to pet sitter
-            sitter_subject = f"Booking update - {animal.name}"
-            sitter_message = f"""Hello {pet_sitter.name},
-
-The status of a booking for the pet {animal.name} from {pet_owner.name} has been updated.
-
-New status: {status}
-Dates: {start_date} to {end_date}
-
-"""
-            if status == 'pending':
-                sitter_message += "A new booking request has been registered. Please accept or decline it from your personal area."
-            elif status == 'accepted':
-                sitter_message += "You have accepted this booking. The pet owner has been notified."
-            elif status == 'refused':
-                sitter_message += "You have declined this booking. The pet owner has been notified."
-            elif status == 'cancelled':
-                sitter_message += "This booking has been cancelled by the pet owner."
-            elif status == 'paid':
-                sitter_message += "Payment for this booking has been confirmed. The booking is now finalized."
-            
-            sitter_message += "\n\nThank you for using Pet at Work!"
-            
-            send_mail(
-                sitter_subject,
-                sitter_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [pet_sitter.email],
-                fail_silently=True,
-            )
-            
-        elif booking_type == 'company':
-            # Company booking (pet owner -> company)
-            pet_owner = booking.animal.owner
-            company = booking.company
-            animal = booking.animal
-            start_date = booking.start_date
-            end_date = booking.end_date
-            
-            # Email to pet owner
-            owner_subject = f"Company booking update - {animal.name}"
-            owner_message = f"""Hello {pet_owner.name},
+# Number of sitters returned by the recommendation endpoint
+DEFAULT_RECOMMENDATIONS = 10
+MAX_RECOMMENDATIONS = 50
 
-The status of your booking for {animal.name} with {company.name} has been updated.
+# Search radius of the nearby providers endpoint (km)
+DEFAULT_NEARBY_RADIUS_KM = 10
+MAX_NEARBY_RADIUS_KM = 200
 
-New status: {status}
-Dates: {start_date} to {end_date}
+# Rows per page of the booking timeline
+TIMELINE_PAGE_SIZE = 50
+TIMELINE_MAX_PAGE_SIZE = 200
 
-"""
-            if status == 'pending':
-                owner_message += "Your booking request has been registered and is awaiting confirmation from the company."
-            elif status == 'accepted':
-                owner_message += "Your booking has been accepted by the company. You can now proceed to payment."
-            elif status == 'refused':
-                owner_message += "We're sorry, but your booking request has been declined by the company."
-            elif status == 'cancelled':
-                owner_message += "Your booking has been cancelled as requested."
-            elif status == 'paid':
-                owner_message += "Your payment has been confirmed. Your booking is now finalized."
-            
-            owner_message += "\n\nThank you for using Pet at Work!"
-            
-            send_mail(
-                owner_subject,
-                owner_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [pet_owner.email],
-                fail_silently=True,
-            )
-            
-            # Email to company
-            company_subject = f"Booking update - {animal.name}"
-            company_message = f"""Hello {company.name},
+# Revenue reports: statuses counted by default, role of the provider of each booking model
+REVENUE_STATUSES = ['accepted', 'paid']
+PROVIDER_ROLES = {Booking: 'petsitter', CompanyBooking: 'company'}
 
-The status of a booking for the pet {animal.name} from {pet_owner.name} has been updated.
+def parse_query_date(value):
+    """
+    Parses an optional YYYY-MM-DD query parameter.
+    Returns None if the value is empty and raises ValueError if it is invalid.
+    """
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'Invalid date "{value}", expected format YYYY-MM-DD')
+    return parsed
+
+def update_booking_status(view, request, model, status_labels):
+    """
+    Applies a status change to the booking of a detail route and returns the response
+    of the update_status actions.
+    """
+    booking = view.get_object()
+    new_status = request.data.get('status')
 
-New status: {status}
-Dates: {start_date} to {end_date}
+    error = transition_error(model, request.user, new_status) or booking_error(model, booking, request.user, new_status)
+    if error:
+        return Response({'error': error[0]}, status=error[1])
 
-"""
-            if status == 'pending':
-                company_message += "A new booking request has been registered. Please accept or decline it from your company dashboard."
-            elif status == 'accepted':
-                company_message += "You have accepted this booking. The pet owner has been notified."
-            elif status == 'refused':
-                company_message += "You have declined this booking. The pet owner has been notified."
-            elif status == 'cancelled':
-                company_message += "This booking has been cancelled by the pet owner."
-            elif status == 'paid':
-                company_message += "Payment for this booking has been confirmed. The booking is now finalized."
-            
-            company_message += "\n\nThank you for using Pet at Work!"
-            
-            send_mail(
-                company_subject,
-                company_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [company.email],
-                fail_silently=True,
-            )
-            
-        elif booking_type == 'petsitter_company':
-            # Pet sitter -> company booking
-            pet_sitter = booking.petsitter
-            company = booking.company
-            start_date = booking.start_date
-            end_date = booking.end_date
-            
-            # Email to pet sitter
-            sitter_subject = f"Booking update with {company.name}"
-            sitter_message = f"""Hello {pet_sitter.name},
-
-The status of your booking with {company.name} has been updated.
+    try:
+        result = apply_transition(model, request.user, [booking.id], new_status)[0]
+    except StatusConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    if result['status'] == 'error':
+        return Response({'error': result['error']}, status=status.HTTP_409_CONFLICT)
+    booking.refresh_from_db()
+
+    status_label = status_labels.get(new_status, new_status)
+    serializer = view.get_serializer(booking)
+    return Response({
+        'message': f'Booking successfully {status_label}',
+        'booking': serializer.data
+    })
 
-New status: {status}
-Dates: {start_date} to {end_date}
-Service: {booking.get_service_type_display()}
+def bulk_status_update(request, model):
+    """
+    Applies one status change to several bookings of a model: {"ids": [...], "status": "..."}.
+    Valid changes are applied even if others fail, with one result per id.
+    """
+    ids = request.data.get('ids')
+    new_status = request.data.get('status')
+    if not isinstance(ids, list) or not ids:
+        return Response(
+            {'error': 'Please provide a non-empty list of booking ids'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(ids) > MAX_BULK_TRANSITIONS:
+        return Response(
+            {'error': f'At most {MAX_BULK_TRANSITIONS} bookings can be updated at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        ids = list(dict.fromkeys(int(booking_id) for booking_id in ids))
+    except (TypeError, ValueError):
+        return Response({'error': 'Booking ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
 
-"""
-            if status == 'pending':
-                sitter_message += "Your booking request has been registered and is awaiting confirmation from the company."
-            elif status == 'accepted':
-                sitter_message += "Your booking has been accepted by the company."
-            elif status == 'refused':
-                sitter_message += "We're sorry, but your booking request has been declined by the company."
-            elif status == 'cancelled':
-                sitter_message += "Your booking has been cancelled as requested."
-            elif status == 'finished':
-                sitter_message += "Your booking is now completed."
-            
-            sitter_message += "\n\nThank you for using Pet at Work!"
-            
-            send_mail(
-                sitter_subject,
-                sitter_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [pet_sitter.email],
-                fail_silently=True,
-            )
-            
-            # Email to company
-            company_subject = f"Booking update with {pet_sitter.name}"
-            company_message = f"""Hello {company.name},
+    error = transition_error(model, request.user, new_status)
+    if error:
+        return Response({'error': error[0]}, status=error[1])
 
-The status of a booking from pet sitter {pet_sitter.name} has been updated.
+    try:
+        results = apply_transition(model, request.user, ids, new_status)
+    except StatusConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    updated = sum(1 for result in results if result['status'] == 'updated')
+    return Response({
+        'updated': updated,
+        'failed': len(results) - updated,
+        'results': results
+    }, status=status.HTTP_200_OK if updated else status.HTTP_400_BAD_REQUEST)
+
+def booking_revenue(request, model, provider_field):
+    """
+    Revenue of the logged-in pet sitter or company (staff: every provider, or ?provider=id),
+    summed in the database from the stored booking prices, in total and per month of the start date.
+    Query parameters: from / to (YYYY-MM-DD) on the start date, status (comma-separated, default accepted,paid).
+    """
+    user = request.user
+    params = request.query_params
+    is_admin = user.is_staff or user.is_superuser
+    if not is_admin and user.role != PROVIDER_ROLES[model]:
+        return Response({'error': 'You are not authorized to access this resource'}, status=status.HTTP_403_FORBIDDEN)
 
-New status: {status}
-Dates: {start_date} to {end_date}
-Service: {booking.get_service_type_display()}
+    try:
+        date_from = parse_query_date(params.get('from'))
+        date_to = parse_query_date(params.get('to'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    statuses = [value for value in params.get('status', '').split(',') if value] or REVENUE_STATUSES
+    valid_statuses = [value for value, _ in model.STATUS_CHOICES]
+    if any(value not in valid_statuses for value in statuses):
+        return Response(
+            {'error': f'Invalid status. Valid statuses are: {", ".join(valid_statuses)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-"""
-            if status == 'pending':
-                company_message += "A new booking request has been registered. Please accept or decline it from your company dashboard."
-            elif status == 'accepted':
-                company_message += "You have accepted this booking. The pet sitter has been notified."
-            elif status == 'refused':
-                company_message += "You have declined this booking. The pet sitter has been notified."
-            elif status == 'cancelled':
-                company_message += "This booking has been cancelled by the pet sitter."
-            elif status == 'finished':
-                company_message += "This booking is now completed."
-            
-            company_message += "\n\nThank you for using Pet at Work!"
-            
-            send_mail(
-                company_subject,
-                company_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [company.email],
-                fail_silently=True,
-            )
-    
-    except Exception as e:
-        print(f"Error sending notification email: {str(e)}")
-        # Don't fail the operation if email sending fails
+    bookings = model.objects.filter(status__in=statuses)
+    if not is_admin:
+        bookings = bookings.filter(**{provider_field: user})
+    elif params.get('provider'):
+        bookings = bookings.filter(**{f'{provider_field}_id': params['provider']})
+    if date_from:
+        bookings = bookings.filter(start_date__gte=date_from)
+    if date_to:
+        bookings = bookings.filter(start_date__lte=date_to)
+
+    totals = bookings.aggregate(revenue=Sum('total_price'), bookings=Count('id'))
+    by_month = bookings.annotate(month=TruncMonth('start_date')).values('month').annotate(
+        revenue=Sum('total_price'), bookings=Count('id')
+    ).order_by('month')
+    return Response({
+        'revenue': totals['revenue'] or 0,
+        'bookings': totals['bookings'],
+        'by_month': list(by_month)
+    })
 
 class UserViewSet(viewsets.ModelViewSet):
     """
@@ -255,6 +205,53 @@ class UserViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['role']
 
+    def get_queryset(self):
+        """
+        Applies the full-text query ?q= (name and experience) to the list, ranked by relevance.
+        """
+        queryset = super().get_queryset()
+        query = self.request.query_params.get('q', '').strip()
+        if self.action == 'list' and query:
+            queryset = search_users(queryset, query).order_by('-relevance', 'id')
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        Directory lists (?role=petsitter or ?role=company) are served from the response cache.
+        Every list answers If-None-Match with 304 when no user changed.
+        """
+        role = request.query_params.get('role')
+
+        def build():
+            if role not in DIRECTORY_ROLES:
+                return super(UserViewSet, self).list(request, *args, **kwargs)
+            return cached_response(
+                request, [DIRECTORY_SCOPE], role,
+                lambda: super(UserViewSet, self).list(request, *args, **kwargs)
+            )
+
+        return conditional_response(request, [model_scope(User)], build)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Answers If-None-Match with 304 while the user has not changed.
+        """
+        return conditional_response(
+            request, [user_scope(kwargs.get('pk'))],
+            lambda: super(UserViewSet, self).retrieve(request, *args, **kwargs)
+        )
+
+    @property
+    def paginator(self):
+        """
+        Results ranked by relevance are paginated by page number, as a cursor needs a stable column order.
+        """
+        if self.action == 'list' and self.request.query_params.get('q', '').strip():
+            if not hasattr(self, '_search_paginator'):
+                self._search_paginator = DirectoryPagination()
+            return self._search_paginator
+        return super().paginator
+
     @action(detail=False, methods=['get'])
     def debug_filter(self, request):
         """
@@ -265,38 +262,231 @@ class UserViewSet(viewsets.ModelViewSet):
             queryset = User.objects.filter(role=role)
         else:
             queryset = User.objects.all()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Searches pet sitters or companies directly in the database and returns a paginated result.
+        Query parameters:
+        - role: 'petsitter' (default) or 'company'
+        - q: full-text query on the name and experience, results are ranked by relevance
+        - search: part of the name
+        - experience: minimum number of years of experience
+        - location: part of the address (city or postal code)
+        - service: 'garde', 'promenade' or 'visite' (matched against the experience text)
+        - start_date / end_date: only keep pet sitters without any active booking overlapping
+          these dates, or companies with a free place on every day of the window
+        - rating: accepted for compatibility with the frontend filters, no rating is stored yet
+        """
+        params = request.query_params
+        role = params.get('role', 'petsitter')
+        if role not in DIRECTORY_ROLES:
+            return Response(
+                {'error': f'Invalid role. Valid roles are: {", ".join(DIRECTORY_ROLES)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = User.objects.filter(role=role, is_active=True)
+
+        query = params.get('q', '').strip()
+        if query:
+            queryset = search_users(queryset, query)
+
+        search = params.get('search', '').strip()
+        if search:
+            queryset = queryset.filter(name__icontains=search)
+
+        experience = params.get('experience', '').strip()
+        if experience:
+            try:
+                queryset = queryset.filter(experience_years__gte=int(experience))
+            except ValueError:
+                return Response(
+                    {'error': 'The experience filter must be a number of years'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        location = params.get('location', '').strip()
+        if location:
+            queryset = queryset.filter(address__icontains=location)
+
+        service = params.get('service', '').strip()
+        if service:
+            keywords = SERVICE_KEYWORDS.get(service)
+            if keywords is None:
+                return Response(
+                    {'error': f'Invalid service. Valid services are: {", ".join(SERVICE_KEYWORDS)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            service_filter = Q()
+            for keyword in keywords:
+                service_filter |= Q(experience__icontains=keyword)
+            queryset = queryset.filter(service_filter)
+
+        if 'start_date' in params or 'end_date' in params:
+            try:
+                start_date = parse_query_date(params.get('start_date'))
+                end_date = parse_query_date(params.get('end_date'))
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if not start_date or not end_date:
+                return Response(
+                    {'error': 'Start and end dates are required to filter by availability'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if start_date > end_date:
+                return Response(
+                    {'error': 'The start date must be before the end date'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if role == 'petsitter':
+                queryset = free_sitters(queryset, start_date, end_date)
+            else:
+                queryset = with_free_capacity(queryset, start_date, end_date)
+
+        if query:
+            queryset = queryset.order_by('-relevance', 'name', 'id')
+        else:
+            queryset = queryset.order_by('name', 'id')
+
+        paginator = DirectoryPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Returns the companies within a radius, sorted by distance. Pet sitters have no
+        address (see User.clean), hence no coordinates, and are not searched.
+        Query parameters:
+        - radius: distance in km (default 10, max 200)
+        - lat / lon: origin coordinates, or near: an address, postal code or city
+          (geocoded offline). Without origin, the address of the logged-in user is used.
+        """
+        params = request.query_params
+        try:
+            radius = float(params.get('radius', DEFAULT_NEARBY_RADIUS_KM))
+            if 'lat' in params or 'lon' in params:
+                origin = (float(params['lat']), float(params['lon']))
+            elif params.get('near'):
+                origin = geocode(params['near'])
+            elif request.user.is_authenticated and request.user.latitude is not None:
+                origin = (request.user.latitude, request.user.longitude)
+            else:
+                origin = None
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'radius, lat and lon must be numbers, and lat and lon must be given together'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if origin is None:
+            return Response(
+                {'error': 'Unable to locate the origin. Please provide lat and lon, or a known postal code or city'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < radius <= MAX_NEARBY_RADIUS_KM:
+            return Response(
+                {'error': f'The radius must be between 0 and {MAX_NEARBY_RADIUS_KM} km'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Indexed bounding box prefilter, then exact distance on the few remaining rows
+        min_lat, max_lat, min_lon, max_lon = bounding_box(origin[0], origin[1], radius)
+        candidates = User.objects.filter(
+            role='company',
+            is_active=True,
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lon, max_lon)
+        )
+        providers = []
+        for provider in candidates:
+            distance = distance_km(origin[0], origin[1], provider.latitude, provider.longitude)
+            if distance <= radius:
+                provider.distance_km = round(distance, 2)
+                providers.append(provider)
+        providers.sort(key=lambda provider: (provider.distance_km, provider.id))
+
+        paginator = DirectoryPagination()
+        page = paginator.paginate_queryset(providers, request, view=self)
+        data = self.get_serializer(page, many=True).data
+        for item, provider in zip(data, page):
+            item['distance_km'] = provider.distance_km
+        return paginator.get_paginated_response(data)
 
     @action(detail=False, methods=['get'])
     def available_companies(self, request):
         """
         Returns only companies that are not full (available capacity).
+        Optional query parameters start_date and end_date (YYYY-MM-DD) restrict the
+        check to this window: a company is available if its busiest day in the window
+        stays below its capacity. Without dates, only days from today onward are checked.
         """
-        # Get all companies
-        companies = User.objects.filter(role='company')
-        
-        # List to store companies with available capacity
-        available_companies = []
-        
-        for company in companies:
-            # Check if the company has defined a capacity
-            if not company.capacity or company.capacity <= 0:
-                continue
-                
-            # Count current accepted bookings
-            accepted_bookings_count = CompanyBooking.objects.filter(
-                company=company, 
-                status='accepted'
-            ).count()
-            
-            # Check if the company still has available capacity
-            if accepted_bookings_count < company.capacity:
-                available_companies.append(company)
-        
-        serializer = self.get_serializer(available_companies, many=True)
-        return Response(serializer.data)
+        try:
+            start_date = parse_query_date(request.query_params.get('start_date'))
+            end_date = parse_query_date(request.query_params.get('end_date'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if start_date and end_date and start_date > end_date:
+            return Response(
+                {'error': 'The start date must be before the end date'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not start_date and not end_date:
+            start_date = timezone.localdate()
+
+        def build():
+            # One query instead of one count per company
+            companies = with_free_capacity(User.objects.filter(role='company'), start_date, end_date)
+            page = self.paginate_queryset(companies)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        # The default start date is part of the key, so entries do not outlive the day
+        request_role = f'company-available-{start_date}'
+        return cached_response(request, [DIRECTORY_SCOPE, AVAILABILITY_SCOPE], request_role, build)
         
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        """
+        Returns the busy and free date ranges of a pet sitter.
+        Query parameters from and to (YYYY-MM-DD) default to today and 90 days later.
+        Pending, accepted and paid bookings make the sitter busy.
+        """
+        sitter = self.get_object()
+        if sitter.role != 'petsitter':
+            return Response(
+                {'error': 'Availability is only available for pet sitters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            date_from = parse_query_date(request.query_params.get('from')) or timezone.localdate()
+            date_to = parse_query_date(request.query_params.get('to')) or date_from + timedelta(days=90)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if date_from > date_to:
+            return Response(
+                {'error': 'The start date must be before the end date'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        busy, free = sitter_calendar(sitter.id, date_from, date_to)
+        return Response({
+            'sitter': sitter.id,
+            'from': date_from,
+            'to': date_to,
+            'busy': [{'start_date': start, 'end_date': end} for start, end in busy],
+            'free': [{'start_date': start, 'end_date': end} for start, end in free]
+        })
+
     @action(detail=False, methods=['put'], permission_classes=[IsAuthenticated])
     def profile(self, request):
         """
@@ -401,13 +591,24 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Get all companies
-        companies = User.objects.filter(role='company')
-        
-        serializer = self.get_serializer(companies, many=True)
-        return Response(serializer.data)
+        def build():
+            # Get all companies
+            companies = User.objects.filter(role='company')
+            page = self.paginate_queryset(companies)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        # The list does not depend on the pet sitter, so it is shared by all of them
+        return cached_response(request, [DIRECTORY_SCOPE], 'company', build)
 
-class AnimalViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """
+        Returns the hit and miss counters of the directory response cache (staff only).
+        """
+        return Response(cache_stats())
+
+class AnimalViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet to manage pets (creation, modification, deletion).
     """
@@ -417,6 +618,14 @@ class AnimalViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['owner']
 
+    def get_etag_scopes(self):
+        """
+        Pet owners only see their own animals, other roles see every animal.
+        """
+        if self.request.user.is_authenticated and self.request.user.role == 'petowner':
+            return own_rows_scopes(self.request, Animal)
+        return [model_scope(Animal)]
+
     def get_queryset(self):
         """
         Limits visible animals based on user role.
@@ -467,6 +676,7 @@ class AnimalViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @conditional_get(own_rows(Animal))
     def my_animals(self, request):
         """
         Returns the list of animals belonging to the logged-in owner.
@@ -483,18 +693,59 @@ class AnimalViewSet(viewsets.ModelViewSet):
         # Get all animals of the pet owner
         animals = Animal.objects.filter(owner=user)
         
-        serializer = self.get_serializer(animals, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(animals)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def recommended_sitters(self, request, pk=None):
+        """
+        Returns the pet sitters best suited to this animal, ranked by score.
+        The score matches the animal type, breed and illnesses against the sitter experience
+        and takes into account the sitter acceptance history and years of experience.
+        Optional query parameters: limit (default 10, max 50), start_date and end_date
+        to leave out sitters already booked on these dates.
+        """
+        animal = self.get_object()
+
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_RECOMMENDATIONS))
+            start_date = parse_query_date(request.query_params.get('start_date'))
+            end_date = parse_query_date(request.query_params.get('end_date'))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be a number and dates must use the format YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not 0 < limit <= MAX_RECOMMENDATIONS:
+            return Response(
+                {'error': f'limit must be between 1 and {MAX_RECOMMENDATIONS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        recommendations = recommend_sitters(animal, limit, start_date, end_date)
+        results = []
+        for sitter, score in recommendations:
+            data = UserSerializer(sitter).data
+            data['score'] = score
+            results.append(data)
+        return Response({
+            'animal': animal.id,
+            'results': results
+        })
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet to manage bookings between pet owners and pet sitters.
     """
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status']
+    # ?ordering=total_price, -total_price... (the prices are stored, sorted in the database)
+    ordering_fields = ['start_date', 'created_at', 'total_days', 'total_price']
 
     def get_queryset(self):
         """
@@ -508,7 +759,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         
         # Pet owners can see bookings for their animals
         if user.role == 'petowner':
-            return Booking.objects.filter(animal__owner=user)
+            return Booking.objects.filter(owner=user)
         
         # Pet sitters can see bookings that concern them
         elif user.role == 'petsitter':
@@ -517,9 +768,29 @@ class BookingViewSet(viewsets.ModelViewSet):
         # By default, return an empty queryset
         return Booking.objects.none()
 
+    def perform_update(self, serializer):
+        """
+        Keeps the sitter acceptance counters in sync when a booking is edited directly.
+        """
+        old_sitter_id, old_status = serializer.instance.sitter_id, serializer.instance.status
+        with transaction.atomic():
+            serializer.save()
+            record_booking_status(old_sitter_id, old_status, None)
+            record_booking_status(serializer.instance.sitter_id, None, serializer.instance.status)
+
+    def perform_destroy(self, instance):
+        """
+        Removes the booking from the sitter acceptance counters before deleting it.
+        """
+        with transaction.atomic():
+            record_booking_status(instance.sitter_id, instance.status, None)
+            instance.delete()
+
     def create(self, request, *args, **kwargs):
         """
         Override create method to validate that the animal belongs to the pet owner making the booking.
+        The overlap check and the insert run in one transaction holding a lock on the animal row,
+        so two concurrent requests for the same animal cannot both pass the check.
         """
         user = request.user
         data = request.data.copy()
@@ -531,88 +802,120 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Verify that the animal belongs to the pet owner
         animal_id = data.get('animal')
-        if animal_id:
+        if not animal_id:
+            return Response(
+                {'error': 'Please specify an animal for the booking'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            # Lock the animal: concurrent bookings of the same animal wait here until this one is committed
             try:
-                animal = Animal.objects.get(id=animal_id)
-                if animal.owner.id != user.id and not (user.is_staff or user.is_superuser):
-                    return Response(
-                        {'error': 'You can only book for your own animals'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Get the dates for the new booking
-                start_date = data.get('start_date')
-                end_date = data.get('end_date')
-                
-                if not start_date or not end_date:
-                    return Response(
-                        {'error': 'Start and end dates are required'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Check if the animal already has an active booking that overlaps with the requested dates
-                from django.db.models import Q
-                from datetime import datetime
-                
-                # Convert dates to datetime objects for comparison
-                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date() if isinstance(start_date, str) else start_date
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date() if isinstance(end_date, str) else end_date
-                
-                # Check existing bookings with pet sitters that overlap with the dates
-                overlapping_bookings = Booking.objects.filter(
-                    animal=animal,
-                    status__in=['pending', 'accepted', 'paid'],  # Exclude 'cancelled' bookings
-                ).filter(
-                    # Date overlap criteria:
-                    # (start1 <= end2) AND (end1 >= start2)
-                    Q(start_date__lte=end_date_obj) & Q(end_date__gte=start_date_obj)
-                )
-                
-                if overlapping_bookings.exists():
-                    return Response(
-                        {'error': 'This animal already has a booking that overlaps with these dates. Please choose other dates.'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Also check if the animal is booked with a company on the same dates
-                overlapping_company_bookings = CompanyBooking.objects.filter(
-                    animal=animal,
-                    status__in=['pending', 'accepted', 'paid'],  # Exclude 'cancelled' bookings
-                ).filter(
-                    # Date overlap criteria:
-                    # (start1 <= end2) AND (end1 >= start2)
-                    Q(start_date__lte=end_date_obj) & Q(end_date__gte=start_date_obj)
-                )
-                
-                if overlapping_company_bookings.exists():
-                    return Response(
-                        {'error': 'This animal already has a company booking that overlaps with these dates. Please choose other dates.'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
+                animal = Animal.objects.select_for_update().get(id=animal_id)
             except Animal.DoesNotExist:
                 return Response(
                     {'error': 'Animal not found'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-        else:
+            
+            # Verify that the animal belongs to the pet owner
+            if animal.owner_id != user.id and not (user.is_staff or user.is_superuser):
+                return Response(
+                    {'error': 'You can only book for your own animals'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Get the dates for the new booking
+            start_date = data.get('start_date')
+            end_date = data.get('end_date')
+            
+            if not start_date or not end_date:
+                return Response(
+                    {'error': 'Start and end dates are required'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            try:
+                start_date_obj = parse_query_date(start_date)
+                end_date_obj = parse_query_date(end_date)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Active bookings of the animal overlapping the dates, with pet sitters and companies (one query)
+            conflicts = animal_conflicts(animal.id, start_date_obj, end_date_obj)
+            
+            if conflicts['bookings']:
+                return Response(
+                    {'error': 'This animal already has a booking that overlaps with these dates. Please choose other dates.',
+                     'conflicts': conflicts}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if conflicts['company_bookings']:
+                return Response(
+                    {'error': 'This animal already has a company booking that overlaps with these dates. Please choose other dates.',
+                     'conflicts': conflicts}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if conflicts['series']:
+                return Response(
+                    {'error': 'This animal has a recurring company booking on these dates. Please choose other dates.',
+                     'conflicts': conflicts}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Create the booking
+            serializer = self.get_serializer(data=data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            serializer.save()
+            record_booking_status(serializer.instance.sitter_id, None, serializer.instance.status)
+        
+        # Send notification email
+        send_booking_status_email(serializer.instance, serializer.instance.status)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        """
+        Creates several bookings at once, with pet sitters and/or companies.
+        Body: {"items": [{"animal", "sitter" or "company", "start_date", "end_date"}, ...]}
+        Every item is validated like a single booking (ownership, overlaps with existing
+        bookings and with the previous items); valid items are created even if others fail.
+        Returns 201 with one result per item if at least one booking was created, 400 otherwise.
+        """
+        user = request.user
+        
+        # Check that the user is a pet owner
+        if user.role != 'petowner' and not (user.is_staff or user.is_superuser):
             return Response(
-                {'error': 'Please specify an animal for the booking'}, 
+                {'error': 'Only pet owners can create bookings'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Please provide a non-empty list of items'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_BULK_ITEMS:
+            return Response(
+                {'error': f'At most {MAX_BULK_ITEMS} items can be booked at once'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create the booking
-        serializer = self.get_serializer(data=data)
-        if serializer.is_valid():
-            serializer.save()
-            # Send notification email
-            send_booking_status_email(serializer.instance, serializer.instance.status)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        results = create_bookings(user, items)
+        created = sum(1 for result in results if result['status'] == 'created')
+        return Response(
+            {'created': created, 'failed': len(results) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @conditional_get(own_rows(Booking))
     def my_bookings(self, request):
         """
         Returns the list of bookings for the connected pet owner's animals.
@@ -627,123 +930,54 @@ class BookingViewSet(viewsets.ModelViewSet):
             )
         
         # Get all bookings for the pet owner's animals
-        bookings = Booking.objects.filter(animal__owner=user)
+        bookings = Booking.objects.filter(owner=user)
         
-        serializer = self.get_serializer(bookings, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(bookings)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @conditional_get(own_rows(Booking))
+    def revenue(self, request):
+        """
+        Returns the revenue of the logged-in pet sitter, in total and per month.
+        """
+        return booking_revenue(request, Booking, 'sitter')
 
     @action(detail=True, methods=['patch'], permission_classes=[IsAuthenticated])
     def update_status(self, request, pk=None):
         """
         Allows pet sitters and pet owners to update a booking's status.
-        - Pet sitters can accept or decline a booking (status 'accepted' or 'refused')
+        - Pet sitters can accept or decline a pending booking (status 'accepted' or 'refused')
         - Pet owners can cancel their bookings (status 'cancelled')
         - Administrators can modify any status
+        The allowed transitions are declared in core/transitions.py.
         """
-        booking = self.get_object()
-        user = request.user
-        
-        # Verify that the user is either the pet sitter or the animal owner
-        is_authorized = (
-            (user.role == 'petsitter' and booking.sitter.id == user.id) or
-            (user.role == 'petowner' and booking.animal.owner.id == user.id) or
-            (user.is_staff or user.is_superuser)
-        )
-        
-        if not is_authorized:
-            return Response(
-                {'error': 'You are not authorized to modify this booking'}, 
-                status=status.HTTP_403_FORBIDDEN
-            )
-        
-        # Get the new status from the request
-        new_status = request.data.get('status')
-        
-        # Check that the status is valid
-        valid_statuses = [status_tuple[0] for status_tuple in Booking.STATUS_CHOICES]
-        if new_status not in valid_statuses:
-            return Response(
-                {'error': f'Invalid status. Valid statuses are: {", ".join(valid_statuses)}'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check permissions based on the user's role
-        if user.role == 'petsitter' and booking.sitter.id == user.id:
-            # Pet sitters can only accept or decline
-            if new_status not in ['accepted', 'refused']:
-                return Response(
-                    {'error': 'Pet sitters can only change the status to "accepted" or "refused"'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        elif user.role == 'petowner' and booking.animal.owner.id == user.id:
-            # Pet owners can only cancel
-            if new_status != 'cancelled':
-                return Response(
-                    {'error': 'Pet owners can only cancel their bookings'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-        # If a pet owner cancels a booking, also cancel all associated bookings
-        is_pet_owner_cancelling = (
-            user.role == 'petowner' and 
-            booking.animal.owner.id == user.id and 
-            new_status == 'cancelled'
-        )
-        
-        if is_pet_owner_cancelling:
-            # Find all pet sitter → company bookings associated
-            from .models import PetSitterCompanyBooking
-            associated_bookings = PetSitterCompanyBooking.objects.filter(
-                petsitter=booking.sitter,
-                start_date__gte=booking.start_date,
-                end_date__lte=booking.end_date
-            )
-            
-            # Cancel all these associated bookings
-            for assoc_booking in associated_bookings:
-                assoc_booking.status = 'cancelled'
-                assoc_booking.save()
-                
-                # Send an email for each cancelled associated booking
-                send_booking_status_email(assoc_booking, 'cancelled', booking_type='petsitter_company')
-                
-                # Debug log
-                print(f"Associated booking cancelled (ID: {assoc_booking.id})")
-        
-        # Update the booking status
-        old_status = booking.status
-        booking.status = new_status
-        booking.save()
-        
-        # Send status change notification email
-        send_booking_status_email(booking, new_status)
-        
-        # Prepare an appropriate response message
-        status_labels = {
+        return update_booking_status(self, request, Booking, {
             'accepted': 'accepted',
             'refused': 'declined', 
             'cancelled': 'cancelled',
             'paid': 'paid'
-        }
-        status_label = status_labels.get(new_status, new_status)
-        message = f"Booking successfully {status_label}"
-        
-        # Return the updated data
-        serializer = self.get_serializer(booking)
-        return Response({
-            'message': message,
-            'booking': serializer.data
         })
 
-class CompanyBookingViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_status(self, request):
+        """
+        Applies one status change to several bookings: {"ids": [...], "status": "accepted"}.
+        """
+        return bulk_status_update(request, Booking)
+
+class CompanyBookingViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet to manage bookings between pet owners and companies.
     """
     queryset = CompanyBooking.objects.all()
     serializer_class = CompanyBookingSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status']
+    # ?ordering=total_price, -total_price... (the prices are stored, sorted in the database)
+    ordering_fields = ['start_date', 'created_at', 'total_days', 'total_price']
 
     def get_queryset(self):
         """
@@ -757,7 +991,7 @@ class CompanyBookingViewSet(viewsets.ModelViewSet):
         
         # Pet owners can see bookings for their animals
         if user.role == 'petowner':
-            return CompanyBooking.objects.filter(animal__owner=user)
+            return CompanyBooking.objects.filter(owner=user)
         
         # Companies can see bookings that concern them
         elif user.role == 'company':
@@ -766,9 +1000,28 @@ class CompanyBookingViewSet(viewsets.ModelViewSet):
         # By default, return an empty queryset
         return CompanyBooking.objects.none()
 
+    def perform_update(self, serializer):
+        """
+        Keeps the occupancy projection in sync when dates or status are edited directly.
+        """
+        with transaction.atomic():
+            release_company_occupancy(serializer.instance)
+            serializer.save()
+            update_company_occupancy(serializer.instance)
+
+    def perform_destroy(self, instance):
+        """
+        Frees the company places held by the booking before deleting it.
+        """
+        with transaction.atomic():
+            release_company_occupancy(instance)
+            instance.delete()
+
     def create(self, request, *args, **kwargs):
         """
         Override create method to validate that the animal belongs to the pet owner making the booking with a company.
+        The overlap check and the insert run in one transaction holding a lock on the animal row,
+        so two concurrent requests for the same animal cannot both pass the check.
         """
         user = request.user
         data = request.data.copy()
@@ -780,86 +1033,83 @@ class CompanyBookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Verify that the animal belongs to the pet owner
         animal_id = data.get('animal')
-        if animal_id:
+        if not animal_id:
+            return Response(
+                {'error': 'Please specify an animal for the booking'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            # Lock the animal: concurrent bookings of the same animal wait here until this one is committed
             try:
-                animal = Animal.objects.get(id=animal_id)
-                if animal.owner.id != user.id and not (user.is_staff or user.is_superuser):
-                    return Response(
-                        {'error': 'You can only book for your own animals'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Get the dates for the new booking
-                start_date = data.get('start_date')
-                end_date = data.get('end_date')
-                
-                if not start_date or not end_date:
-                    return Response(
-                        {'error': 'Start and end dates are required'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Check if the animal already has an active booking that overlaps with the requested dates
-                from django.db.models import Q
-                from datetime import datetime
-                
-                # Convert dates to datetime objects for comparison
-                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date() if isinstance(start_date, str) else start_date
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date() if isinstance(end_date, str) else end_date
-                
-                # Check existing company bookings that overlap with the dates
-                overlapping_company_bookings = CompanyBooking.objects.filter(
-                    animal=animal,
-                    status__in=['pending', 'accepted', 'paid'],  # Exclude 'cancelled' bookings
-                ).filter(
-                    # Date overlap criteria:
-                    # (start1 <= end2) AND (end1 >= start2)
-                    Q(start_date__lte=end_date_obj) & Q(end_date__gte=start_date_obj)
-                )
-                
-                if overlapping_company_bookings.exists():
-                    return Response(
-                        {'error': 'This animal already has a company booking that overlaps with these dates. Please choose other dates.'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                # Also check if the animal has a booking with a pet sitter on the same dates
-                overlapping_bookings = Booking.objects.filter(
-                    animal=animal,
-                    status__in=['pending', 'accepted', 'paid'],
-                ).filter(
-                    Q(start_date__lte=end_date_obj) & Q(end_date__gte=start_date_obj)
-                )
-                
-                if overlapping_bookings.exists():
-                    return Response(
-                        {'error': 'This animal already has a booking with a pet sitter that overlaps with these dates. Please choose other dates.'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
+                animal = Animal.objects.select_for_update().get(id=animal_id)
             except Animal.DoesNotExist:
                 return Response(
                     {'error': 'Animal not found'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-        else:
-            return Response(
-                {'error': 'Please specify an animal for the booking'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Create the booking
-        serializer = self.get_serializer(data=data)
-        if serializer.is_valid():
+            
+            # Verify that the animal belongs to the pet owner
+            if animal.owner_id != user.id and not (user.is_staff or user.is_superuser):
+                return Response(
+                    {'error': 'You can only book for your own animals'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Get the dates for the new booking
+            start_date = data.get('start_date')
+            end_date = data.get('end_date')
+            
+            if not start_date or not end_date:
+                return Response(
+                    {'error': 'Start and end dates are required'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            try:
+                start_date_obj = parse_query_date(start_date)
+                end_date_obj = parse_query_date(end_date)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Active bookings of the animal overlapping the dates, with companies and pet sitters (one query)
+            conflicts = animal_conflicts(animal.id, start_date_obj, end_date_obj)
+            
+            if conflicts['company_bookings']:
+                return Response(
+                    {'error': 'This animal already has a company booking that overlaps with these dates. Please choose other dates.',
+                     'conflicts': conflicts}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if conflicts['bookings']:
+                return Response(
+                    {'error': 'This animal already has a booking with a pet sitter that overlaps with these dates. Please choose other dates.',
+                     'conflicts': conflicts}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if conflicts['series']:
+                return Response(
+                    {'error': 'This animal has a recurring company booking on these dates. Please choose other dates.',
+                     'conflicts': conflicts}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Create the booking
+            serializer = self.get_serializer(data=data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             serializer.save()
-            # Send notification email
-            send_booking_status_email(serializer.instance, serializer.instance.status, booking_type='company')
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            update_company_occupancy(serializer.instance)
+        
+        # Send notification email
+        send_booking_status_email(serializer.instance, serializer.instance.status, booking_type='company')
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @conditional_get(own_rows(CompanyBooking))
     def my_bookings(self, request):
         """
         Returns the list of company bookings for the connected pet owner's animals.
@@ -874,41 +1124,35 @@ class CompanyBookingViewSet(viewsets.ModelViewSet):
             )
         
         # Get all bookings for the pet owner's animals
-        bookings = CompanyBooking.objects.filter(animal__owner=user)
-        
-        serializer = self.get_serializer(bookings, many=True)
-        return Response(serializer.data)
+        bookings = CompanyBooking.objects.filter(owner=user)
+
+        page = self.paginate_queryset(bookings)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @conditional_get(own_rows(CompanyBooking))
+    def revenue(self, request):
+        """
+        Returns the revenue of the logged-in company, in total and per month.
+        """
+        return booking_revenue(request, CompanyBooking, 'company')
 
     @action(detail=True, methods=['patch'], permission_classes=[IsAuthenticated])
     def update_status(self, request, pk=None):
         """
         Allows companies and pet owners to update a booking's status.
         Companies need to pay their share when accepting a booking.
+        The allowed transitions are declared in core/transitions.py.
         """
         booking = self.get_object()
         user = request.user
-        
-        # Verify that the user is either the company concerned or the animal owner
         is_company = user.role == 'company' and booking.company.id == user.id
-        is_pet_owner = user.role == 'petowner' and booking.animal.owner.id == user.id
-        is_authorized = is_company or is_pet_owner or (user.is_staff or user.is_superuser)
-        
-        if not is_authorized:
-            return Response(
-                {'error': 'You are not authorized to modify this booking'}, 
-                status=status.HTTP_403_FORBIDDEN
-            )
-        
-        # Get the new status from the request
         new_status = request.data.get('status')
-        
-        # Check that the status is valid
-        valid_statuses = [status_tuple[0] for status_tuple in CompanyBooking.STATUS_CHOICES]
-        if new_status not in valid_statuses:
-            return Response(
-                {'error': f'Invalid status. Valid statuses are: {", ".join(valid_statuses)}'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+
+        error = transition_error(CompanyBooking, user, new_status)
+        if error:
+            return Response({'error': error[0]}, status=error[1])
         
         # Special handling for company accepting a booking:
         # Company must pay before the booking is confirmed as accepted
@@ -920,38 +1164,30 @@ class CompanyBookingViewSet(viewsets.ModelViewSet):
                     'message': 'Please proceed to payment to confirm this booking',
                     'booking_id': booking.id,
                     'amount': booking.total_price,
-                    'service_fee': 2.80,
-                    'total_amount': booking.total_price + 2.80,
+                    'service_fee': booking_service_fee(),
+                    'total_amount': booking.total_price + booking_service_fee(),
                     'requires_payment': True  # Flag for frontend to redirect to payment
                 }, status=status.HTTP_200_OK)
             # If company has paid, we can proceed with the status change
         
-        # Update the booking status (keep even if cancelled)
-        old_status = booking.status
-        booking.status = new_status
-        booking.save()
-        
-        # Send notification email
-        send_booking_status_email(booking, new_status, booking_type='company')
-        
-        # Create an adapted return message
-        status_labels = {
+        return update_booking_status(self, request, CompanyBooking, {
             'pending': 'pending',
             'accepted': 'accepted',
             'refused': 'declined', 
             'cancelled': 'cancelled',
             'paid': 'paid'
-        }
-        status_label = status_labels.get(new_status, new_status)
-        
-        # Return the updated data
-        serializer = self.get_serializer(booking)
-        return Response({
-            'message': f'Booking successfully {status_label}',
-            'booking': serializer.data
         })
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_status(self, request):
+        """
+        Applies one status change to several company bookings: {"ids": [...], "status": "refused"}.
+        Unpaid bookings cannot be accepted in bulk: the company pays each of them first.
+        """
+        return bulk_status_update(request, CompanyBooking)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @idempotent
     def company_payment(self, request, pk=None):
         """
         Process a payment from a company for a booking.
@@ -975,9 +1211,16 @@ class CompanyBookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
             
+        # Only a pending booking not paid yet can be paid (not a refused, cancelled or expired one)
+        if booking.company_paid or booking.status != 'pending':
+            return Response(
+                {'error': 'This booking cannot be paid'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+            
         # Calculate amount to pay
         amount = booking.total_price
-        service_fee = 2.80
+        service_fee = booking_service_fee()
         total_amount = amount + service_fee
         
         # Create payment
@@ -986,17 +1229,19 @@ class CompanyBookingViewSet(viewsets.ModelViewSet):
             'amount': total_amount,  # Including service fee
             'payment_status': 'completed',  # Assuming payment is immediately successful
             'payment_type': data.get('payment_type', 'card'),
-            'transaction_id': f"TR-COMP-{timezone.now().strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
         }
         
         payment_serializer = PaymentSerializer(data=payment_data)
         if payment_serializer.is_valid():
-            payment = payment_serializer.save()
-            
-            # Update booking status - mark as company_paid
-            booking.company_paid = True
-            booking.status = 'accepted'  # Company acceptance is now confirmed
-            booking.save()
+            try:
+                with transaction.atomic():
+                    # Update booking status - mark as company_paid
+                    # (compare-and-swap: fails if the booking left 'pending' since it was read)
+                    swap_status(booking, 'pending', 'accepted', company_paid=True)  # Company acceptance is now confirmed
+                    update_company_occupancy(booking, 'pending')
+                    payment = payment_serializer.save(transaction_id=new_transaction_id('TR-COMP'))
+            except StatusConflict as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
             
             # Send notification email to both company and pet owner
             send_booking_status_email(booking, booking.status, booking_type='company')
@@ -1021,8 +1266,8 @@ Thank you for using Pet at Work!
                     [user.email],
                     fail_silently=True,
                 )
-            except Exception as e:
-                print(f"Error sending confirmation email: {str(e)}")
+            except Exception:
+                logger.exception('Error sending confirmation email')
             
             return Response({
                 'message': 'Payment processed successfully. The booking is now confirmed.',
@@ -1039,6 +1284,7 @@ Thank you for using Pet at Work!
         This endpoint helps the frontend understand how to handle company booking acceptance and payment.
         """
         user = request.user
+        service_fee = booking_service_fee()
         
         # Check that the user is a company
         if user.role != 'company' and not (user.is_staff or user.is_superuser):
@@ -1073,8 +1319,8 @@ Thank you for using Pet at Work!
                     'message': 'Please proceed to payment to confirm this booking',
                     'booking_id': 123,
                     'amount': 50.0,
-                    'service_fee': 2.80,
-                    'total_amount': 52.80,
+                    'service_fee': service_fee,
+                    'total_amount': 50 + service_fee,
                     'requires_payment': True
                 }
             },
@@ -1096,8 +1342,8 @@ Thank you for using Pet at Work!
                 'start_date': booking.start_date,
                 'end_date': booking.end_date,
                 'amount': booking.total_price,
-                'service_fee': 2.80,
-                'total_amount': booking.total_price + 2.80
+                'service_fee': service_fee,
+                'total_amount': booking.total_price + service_fee
             })
         
         response_data = {
@@ -1125,8 +1371,8 @@ Thank you for using Pet at Work!
                     'message': 'Please proceed to payment to confirm this booking',
                     'booking_id': 123,
                     'amount': 50.0,
-                    'service_fee': 2.80,
-                    'total_amount': 52.80,
+                    'service_fee': service_fee,
+                    'total_amount': 50 + service_fee,
                     'requires_payment': True
                 }
             },
@@ -1135,7 +1381,191 @@ Thank you for using Pet at Work!
         
         return Response(response_data)
 
-class PetSitterCompanyBookingViewSet(viewsets.ModelViewSet):
+class CompanyBookingSeriesViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    ViewSet to manage recurring bookings with companies (e.g. daycare every Tuesday).
+    Occurrences are not stored until the company confirms them.
+    """
+    queryset = CompanyBookingSeries.objects.all()
+    serializer_class = CompanyBookingSeriesSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status', 'company', 'animal']
+    # The rule cannot be edited once created: cancel it and create a new one
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    def get_queryset(self):
+        """
+        Filters series based on the user's role.
+        """
+        user = self.request.user
+        
+        # Administrators can see all series
+        if user.is_staff or user.is_superuser:
+            return CompanyBookingSeries.objects.all()
+        
+        # Pet owners can see the series of their animals
+        if user.role == 'petowner':
+            return CompanyBookingSeries.objects.filter(animal__owner=user)
+        
+        # Companies can see the series that concern them
+        elif user.role == 'company':
+            return CompanyBookingSeries.objects.filter(company=user)
+        
+        # By default, return an empty queryset
+        return CompanyBookingSeries.objects.none()
+
+    def create(self, request, *args, **kwargs):
+        """
+        Creates a series in one call: animal, company, start_date (first occurrence, sets the
+        weekday), end_date (last possible day) and interval_weeks (1 = every week).
+        All occurrences are checked at once against the bookings of the animal and the
+        capacity of the company; nothing is written for the occurrences themselves.
+        """
+        user = request.user
+        
+        # Check that the user is a pet owner
+        if user.role != 'petowner' and not (user.is_staff or user.is_superuser):
+            return Response(
+                {'error': 'Only pet owners can create bookings'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        if data['company'].role != 'company':
+            return Response({'error': 'Company not found'}, status=status.HTTP_400_BAD_REQUEST)
+        if data['start_date'] > data['end_date']:
+            return Response(
+                {'error': 'The start date must be before the end date'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (data['end_date'] - data['start_date']).days > MAX_SERIES_DAYS:
+            return Response(
+                {'error': f'A series cannot last more than {MAX_SERIES_DAYS} days'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        interval_weeks = data.get('interval_weeks', 1)
+        if not 1 <= interval_weeks <= MAX_INTERVAL_WEEKS:
+            return Response(
+                {'error': f'interval_weeks must be between 1 and {MAX_INTERVAL_WEEKS}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            # Lock the animal, like single bookings, so that concurrent requests cannot overlap
+            animal = Animal.objects.select_for_update().get(id=data['animal'].id)
+            if animal.owner_id != user.id and not (user.is_staff or user.is_superuser):
+                return Response(
+                    {'error': 'You can only book for your own animals'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            dates = list(occurrence_dates(data['start_date'], data['end_date'], interval_weeks))
+            conflicts = occurrence_conflicts(animal.id, dates)
+            if any(conflicts.values()):
+                return Response(
+                    {'error': 'This animal already has bookings on some occurrences of this series.',
+                     'conflicts': conflicts},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            full = full_dates(data['company'], dates)
+            if full:
+                return Response(
+                    {'error': 'The company is full on some occurrences of this series.', 'full_dates': full},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            serializer.save()
+        
+        # Send notification email (the series carries the same fields as a booking)
+        send_booking_status_email(serializer.instance, 'pending', booking_type='company')
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def occurrences(self, request, pk=None):
+        """
+        Returns the occurrences of the series between from and to (YYYY-MM-DD, default today
+        and 90 days later), expanded from the rule, with the status of the confirmed ones.
+        """
+        series = self.get_object()
+        try:
+            date_from = parse_query_date(request.query_params.get('from'))
+            date_to = parse_query_date(request.query_params.get('to'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        date_from, date_to = default_window(date_from, date_to, timezone.localdate())
+        if date_from > date_to:
+            return Response(
+                {'error': 'The start date must be before the end date'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'series': series.id,
+            'from': date_from,
+            'to': date_to,
+            'occurrences': series_calendar(series, date_from, date_to),
+        })
+
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        """
+        Lets the company confirm occurrences: body {"dates": ["YYYY-MM-DD", ...]}.
+        Each confirmed occurrence becomes an accepted CompanyBooking, paid like any other.
+        """
+        series = self.get_object()
+        user = request.user
+        if series.company_id != user.id and not (user.is_staff or user.is_superuser):
+            return Response(
+                {'error': 'Only the company can confirm occurrences'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        raw_dates = request.data.get('dates')
+        if not isinstance(raw_dates, list) or not raw_dates:
+            return Response({'error': 'Please provide a list of dates'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            dates = sorted({parse_query_date(value) for value in raw_dates})
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            # Lock the company, then the series: confirmations of any of the company's series
+            # are serialized, so two of them cannot both pass the capacity check for the same day
+            User.objects.select_for_update().only('id').get(pk=series.company_id)
+            series = CompanyBookingSeries.objects.select_for_update().get(pk=series.pk)
+            error = validate_confirmation(series, dates)
+            if error:
+                return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+            bookings = confirm_occurrences(series, dates)
+        
+        return Response(
+            CompanyBookingSerializer(bookings, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """
+        Cancels the series: the occurrences that were not confirmed are dropped.
+        Confirmed occurrences are regular company bookings and keep their own status.
+        """
+        series = self.get_object()
+        if series.status == 'cancelled':
+            return Response({'error': 'This series is already cancelled'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            swap_status(series, 'active', 'cancelled')
+        except StatusConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        send_booking_status_email(series, 'cancelled', booking_type='company')
+        return Response(self.get_serializer(series).data)
+
+class PetSitterCompanyBookingViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet to manage bookings between pet sitters and companies.
     """
@@ -1197,59 +1627,25 @@ class PetSitterCompanyBookingViewSet(viewsets.ModelViewSet):
         """
         Allows companies and pet sitters to update a booking's status.
         Cancelled bookings are kept with the status 'cancelled'.
+        The allowed transitions are declared in core/transitions.py.
         """
-        booking = self.get_object()
-        user = request.user
-        
-        # Verify that the user is either the pet sitter or the company concerned
-        is_authorized = (
-            (user.role == 'petsitter' and booking.petsitter.id == user.id) or
-            (user.role == 'company' and booking.company.id == user.id)
-        )
-        
-        if not is_authorized and not (user.is_staff or user.is_superuser):
-            return Response(
-                {'error': 'You are not authorized to modify this booking'}, 
-                status=status.HTTP_403_FORBIDDEN
-            )
-        
-        # Get the new status from the request
-        new_status = request.data.get('status')
-        
-        # Check that the status is valid
-        valid_statuses = [status_tuple[0] for status_tuple in PetSitterCompanyBooking.STATUS_CHOICES]
-        if new_status not in valid_statuses:
-            return Response(
-                {'error': f'Invalid status. Valid statuses are: {", ".join(valid_statuses)}'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Update the booking status (keep even if cancelled)
-        old_status = booking.status
-        booking.status = new_status
-        booking.save()
-        
-        # Send notification email
-        send_booking_status_email(booking, new_status, booking_type='petsitter_company')
-        
-        # Create an adapted return message
-        status_labels = {
+        return update_booking_status(self, request, PetSitterCompanyBooking, {
             'pending': 'pending',
             'accepted': 'accepted',
             'refused': 'declined', 
             'cancelled': 'cancelled',
             'finished': 'completed'
-        }
-        status_label = status_labels.get(new_status, new_status)
-        
-        # Return the updated data
-        serializer = self.get_serializer(booking)
-        return Response({
-            'message': f'Booking successfully {status_label}',
-            'booking': serializer.data
         })
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk_status(self, request):
+        """
+        Applies one status change to several pet sitter/company bookings: {"ids": [...], "status": "accepted"}.
+        """
+        return bulk_status_update(request, PetSitterCompanyBooking)
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @idempotent
     def shared_payment(self, request, pk=None):
         """
         Process a shared payment for a booking between pet sitter and company.
@@ -1270,8 +1666,8 @@ class PetSitterCompanyBookingViewSet(viewsets.ModelViewSet):
             )
             
         # Calculate amount to pay
-        amount = booking.service_cost if hasattr(booking, 'service_cost') and booking.service_cost else 50.0  # Default value if not set
-        service_fee = 2.80
+        amount = collaboration_price(booking)
+        service_fee = booking_service_fee()
         total_amount = amount + service_fee
         
         # Create payment record
@@ -1280,21 +1676,19 @@ class PetSitterCompanyBookingViewSet(viewsets.ModelViewSet):
             'amount': total_amount,
             'payment_status': 'completed',
             'payment_type': data.get('payment_type', 'card'),
-            'transaction_id': f"TR-SHARED-{timezone.now().strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
         }
         
         payment_serializer = PaymentSerializer(data=payment_data)
         if payment_serializer.is_valid():
-            payment = payment_serializer.save()
-            
-            # Update booking status and mark as paid
-            booking.company_paid = True
-            
-            # If the booking status is pending, change it to accepted
-            if booking.status == 'pending':
-                booking.status = 'accepted'
-                
-            booking.save()
+            try:
+                with transaction.atomic():
+                    # If the booking status is pending, change it to accepted
+                    # (compare-and-swap: fails if the booking changed since it was read)
+                    if booking.status == 'pending':
+                        swap_status(booking, 'pending', 'accepted')
+                    payment = payment_serializer.save(transaction_id=new_transaction_id('TR-SHARED'))
+            except StatusConflict as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
             
             # Send notification email
             send_booking_status_email(booking, booking.status, booking_type='petsitter_company')
@@ -1321,8 +1715,8 @@ Thank you for using Pet at Work!
                     [recipient.email],
                     fail_silently=True,
                 )
-            except Exception as e:
-                print(f"Error sending confirmation email: {str(e)}")
+            except Exception:
+                logger.exception('Error sending confirmation email')
             
             return Response({
                 'message': 'Shared payment processed successfully. The booking is now confirmed.',
@@ -1332,7 +1726,7 @@ Thank you for using Pet at Work!
         
         return Response(payment_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet to manage payments related to bookings.
     """
@@ -1354,13 +1748,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
         
         # Pet owners can see their own payments
         if user.role == 'petowner':
-            return Payment.objects.filter(
-                # Payments linked to bookings for their animals
-                booking__animal__owner=user
-            ) | Payment.objects.filter(
-                # Payments linked to company bookings for their animals
-                company_booking__animal__owner=user
-            )
+            # Payments linked to bookings and company bookings for their animals
+            return Payment.objects.filter(owner=user)
         
         # Pet sitters can see payments that concern them
         elif user.role == 'petsitter':
@@ -1374,6 +1763,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return Payment.objects.none()
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    @idempotent
     def process_payment(self, request):
         """
         Process a new payment for a booking.
@@ -1419,14 +1809,9 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 
                 # Calculate total amount with service fee
                 amount = booking.total_price
-                service_fee = 2.80
+                service_fee = booking_service_fee()
                 total_amount = amount + service_fee
-                
-                # Only update booking.status to 'paid' if it's already in 'accepted' status
-                # Keeping 'pending' status to allow for accept/refuse actions
-                if booking.status == 'accepted':
-                    booking.status = 'paid'
-                    booking.save()
+                paid_booking = booking
                 
             elif company_booking_id:
                 company_booking = CompanyBooking.objects.get(id=company_booking_id)
@@ -1440,7 +1825,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 
                 # Calculate total amount with service fee
                 amount = company_booking.total_price
-                service_fee = 2.80
+                service_fee = booking_service_fee()
                 total_amount = amount + service_fee
                 
                 # Check if booking is already paid
@@ -1450,10 +1835,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
                         status=status.HTTP_400_BAD_REQUEST
                     )
                 
-                # Only update to paid if already in accepted status
-                if company_booking.status == 'accepted':
-                    company_booking.status = 'paid'
-                    company_booking.save()
+                paid_booking = company_booking
                 
         except (Booking.DoesNotExist, CompanyBooking.DoesNotExist):
             return Response(
@@ -1468,12 +1850,21 @@ class PaymentViewSet(viewsets.ModelViewSet):
             'amount': total_amount,  # Using total_amount which includes service fee
             'payment_status': 'completed',  # Assuming payment is immediately successful for this example
             'payment_type': data.get('payment_type', 'card'),
-            'transaction_id': f"TR-{timezone.now().strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
         }
         
         serializer = self.get_serializer(data=payment_data)
         if serializer.is_valid():
-            payment = serializer.save()
+            try:
+                with transaction.atomic():
+                    # Only update the status to 'paid' if the booking is already 'accepted'
+                    # Keeping 'pending' status to allow for accept/refuse actions
+                    # (compare-and-swap: two concurrent payments cannot both mark it as paid;
+                    # rolled back with the payment if it cannot be saved)
+                    if paid_booking.status == 'accepted':
+                        swap_status(paid_booking, 'accepted', 'paid')
+                    payment = serializer.save(transaction_id=new_transaction_id())
+            except StatusConflict as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
             
             # Send payment confirmation email
             if booking_id:
@@ -1491,8 +1882,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
                     [user.email],
                     fail_silently=True,
                 )
-            except Exception as e:
-                print(f"Error sending confirmation email: {str(e)}")
+            except Exception:
+                logger.exception('Error sending confirmation email')
             
             return Response({
                 'message': 'Payment processed successfully',
@@ -1502,6 +1893,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @conditional_get(own_rows(Payment))
     def my_payments(self, request):
         """
         Returns the list of payments made by the user.
@@ -1516,14 +1908,30 @@ class PaymentViewSet(viewsets.ModelViewSet):
             )
         
         # Get all payments for the user
-        payments = Payment.objects.filter(
-            booking__animal__owner=user
-        ) | Payment.objects.filter(
-            company_booking__animal__owner=user
-        )
+        payments = Payment.objects.filter(owner=user)
         
-        serializer = self.get_serializer(payments, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(payments)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def by_transaction(self, request):
+        """
+        Returns the payment with a given transaction ID: ?transaction_id=TR-...
+        Used to reconcile payments with the payment gateway (one lookup on the unique index).
+        """
+        transaction_id = request.query_params.get('transaction_id', '').strip()
+        if not transaction_id:
+            return Response(
+                {'error': 'Please specify a transaction_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            payment = self.get_queryset().get(transaction_id=transaction_id)
+        except Payment.DoesNotExist:
+            return Response({'error': 'Payment not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(payment).data)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def refund(self, request, pk=None):
@@ -1547,19 +1955,24 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update the payment status
-        payment.payment_status = 'refunded'
-        payment.save()
-        
-        # Update the associated booking
-        if payment.booking:
-            booking = payment.booking
-            booking.status = 'cancelled'
-            booking.save()
-        elif payment.company_booking:
-            company_booking = payment.company_booking
-            company_booking.status = 'cancelled'
-            company_booking.save()
+        # Update the payment and the associated booking with compare-and-swaps:
+        # two concurrent refunds cannot both succeed
+        try:
+            with transaction.atomic():
+                swap_status(payment, 'completed', 'refunded', field='payment_status')
+                if payment.booking:
+                    booking = payment.booking
+                    old_status = booking.status
+                    swap_status(booking, old_status, 'cancelled')
+                    record_booking_status(booking.sitter_id, old_status, booking.status)
+                    cancel_linked_collaborations([booking])
+                elif payment.company_booking:
+                    company_booking = payment.company_booking
+                    old_status = company_booking.status
+                    swap_status(company_booking, old_status, 'cancelled')
+                    update_company_occupancy(company_booking, old_status)
+        except StatusConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
         
         # Send refund confirmation email
         try:
@@ -1576,8 +1989,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 [owner_email],
                 fail_silently=True,
             )
-        except Exception as e:
-            print(f"Error sending refund email: {str(e)}")
+        except Exception:
+            logger.exception('Error sending refund email')
         
         serializer = self.get_serializer(payment)
         return Response({
@@ -1761,6 +2174,7 @@ def test_auth(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional_get(all_rows(User))
 def list_users_test(request):
     """
     Test view to list all users.
@@ -1935,6 +2349,7 @@ def debug_login(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def process_company_payment(request, booking_id):
     """
     Traite un paiement d'une entreprise pour une réservation.
@@ -1953,8 +2368,8 @@ def process_company_payment(request, booking_id):
         # Si nous sommes à l'étape initiale, renvoyer les informations pour afficher le formulaire
         if payment_stage == 'init':
             # Calculer montant fictif pour démonstration
-            amount = booking.total_price if hasattr(booking, 'total_price') and booking.total_price else 50.0
-            service_fee = 2.80
+            amount = booking.total_price
+            service_fee = booking_service_fee()
             total_amount = amount + service_fee
             
             return Response({
@@ -1970,9 +2385,13 @@ def process_company_payment(request, booking_id):
         
         # Si nous sommes à l'étape de traitement du paiement
         elif payment_stage == 'process':
+            # Seule une réservation en attente et pas encore payée peut être payée
+            if booking.company_paid or booking.status != 'pending':
+                return Response({'error': 'This booking cannot be paid'}, status=status.HTTP_400_BAD_REQUEST)
+            
             # Calculer montant fictif pour démonstration
-            amount = booking.total_price if hasattr(booking, 'total_price') and booking.total_price else 50.0
-            service_fee = 2.80
+            amount = booking.total_price
+            service_fee = booking_service_fee()
             total_amount = amount + service_fee
             
             # Créer paiement (simulé)
@@ -1981,19 +2400,18 @@ def process_company_payment(request, booking_id):
                 'amount': total_amount,
                 'payment_status': 'completed',
                 'payment_type': data.get('payment_type', 'card'),
-                'transaction_id': f"TR-DEMO-{timezone.now().strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
             }
             
             payment_serializer = PaymentSerializer(data=payment_data)
             if payment_serializer.is_valid():
-                payment = payment_serializer.save()
+                with transaction.atomic():
+                    # Mettre à jour le statut de la réservation
+                    # (compare-and-swap : échoue si la réservation n'est plus en attente)
+                    swap_status(booking, 'pending', 'accepted', company_paid=True)  # Assurez-vous que le statut est mis à jour
+                    update_company_occupancy(booking, 'pending')
+                    payment = payment_serializer.save(transaction_id=new_transaction_id('TR-DEMO'))
                 
-                # Mettre à jour le statut de la réservation
-                booking.company_paid = True
-                booking.status = 'accepted'  # Assurez-vous que le statut est mis à jour
-                booking.save()
-                
-                print(f"Demo payment processed for booking {booking_id}")
+                logger.info('Demo payment processed for booking %s', booking_id)
                 
                 # Retourner une réponse de succès
                 return Response({
@@ -2009,6 +2427,91 @@ def process_company_payment(request, booking_id):
             
     except CompanyBooking.DoesNotExist:
         return Response({'error': 'Reservation not found'}, status=status.HTTP_404_NOT_FOUND)
+    except StatusConflict as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
-        print(f"Error processing payment: {str(e)}")
-        return Response({'error': f'Error processing payment: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        logger.exception('Error processing payment')
+        return Response({'error': f'Error processing payment: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+def timeline_scopes(request):
+    """
+    ETag scopes of the timeline: the user's own counter, or every booking model for staff.
+    """
+    user = request.user
+    if user.is_staff or user.is_superuser:
+        return [model_scope(Booking), model_scope(CompanyBooking), model_scope(PetSitterCompanyBooking)]
+    return [user_scope(user.pk)]
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@conditional_get(timeline_scopes)
+def timeline(request):
+    """
+    Returns every booking of the logged-in user in one list: bookings with pet sitters,
+    with companies and between pet sitters and companies, sorted by start date.
+    Query parameters:
+    - status: comma-separated statuses (e.g. pending,accepted)
+    - type: comma-separated kinds among booking, company_booking, petsitter_company_booking
+    - from / to (YYYY-MM-DD): only the bookings overlapping this window
+    - order: 'asc' (default) or 'desc'
+    - page_size: number of rows per page (default 50, max 200)
+    - cursor: opaque position returned in the `next` link
+    """
+    params = request.query_params
+    try:
+        date_from = parse_query_date(params.get('from'))
+        date_to = parse_query_date(params.get('to'))
+        position = decode_cursor(params['cursor']) if params.get('cursor') else None
+        page_size = min(int(params.get('page_size', TIMELINE_PAGE_SIZE)), TIMELINE_MAX_PAGE_SIZE)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if page_size < 1:
+        return Response({'error': 'page_size must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+    kinds = [kind for kind in params.get('type', '').split(',') if kind]
+    invalid_kinds = [kind for kind in kinds if kind not in TIMELINE_KINDS]
+    if invalid_kinds:
+        return Response(
+            {'error': f'Invalid type. Valid types are: {", ".join(TIMELINE_KINDS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    statuses = [value for value in params.get('status', '').split(',') if value]
+
+    rows, has_more = booking_timeline(
+        request.user,
+        statuses=statuses,
+        kinds=kinds,
+        date_from=date_from,
+        date_to=date_to,
+        position=position,
+        descending=params.get('order') == 'desc',
+        limit=page_size
+    )
+
+    next_url = None
+    if has_more:
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(rows[-1]))
+    return Response({'next': next_url, 'results': rows})
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def quote(request):
+    """
+    Prices many candidate stays in one call, e.g. to show prices in search results.
+    Body: {"animal_type": "dog", "items": [{"provider", "start_date", "end_date"[, "animal_type"]}, ...]}
+    The provider is a pet sitter or company id. Returns one result per item with the
+    number of days, the price, the service fee and the total.
+    """
+    items = request.data.get('items')
+    if not isinstance(items, list) or not items:
+        return Response(
+            {'error': 'Please provide a non-empty list of items'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > MAX_QUOTE_ITEMS:
+        return Response(
+            {'error': f'At most {MAX_QUOTE_ITEMS} items can be quoted at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return Response({'results': quote_prices(items, request.data.get('animal_type'))})
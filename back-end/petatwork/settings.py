@@ -4,6 +4,7 @@ Django settings for petatwork project.
 
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -72,9 +73,56 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # SQLite ignore SELECT ... FOR UPDATE : chaque transaction prend le verrou
+            # d'écriture dès son début, ce qui sérialise les créations de réservations
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Base de test dans un fichier : les tests de concurrence (core/tests.py) ouvrent une
+        # connexion par thread, ce que la base en mémoire partagée ne permet pas d'attendre
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# Cache (mémoire locale, par processus). Les versions qui invalident les entrées et les
+# ETags sont en base (voir core/caching.py), donc partagées entre les workers ; un cache
+# partagé évite seulement de recalculer les mêmes réponses dans chaque worker, par exemple :
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'petatwork',
     }
 }
 
+# Durée de vie des réponses de l'annuaire en cache (secondes), voir core/caching.py
+DIRECTORY_CACHE_TIMEOUT = 300
+
+# Envoi des notifications par lots dans un thread d'arrière-plan (voir core/notifications.py).
+# False : envoi immédiat, dans la requête
+ASYNC_NOTIFICATIONS = True
+
+# Expiration des réservations en attente (voir core/expiry.py) : au-delà de ce délai
+# ou une fois la date de début passée, une demande sans réponse passe au statut 'expired'
+PENDING_BOOKING_TTL_HOURS = 72
+BOOKING_EXPIRY_BATCH_SIZE = 500
+# Intervalle (secondes) de l'expiration dans le processus web, 0 = désactivée :
+# lancer alors `python manage.py expire_bookings` périodiquement (cron)
+BOOKING_EXPIRY_INTERVAL = 0
+
+# Tarification (voir core/pricing.py) : tarif journalier des prestataires sans tarif propre
+# et frais de service ajoutés à chaque paiement, en euros
+DEFAULT_DAILY_RATE = '10.00'
+BOOKING_SERVICE_FEE = '2.80'
+
+# Durée de conservation des clés d'idempotence des paiements (voir core/idempotency.py) :
+# passé ce délai, une clé réutilisée est traitée comme une nouvelle requête.
+# Purge : `python manage.py purge_idempotency_keys`
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -112,6 +160,9 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
+    # Pagination par curseur sur toutes les listes (voir core/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 # Configuration JWT
@@ -133,6 +184,9 @@ SIMPLE_JWT = {
 # CORS configuration
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# En-tête des paiements rejouables, et indication d'une réponse rejouée
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed']
 
 # Configuration email
 #EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -141,4 +195,8 @@ CORS_ALLOW_CREDENTIALS = True
 #EMAIL_USE_TLS = True
 #EMAIL_HOST_USER = 'votre_email@gmail.com'  # Remplacez par votre adresse Gmail
 #EMAIL_HOST_PASSWORD = 'votre_mot_de_passe_d_application'  # Mot de passe d'application Gmail
-#DEFAULT_FROM_EMAIL = 'Pet at Work <votre_email@gmail.com>'
\ No newline at end of file
+#DEFAULT_FROM_EMAIL = 'Pet at Work <votre_email@gmail.com>'
+
+# Expéditeur des notifications envoyées par le worker (voir core/notifications.py),
+# à remplacer par l'adresse du compte SMTP ci-dessus
+DEFAULT_FROM_EMAIL = 'Pet at Work <no-reply@petatwork.local>'
\ No newline at end of file
@@ -2,9 +2,9 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from core.views import (
-    UserViewSet, AnimalViewSet, BookingViewSet, CompanyBookingViewSet, 
+    UserViewSet, AnimalViewSet, BookingViewSet, CompanyBookingViewSet, CompanyBookingSeriesViewSet,
     PetSitterCompanyBookingViewSet, PaymentViewSet, login, register, 
-    test_auth, list_users_test, debug_login, process_company_payment
+    test_auth, list_users_test, debug_login, process_company_payment, timeline, quote
 )
 from django.views.generic.base import RedirectView
 from rest_framework_simplejwt.views import (
@@ -17,6 +17,7 @@ router.register(r'users', UserViewSet)
 router.register(r'animals', AnimalViewSet)
 router.register(r'bookings', BookingViewSet)
 router.register(r'company-bookings', CompanyBookingViewSet, basename='company-booking')
+router.register(r'company-booking-series', CompanyBookingSeriesViewSet)
 router.register(r'petsitter-company-bookings', PetSitterCompanyBookingViewSet)
 router.register(r'payments', PaymentViewSet)
 
@@ -28,6 +29,10 @@ urlpatterns = [
     path('api/test-auth/', test_auth, name='test_auth'),
     path('api/list-users-test/', list_users_test, name='list_users_test'),
     path('api/debug-login/', debug_login, name='debug_login'),
+    # Toutes les réservations de l'utilisateur connecté, triées par date de début
+    path('api/timeline/', timeline, name='timeline'),
+    # Prix de plusieurs séjours candidats (prestataire, dates) en un seul appel
+    path('api/quote/', quote, name='quote'),
     
     # Anciennes routes pour le paiement des entreprises
     path('api/company-bookings/<int:pk>/company_payment/', 
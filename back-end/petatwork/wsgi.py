@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'petatwork.settings')
 
 application = get_wsgi_application()
+
+# Expiration périodique des réservations en attente (si BOOKING_EXPIRY_INTERVAL > 0)
+from core.expiry import start_expiry_scheduler  # noqa: E402
+
+start_expiry_scheduler()
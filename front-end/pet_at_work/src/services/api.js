@@ -50,6 +50,36 @@ api.interceptors.response.use(
   }
 )
 
+// Les listes de l'API sont paginées par curseur : on suit les liens `next`
+// pour reconstituer la liste complète attendue par les vues
+async function getAllPages(url) {
+  let response = await api.get(url)
+  if (!response.data || !Array.isArray(response.data.results)) {
+    return response.data
+  }
+  const results = [...response.data.results]
+  while (response.data.next) {
+    response = await api.get(response.data.next)
+    results.push(...response.data.results)
+  }
+  return results
+}
+
+// Paiements : une clé d'idempotence par tentative de paiement. Si la réponse est perdue
+// (erreur réseau), la requête est renvoyée avec la même clé : le serveur rejoue sa réponse
+// au lieu de créer un second paiement
+async function postPayment(url, data, idempotencyKey = crypto.randomUUID()) {
+  const config = { headers: { 'Idempotency-Key': idempotencyKey } }
+  try {
+    return await api.post(url, data, config)
+  } catch (error) {
+    if (error.response) {
+      throw error
+    }
+    return api.post(url, data, config)
+  }
+}
+
 export const apiService = {
   // Authentification
   async login(email, password) {
@@ -160,8 +190,7 @@ export const apiService = {
 
   // Utilisateurs
   async getAllUsers() {
-    const response = await api.get('/users/')
-    return response.data
+    return getAllPages('/users/')
   },
 
   async getUserById(id) {
@@ -170,19 +199,34 @@ export const apiService = {
   },
 
   async getUsersByRole(role) {
-    const response = await api.get(`/users/?role=${role}`)
-    return response.data
+    return getAllPages(`/users/?role=${role}`)
   },
   
-  async getAvailableCompanies() {
-    const response = await api.get('/users/available_companies/')
+  // Recherche paginée côté serveur (search, experience, location, service, page)
+  async searchUsers(role, filters = {}) {
+    const response = await api.get('/users/search/', { params: { role, ...filters } })
+    return response.data
+  },
+
+  // Plages libres / occupées d'un pet sitter (dates au format YYYY-MM-DD)
+  async getSitterAvailability(sitterId, from, to) {
+    const response = await api.get(`/users/${sitterId}/availability/`, { params: { from, to } })
     return response.data
   },
 
+  // Entreprises dans un rayon (km) autour d'une adresse, d'un code postal ou de l'utilisateur connecté
+  async getNearbyCompanies(radius, near) {
+    const response = await api.get('/users/nearby/', { params: { radius, near } })
+    return response.data
+  },
+
+  async getAvailableCompanies() {
+    return getAllPages('/users/available_companies/')
+  },
+
   // Animaux
   async getAllAnimals() {
-    const response = await api.get('/animals/')
-    return response.data
+    return getAllPages('/animals/')
   },
 
   async getAnimalById(id) {
@@ -191,8 +235,7 @@ export const apiService = {
   },
 
   async getAnimalsByOwner(ownerId) {
-    const response = await api.get(`/animals/?owner=${ownerId}`)
-    return response.data
+    return getAllPages(`/animals/?owner=${ownerId}`)
   },
   
   async createAnimal(animalData) {
@@ -200,10 +243,15 @@ export const apiService = {
     return response.data
   },
 
+  // Toutes les réservations de l'utilisateur (pet-sitters, entreprises, collaborations) en une liste
+  // filters : { status, type, from, to, order }
+  async getTimeline(filters = {}) {
+    return getAllPages(`/timeline/?${new URLSearchParams(filters)}`)
+  },
+
   // Réservations
   async getAllBookings() {
-    const response = await api.get('/bookings/')
-    return response.data
+    return getAllPages('/bookings/')
   },
 
   async getBookingById(id) {
@@ -215,17 +263,67 @@ export const apiService = {
     const response = await api.post('/bookings/', bookingData)
     return response.data
   },
+
+  // items : [{ animal, sitter ou company, start_date, end_date }], un résultat par élément
+  async createBookingsBulk(items) {
+    const response = await api.post('/bookings/bulk/', { items })
+    return response.data
+  },
   
   async updateBookingStatus(bookingId, status) {
     const response = await api.patch(`/bookings/${bookingId}/update_status/`, { status })
     return response.data
   },
 
+  // Même changement de statut pour plusieurs réservations, un résultat par réservation
+  async updateBookingsStatus(bookingIds, status) {
+    const response = await api.post('/bookings/bulk_status/', { ids: bookingIds, status })
+    return response.data
+  },
+
+  async updateCompanyBookingsStatus(bookingIds, status) {
+    const response = await api.post('/company-bookings/bulk_status/', { ids: bookingIds, status })
+    return response.data
+  },
+
   async deleteBooking(bookingId) {
     const response = await api.delete(`/bookings/${bookingId}/`)
     return response.data
   },
 
+  // Chiffre d'affaires du pet-sitter ou de l'entreprise connecté(e), au total et par mois
+  // (params : from, to, status)
+  async getBookingsRevenue(params = {}) {
+    const response = await api.get('/bookings/revenue/', { params })
+    return response.data
+  },
+
+  async getCompanyBookingsRevenue(params = {}) {
+    const response = await api.get('/company-bookings/revenue/', { params })
+    return response.data
+  },
+
+  // Réservations récurrentes auprès des entreprises (ex. garderie chaque semaine)
+  async createCompanyBookingSeries(seriesData) {
+    const response = await api.post('/company-booking-series/', seriesData)
+    return response.data
+  },
+
+  async getCompanyBookingSeriesOccurrences(seriesId, from, to) {
+    const response = await api.get(`/company-booking-series/${seriesId}/occurrences/`, { params: { from, to } })
+    return response.data
+  },
+
+  async confirmSeriesOccurrences(seriesId, dates) {
+    const response = await api.post(`/company-booking-series/${seriesId}/confirm/`, { dates })
+    return response.data
+  },
+
+  async cancelCompanyBookingSeries(seriesId) {
+    const response = await api.post(`/company-booking-series/${seriesId}/cancel/`)
+    return response.data
+  },
+
   // Réservations spécifiques pour les pet sitters avec les entreprises
   async createPetSitterCompanyBooking(bookingData) {
     const response = await api.post('/petsitter-company-bookings/', bookingData)
@@ -247,8 +345,7 @@ export const apiService = {
       url += '?' + params.join('&');
     }
     
-    const response = await api.get(url);
-    return response.data;
+    return getAllPages(url);
   },
 
   async updatePetSitterCompanyBookingStatus(bookingId, newStatus) {
@@ -256,9 +353,14 @@ export const apiService = {
     return response.data;
   },
 
+  async updatePetSitterCompanyBookingsStatus(bookingIds, newStatus) {
+    const response = await api.post('/petsitter-company-bookings/bulk_status/', { ids: bookingIds, status: newStatus });
+    return response.data;
+  },
+
   // Paiements
   async processPayment(paymentData) {
-    const response = await api.post('/payments/process_payment/', paymentData)
+    const response = await postPayment('/payments/process_payment/', paymentData)
     return response.data
   },
   
@@ -272,7 +374,7 @@ export const apiService = {
       console.log('Initialisation du paiement:', initResponse.data);
       
       // Étape 2: traitement du paiement avec les informations de la carte
-      const processResponse = await api.post(`/process-company-payment/${bookingId}/`, {
+      const processResponse = await postPayment(`/process-company-payment/${bookingId}/`, {
         payment_stage: 'process',
         payment_type: paymentType
       });
@@ -286,13 +388,12 @@ export const apiService = {
   },
   
   async processSharedPayment(bookingId, paymentData) {
-    const response = await api.post(`/petsitter-company-bookings/${bookingId}/shared_payment/`, paymentData)
+    const response = await postPayment(`/petsitter-company-bookings/${bookingId}/shared_payment/`, paymentData)
     return response.data
   },
   
   async getMyPayments() {
-    const response = await api.get('/payments/my_payments/')
-    return response.data
+    return getAllPages('/payments/my_payments/')
   },
   
   async getPaymentById(id) {
@@ -300,6 +401,17 @@ export const apiService = {
     return response.data
   },
 
+  async getPaymentByTransaction(transactionId) {
+    const response = await api.get('/payments/by_transaction/', { params: { transaction_id: transactionId } })
+    return response.data
+  },
+
+  // Tarification : prix de plusieurs séjours { provider, start_date, end_date } en un seul appel
+  async getQuotes(items, animalType = null) {
+    const response = await api.post('/quote/', animalType ? { items, animal_type: animalType } : { items })
+    return response.data.results
+  },
+
   // Test functions 
   async createTestPendingBooking(animalId, sitterId) {
     const today = new Date();